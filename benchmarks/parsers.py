@@ -0,0 +1,306 @@
+"""
+Parsers
+
+Time the code each plugin uses to turn a stats response into values, using
+the recorded responses in benchmarks/fixtures, and report for each parser:
+
+- the operations per second and microseconds per operation
+- the objects one operation allocates that are still alive when it
+  returns, counted by the garbage collector with collection paused, so
+  containers built and dropped along the way in cycles are counted too.
+  Strings, numbers and the dicts and tuples holding only those are not
+  tracked by the collector, so this counts the lists and nested
+  containers a parser builds
+- the size of the parsed result, which the agent holds until the values
+  are derived
+
+    python benchmarks/parsers.py [seconds] [name ...]
+
+Each parser is run repeatedly for about seconds (default 1) after a short
+warm up, and the best of three rounds is reported. Pass names, or the start
+of names, to run only some of the parsers. The fixtures are the size a busy
+production server returns, such as 500 HAProxy rows, 12 Elasticsearch nodes
+and a full InnoDB monitor report, so compare runs between commits to see
+which parsers are worth optimizing and that they stay fast. The
+add_datapoints cases map decoded stats to metrics and report them, as each
+poll does. The last two cases derive 500 counters one at a time and in one
+batch.
+
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_python_agent.plugins import apache_httpd  # noqa: E402
+from newrelic_python_agent.plugins import base  # noqa: E402
+from newrelic_python_agent.plugins import couchdb  # noqa: E402
+from newrelic_python_agent.plugins import elasticsearch  # noqa: E402
+from newrelic_python_agent.plugins import haproxy  # noqa: E402
+from newrelic_python_agent.plugins import memcached  # noqa: E402
+from newrelic_python_agent.plugins import mysql  # noqa: E402
+from newrelic_python_agent.plugins import nginx  # noqa: E402
+from newrelic_python_agent.plugins import redis  # noqa: E402
+from newrelic_python_agent.plugins import riak  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures')
+COUNTERS = 500
+ROUNDS = 3
+
+
+class Response(object):
+    """Stand in for the requests response the HTTP plugins decode"""
+
+    def __init__(self, content):
+        self.content = content
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def fixture(name):
+    """Return the content of a fixture file
+
+    :param str name: The file name
+    :rtype: str
+
+    """
+    with open(os.path.join(FIXTURES, name), 'rb') as handle:
+        return handle.read()
+
+
+def plugin(cls):
+    """Return an initialized instance of the plugin class
+
+    :rtype: newrelic_python_agent.plugins.base.Plugin
+
+    """
+    obj = cls({'name': 'bench'}, 60)
+    obj.initialize()
+    return obj
+
+
+def redis_parse():
+    info = fixture('redis_info.txt')
+    data = '$%i\r\n%s\r\n' % (len(info), info)
+    return lambda obj=plugin(redis.Redis): obj.parse_response(data)
+
+
+def memcached_parse():
+    data = fixture('memcached_stats.txt')
+    return lambda obj=plugin(memcached.Memcached): obj.parse_response(data)
+
+
+def mysql_innodb_status():
+    rows = [('InnoDB', '', fixture('mysql_innodb_status.txt'))]
+    return lambda obj=plugin(mysql.MySQL): obj.parse_innodb_status_stats(rows)
+
+
+def haproxy_decode():
+    response = Response(fixture('haproxy.csv'))
+    return lambda obj=plugin(haproxy.HAProxy): obj.decode_response(response)
+
+
+def apache_scoreboard():
+    data = fixture('apache_server_status.txt')
+    return lambda obj=plugin(apache_httpd.ApacheHTTPD): obj.get_scoreboard(data)
+
+
+def apache_datapoints():
+    data = fixture('apache_server_status.txt')
+    return lambda obj=plugin(apache_httpd.ApacheHTTPD): obj.add_datapoints(data)
+
+
+def nginx_pattern():
+    data = fixture('nginx_status.txt')
+    return lambda: nginx.PATTERN.match(data)
+
+
+def elasticsearch_decode():
+    response = Response(fixture('elasticsearch_nodes_stats.json'))
+    return lambda obj=plugin(elasticsearch.ElasticSearch): \
+        obj.decode_response(response)
+
+
+def elasticsearch_tree():
+    nodes = json.loads(fixture('elasticsearch_nodes_stats.json'))['nodes']
+    obj = plugin(elasticsearch.ElasticSearch)
+
+    def process_tree():
+        """Combine the node stats as ElasticSearch.add_datapoints does"""
+        totals = dict()
+        for node in nodes.values():
+            for key, value in node.items():
+                if isinstance(value, dict):
+                    obj.process_tree(totals.setdefault(key, dict()), value)
+        return totals
+    return process_tree
+
+
+def elasticsearch_datapoints():
+    stats = json.loads(fixture('elasticsearch_nodes_stats.json'))
+    obj = plugin(elasticsearch.ElasticSearch)
+    obj.add_cluster_stats = lambda: None
+    return report(obj, stats)
+
+
+def riak_datapoints():
+    return report(plugin(riak.Riak), json.loads(fixture('riak_stats.json')))
+
+
+def couchdb_datapoints():
+    return report(plugin(couchdb.CouchDB),
+                  json.loads(fixture('couchdb_stats.json')))
+
+
+def report(obj, stats):
+    """Return a function adding the data points of the decoded stats, as
+    each poll of the plugin does"""
+    def add_datapoints():
+        obj.initialize()
+        obj.add_datapoints(stats)
+        return obj.derive_values, obj.gauge_values
+    return add_datapoints
+
+
+def counters():
+    """Return a plugin with derive history for COUNTERS counters, and the
+    counters with new values"""
+    obj = plugin(base.Plugin)
+    metrics = [('Counter/%i' % offset, 'ops/Second', offset)
+               for offset in range(COUNTERS)]
+    obj.add_derive_values(metrics, rate=True)
+    return obj, [(name, units, value * 2) for name, units, value in metrics]
+
+
+def derive_each():
+    obj, metrics = counters()
+
+    def add_derive_value():
+        """Derive the counters one at a time"""
+        obj.initialize()
+        for name, units, value in metrics:
+            obj.add_derive_value(name, units, value, rate=True)
+        return obj.derive_values
+    return add_derive_value
+
+
+def derive_batch():
+    obj, metrics = counters()
+
+    def add_derive_values():
+        """Derive the counters in one batch"""
+        obj.initialize()
+        obj.add_derive_values(metrics, rate=True)
+        return obj.derive_values
+    return add_derive_values
+
+
+CASES = [('redis.parse_response', redis_parse),
+         ('memcached.parse_response', memcached_parse),
+         ('mysql.parse_innodb_status_stats', mysql_innodb_status),
+         ('haproxy.decode_response', haproxy_decode),
+         ('apache_httpd.get_scoreboard', apache_scoreboard),
+         ('apache_httpd.add_datapoints', apache_datapoints),
+         ('nginx.PATTERN', nginx_pattern),
+         ('elasticsearch.decode_response', elasticsearch_decode),
+         ('elasticsearch.process_tree', elasticsearch_tree),
+         ('elasticsearch.add_datapoints', elasticsearch_datapoints),
+         ('riak.add_datapoints', riak_datapoints),
+         ('couchdb.add_datapoints', couchdb_datapoints),
+         ('base.add_derive_value', derive_each),
+         ('base.add_derive_values', derive_batch)]
+
+
+def deep_size(value):
+    """Return the size in bytes of value and everything it contains
+
+    :rtype: int
+
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key) + deep_size(item)
+                    for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(item) for item in value)
+    return size
+
+
+def ops_per_second(func, seconds):
+    """Return the best rate func was called at over ROUNDS rounds
+
+    :rtype: float
+
+    """
+    loops = 1
+    while True:
+        start = time.time()
+        for _loop in range(loops):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= 0.05:
+            break
+        loops *= 2
+    loops = max(int(loops * seconds / ROUNDS / elapsed), 1)
+    best = 0
+    for _round in range(ROUNDS):
+        gc.collect()
+        start = time.time()
+        for _loop in range(loops):
+            func()
+        best = max(best, loops / (time.time() - start))
+    return best
+
+
+def allocated_objects(func):
+    """Return the number of objects tracked by the garbage collector that
+    one call of func leaves allocated, including its result
+
+    :rtype: int
+
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        result = func()
+        return len(gc.get_objects()) - before
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('seconds', type=float, nargs='?', default=1.0,
+                        help='time to run each parser for')
+    parser.add_argument('names', nargs='*',
+                        help='run only the parsers starting with these')
+    args = parser.parse_args()
+    seconds, names = args.seconds, args.names
+    print('%-34s %12s %10s %9s %10s' %
+          ('parser', 'ops/sec', 'us/op', 'objects', 'result KB'))
+    for name, case in CASES:
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        func = case()
+        result = func()
+        objects = allocated_objects(func)
+        rate = ops_per_second(func, seconds)
+        print('%-34s %12.1f %10.1f %9i %10.1f' %
+              (name, rate, 1000000 / rate, objects,
+               deep_size(result) / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
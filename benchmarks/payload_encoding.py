@@ -0,0 +1,120 @@
+"""
+Payload Encoding
+
+Compare the CPU time and peak memory of encoding a 10,000 metric payload the
+way send_components used to (json.dumps twice, gzip from a StringIO copy)
+with the single-pass streaming encoder at several compression levels.
+
+    python benchmarks/payload_encoding.py [iterations]
+
+Peak memory is measured as the growth in max RSS of a forked child process
+that encodes the payload once.
+
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_python_agent import encoder  # noqa: E402
+
+METRICS = 10000
+METRICS_PER_QUEUE = 10
+
+
+def build_payload():
+    """Return agent data and components shaped like a RabbitMQ poll with
+    METRICS per-queue metrics
+
+    :rtype: tuple(dict, list)
+
+    """
+    metrics = dict()
+    for offset in range(METRICS):
+        name = ('Component/Queue/production/orders.fulfilment.%05i/Messages/'
+                'Delivered No-Ack[messages]' % (offset // METRICS_PER_QUEUE))
+        metrics['%s/%i' % (name, offset % METRICS_PER_QUEUE)] = {
+            'min': None, 'max': offset * 3, 'total': offset * 7,
+            'count': 1, 'sum_of_squares': (offset * 7) ** 2}
+    components = [{'name': 'rabbitmq@localhost',
+                   'guid': 'com.meetme.newrelic_rabbitmq_agent',
+                   'duration': 60,
+                   'metrics': metrics}]
+    agent_data = {'host': 'benchmark', 'pid': os.getpid(), 'version': '1.3.0'}
+    return agent_data, components
+
+
+def legacy(agent_data, components):
+    """Encode the payload the way send_components used to
+
+    :rtype: tuple(bytes, int)
+
+    """
+    body = {'agent': agent_data, 'components': components}
+    s = StringIO()
+    g = gzip.GzipFile(fileobj=s, mode='w')
+    g.write(json.dumps(body, ensure_ascii=False))
+    g.close()
+    return s.getvalue(), len(json.dumps(body, ensure_ascii=False))
+
+
+def streaming(level):
+    """Return a function encoding the payload with the streaming encoder
+
+    :rtype: callable
+
+    """
+    def encode(agent_data, components):
+        return encoder.encode(agent_data, components, level)
+    return encode
+
+
+def peak_memory(function, agent_data, components, results):
+    """Encode once in this (child) process and report the max RSS growth"""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    function(agent_data, components)
+    results.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('iterations', type=int, nargs='?', default=20)
+    iterations = parser.parse_args().iterations
+    agent_data, components = build_payload()
+    variants = [('legacy dumps x2, level 9', legacy)]
+    for level in (1, 6, 9):
+        variants.append(('streaming, level %i' % level, streaming(level)))
+
+    print('%i metrics per payload, %i iterations' % (METRICS, iterations))
+    print('%-26s %10s %12s %12s %12s' % ('variant', 'ms/payload', 'json bytes',
+                                         'gzip bytes', 'peak KiB'))
+    for label, function in variants:
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(target=peak_memory,
+                                        args=(function, agent_data,
+                                              components, results))
+        child.start()
+        peak = results.get()
+        child.join()
+
+        start = time.time()
+        for _iteration in range(iterations):
+            body, size = function(agent_data, components)
+        duration = (time.time() - start) / iterations
+        print('%-26s %10.2f %12i %12i %12i' % (label, duration * 1000, size,
+                                               len(body), peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Process Pool
+
+Compare the time taken to poll a cycle of parse-heavy plugin instances on the
+worker thread pool alone with the time taken when the polls are run in a
+pool of worker processes, as the agent does for the plugins listed in
+``process_plugins`` when ``process_pool_size`` is set.
+
+    python benchmarks/process_pool.py [instances] [processes] [cycles]
+
+Each instance parses a uWSGI stats document of a few MB, the size a server
+with a few hundred workers returns, and records a derived metric for each
+worker. No sockets are used, so only the parsing and the derive work are
+measured. processes defaults to the number of CPUs, and the gain depends on
+it: on a single CPU the process pool only adds the cost of sending results
+between processes.
+
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from concurrent import futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_python_agent import processes  # noqa: E402
+from newrelic_python_agent import state  # noqa: E402
+from newrelic_python_agent.plugins import uwsgi  # noqa: E402
+
+THREADS = 32
+WORKERS = 400
+
+
+def stats_document(workers):
+    """Return uWSGI stats JSON for the number of workers
+
+    :rtype: str
+
+    """
+    return json.dumps({
+        'listen_queue': 0,
+        'listen_queue_errors': 0,
+        'locks': [{'user 0': 0}, {'signal': 0}],
+        'workers': [worker_stats(worker) for worker in range(workers)]})
+
+
+def worker_stats(worker):
+    """Return the stats of one uWSGI worker
+
+    :rtype: dict
+
+    """
+    return {
+        'id': worker,
+        'requests': worker * 1000,
+        'exceptions': worker,
+        'harakiri_count': 0,
+        'respawn_count': 1,
+        'signals': 0,
+        'apps': [{'id': app,
+                  'requests': worker * 100,
+                  'exceptions': 0,
+                  'environ': ['HTTP_COOKIE=%s' % ('x' * 512),
+                              'PATH_INFO=/%i' % worker] * 4}
+                 for app in range(4)],
+        'cores': [{'id': core, 'requests': worker,
+                   'vars': ['REMOTE_ADDR=10.0.0.%i' % core] * 16}
+                  for core in range(8)]}
+
+
+DOCUMENT = stats_document(WORKERS)
+
+
+class BenchmarkuWSGI(uwsgi.uWSGI):
+    """A uWSGI plugin that parses DOCUMENT instead of reading a socket"""
+
+    def poll(self):
+        self.initialize()
+        self.add_datapoints(self.parse_response(DOCUMENT))
+        self.finish()
+
+
+def poll_thread(last_values):
+    """Poll on a worker thread, as thread_metric_process does"""
+    last_values.advance()
+    obj = BenchmarkuWSGI({'name': 'bench'}, 60, last_values)
+    obj.poll()
+    return obj.derive_last_interval, obj.values()
+
+
+def poll_process(pool, last_values):
+    """Poll in the process pool, as process_metric_process does"""
+    last_values.advance()
+    future = pool.submit(processes.poll, BenchmarkuWSGI, {'name': 'bench'},
+                         60, last_values)
+    packed, last_values, _has_data, _timings = future.result()
+    return last_values, processes.unpack(packed)
+
+
+def run(instances, cycles, pool=None):
+    """Poll every instance once per cycle, returning the mean cycle time"""
+    history = [state.DeriveStore() for _offset in range(instances)]
+    durations = list()
+    with futures.ThreadPoolExecutor(max_workers=THREADS) as threads:
+        for _cycle in range(cycles):
+            start = time.time()
+            if pool is None:
+                results = list(threads.map(poll_thread, history))
+            else:
+                results = list(threads.map(
+                    lambda last_values: poll_process(pool, last_values),
+                    history))
+            durations.append(time.time() - start)
+            history = [last_values for last_values, _component in results]
+    return sum(durations) / len(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('instances', type=int, nargs='?', default=32)
+    parser.add_argument('processes', type=int, nargs='?',
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('cycles', type=int, nargs='?', default=3)
+    args = parser.parse_args()
+    instances, workers, cycles = args.instances, args.processes, args.cycles
+    print('%i instances, %.1f MB of stats each, %i CPUs, %i cycles' %
+          (instances, len(DOCUMENT) / 1048576.0,
+           multiprocessing.cpu_count(), cycles))
+    print('%-24s %12s' % ('mode', 'cycle secs'))
+    print('%-24s %12.2f' % ('%i threads' % THREADS, run(instances, cycles)))
+    pool = processes.start_pool(workers)
+    try:
+        print('%-24s %12.2f' % ('%i threads, %i processes' %
+                                (THREADS, workers),
+                                run(instances, cycles, pool)))
+    finally:
+        pool.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Scale
+
+Drive NewRelicPythonAgent.process() against the stand-in services in
+stubs.py with increasing numbers of plugin instances, and report per cycle:
+
+- the time from when the polls came due until every instance's poll had
+  returned
+- the CPU time used by the agent, including any worker processes
+- the resident memory of the agent
+- the payloads and compressed bytes uploaded to the platform endpoint
+
+    python benchmarks/scale.py [--engine threads|eventloop]
+        [--processes N] [--interval SECONDS] [--cycles N] [--persistent]
+        [sizes ...]
+
+The instances are spread evenly over the Redis, Memcached, uWSGI,
+Elasticsearch, RabbitMQ, HAProxy and Riak plugins. Each size runs in a new
+process so memory is measured from the same starting point. The first
+cycle includes starting the worker pool and, for the plugins that report
+derived metrics, has no previous values to compare with, so it is reported
+but left out of the means. With --persistent the Redis and Memcached
+instances keep their connections open between polls. Compare runs of the
+same sizes between commits, or between engines, to catch regressions.
+
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+from newrelic_python_agent import agent  # noqa: E402
+
+PLUGINS = ['redis', 'memcached', 'uwsgi', 'elasticsearch', 'rabbitmq',
+           'haproxy', 'riak']
+SIZES = [10, 100, 1000, 5000]
+
+
+def instance_config(plugin, offset, ports, persistent=False):
+    """Return the YAML lines for an instance of plugin polling the stubs
+
+    :rtype: list
+
+    """
+    lines = ['    - name: bench-%i' % offset,
+             '      host: 127.0.0.1']
+    if plugin == 'rabbitmq':
+        lines.append('      port: %i' % ports['http'])
+    elif plugin in ('elasticsearch', 'haproxy', 'riak'):
+        lines.append('      port: %i' % ports['http'])
+        if plugin == 'haproxy':
+            lines.append('      path: /haproxy;csv')
+    else:
+        lines.append('      port: %i' % ports[plugin])
+    if persistent and plugin in ('redis', 'memcached'):
+        lines.append('      persistent: true')
+    return lines
+
+
+def write_config(path, size, services, args):
+    """Write the agent config for size instances"""
+    lines = ['Application:',
+             '  license_key: benchmark',
+             '  endpoint: %s' % services.platform_url,
+             '  wake_interval: %i' % args.interval,
+             '  engine: %s' % args.engine,
+             '  process_pool_size: %i' % args.processes,
+             '  upload_queue_size: 1000']
+    for plugin in PLUGINS:
+        offsets = range(PLUGINS.index(plugin), size, len(PLUGINS))
+        if not offsets:
+            continue
+        lines.append('  %s:' % plugin)
+        for offset in offsets:
+            lines.extend(instance_config(plugin, offset, services.ports,
+                                         args.persistent))
+    with open(path, 'w') as handle:
+        handle.write('\n'.join(lines) + '\n')
+
+
+def cpu_seconds():
+    """Return the CPU time used by this process and its worker processes"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    seconds = usage.ru_utime + usage.ru_stime
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    for child in multiprocessing.active_children():
+        try:
+            with open('/proc/%i/stat' % child.pid) as handle:
+                fields = handle.read().rsplit(')', 1)[1].split()
+            seconds += (int(fields[11]) + int(fields[12])) / ticks
+        except (IOError, OSError):
+            pass
+    return seconds
+
+
+def rss_bytes():
+    """Return the resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def polled(controller, since):
+    """Return the number of instances whose latest poll started at or after
+    since and has returned
+
+    :rtype: int
+
+    """
+    return sum(1 for job in list(controller.scheduler.jobs.values())
+               if job.future is not None and job.future.done() and
+               job.deadline - job.timeout >= since)
+
+
+def run_size(size, services, args, results):
+    """Run the agent for size instances, putting a row per cycle on
+    results"""
+    logging.basicConfig(level=logging.ERROR)
+    handle, path = tempfile.mkstemp(suffix='.yml')
+    os.close(handle)
+    write_config(path, size, services, args)
+    try:
+        controller = agent.NewRelicPythonAgent(
+            argparse.Namespace(config=path, foreground=True), 'linux')
+        controller.setup()
+        due = time.time()
+        controller.process()
+        for cycle in range(args.cycles):
+            cpu = cpu_seconds()
+            payloads, sent = services.payloads.value, services.bytes.value
+            deadline = due + args.interval
+            while polled(controller, due) < size and time.time() < deadline:
+                time.sleep(0.01)
+            latency = time.time() - due
+            returned = polled(controller, due)
+            controller.process()
+            controller.uploader.queue.join()
+            results.put((cycle, returned, latency, cpu_seconds() - cpu,
+                         rss_bytes(), services.payloads.value - payloads,
+                         services.bytes.value - sent))
+            due += args.interval
+            time.sleep(max(due - time.time(), 0))
+        controller.cleanup()
+    finally:
+        os.unlink(path)
+        results.put(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--engine', default='threads',
+                        choices=agent.NewRelicPythonAgent.ENGINES)
+    parser.add_argument('--processes', type=int, default=0,
+                        help='process_pool_size')
+    parser.add_argument('--interval', type=int, default=30,
+                        help='poll and wake interval in seconds')
+    parser.add_argument('--cycles', type=int, default=4)
+    parser.add_argument('--persistent', action='store_true',
+                        help='keep Redis and Memcached connections open')
+    parser.add_argument('sizes', type=int, nargs='*', default=SIZES)
+    args = parser.parse_args()
+
+    services = stubs.StubServices()
+    services.start()
+    print('engine %s, %i worker processes, %i second interval' %
+          (args.engine, args.processes, args.interval))
+    print('%9s %6s %9s %11s %9s %8s %8s %10s' %
+          ('instances', 'cycle', 'returned', 'latency s', 'cpu s', 'rss MB',
+           'payloads', 'upload KB'))
+    try:
+        for size in args.sizes:
+            results = multiprocessing.Queue()
+            child = multiprocessing.Process(target=run_size,
+                                            args=(size, services, args,
+                                                  results))
+            child.start()
+            rows = list()
+            for row in iter(results.get, None):
+                rows.append(row)
+                print('%9i %6i %9i %11.2f %9.2f %8.1f %8i %10.1f' %
+                      ((size,) + row[:4] + (row[4] / 1048576.0, row[5],
+                                            row[6] / 1024.0)))
+            child.join()
+            if len(rows) > 1:
+                rows = rows[1:]
+                print('%9i %6s %9.0f %11.2f %9.2f %8.1f %8.1f %10.1f' %
+                      (size, 'mean',
+                       sum(row[1] for row in rows) / float(len(rows)),
+                       sum(row[2] for row in rows) / len(rows),
+                       sum(row[3] for row in rows) / len(rows),
+                       max(row[4] for row in rows) / 1048576.0,
+                       sum(row[5] for row in rows) / float(len(rows)),
+                       sum(row[6] for row in rows) / 1024.0 / len(rows)))
+    finally:
+        services.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Soak
+
+Run the agent through thousands of wake intervals in a few minutes, with
+plugin instances, queues and databases coming and going, and check that the
+state the agent keeps between intervals stops growing:
+
+- the derive history in ``derive_last_interval``
+- the min/max history in ``min_max_values``
+- the config plugin results in ``config_last_result``
+- the instance names in ``thread_names`` and the scheduler's jobs
+
+    python benchmarks/soak.py [--cycles N] [--instances N] [--metrics N]
+        [--churn PERCENT] [--reload-every N] [--report N] [--tolerance F]
+
+time.time is replaced with a clock that the harness moves on by the wake
+interval every cycle, and polls run inline when the scheduler dispatches
+them, so no cycle waits for real time to pass. The instances are of a
+plugin defined here that reports a set of stable metrics, a set of
+database metrics that are renamed every ten cycles and a percentage of
+queue metrics renamed every cycle. Every reload-every cycles that
+percentage of the instances, and of the config plugin instances, is
+replaced with new ones and the config is reloaded. Payloads are uploaded
+to the platform endpoint of the stand-in services in stubs.py.
+
+Every report cycles the RSS, the sizes of the agent state and the top
+allocators are printed. The top allocators are the source lines that
+allocated the most since the last report where tracemalloc is available,
+and otherwise the object types whose count grew the most. Once the first
+half of the cycles has run, the stale series should have been evicted, so
+the run fails with exit status 1 if the RSS or any of the state sizes grew
+by more than tolerance (default 0.1, 10%) over the second half.
+
+"""
+import argparse
+import collections
+import gc
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from concurrent import futures
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+from newrelic_python_agent import agent  # noqa: E402
+from newrelic_python_agent import plugins  # noqa: E402
+from newrelic_python_agent import scheduler  # noqa: E402
+from newrelic_python_agent.plugins import base  # noqa: E402
+
+DATABASES = 4
+INTERVAL = 60
+TOP = 3
+
+
+class Clock(object):
+    """A clock that only moves when told to"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class InlineExecutor(object):
+    """Run each submitted call straight away, returning a finished future"""
+
+    @staticmethod
+    def submit(func, *args, **kwargs):
+        future = futures.Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+class SoakPlugin(base.Plugin):
+    """Report stable metrics, database metrics renamed every ten cycles and
+    queue metrics renamed every cycle"""
+    GUID = 'com.meetme.newrelic_python_agent.soak'
+
+    def poll(self):
+        self.initialize()
+        cycle = int(time.time() // self.poll_interval)
+        metrics = int(self.config['metrics'])
+        churned = metrics * int(self.config['churn']) // 100
+        for offset in range(metrics - churned):
+            self.add_derive_value('Stats/stat-%i' % offset, 'ops',
+                                  cycle * offset)
+        for offset in range(DATABASES):
+            database = (cycle // 10) * DATABASES + offset
+            self.add_gauge_value('Databases/db_%i/Size' % database, 'bytes',
+                                 database)
+        for offset in range(churned):
+            self.add_derive_value('Queues/amq.gen-%i-%i/Published' %
+                                  (cycle, offset), 'messages', cycle)
+        self.finish()
+
+
+class SoakConfig(base.ConfigPlugin):
+    """Return the same instance block on every run"""
+
+    def build_config(self):
+        self.add_config_block('soak:config', [{'name': 'dynamic',
+                                               'metrics': 10, 'churn': 0}])
+
+
+def write_config(path, services):
+    """Write the agent config, the instances are added by replace"""
+    with open(path, 'w') as handle:
+        handle.write('\n'.join(['Application:',
+                                '  license_key: soak',
+                                '  endpoint: %s' % services.platform_url,
+                                '  wake_interval: %i' % INTERVAL]) + '\n')
+
+
+def replace(names, count, serial):
+    """Replace the count oldest names with new ones
+
+    :param collections.deque names: The names
+    :param int count: How many to replace
+    :param itertools.count serial: The source of new name numbers
+
+    """
+    for _offset in range(count):
+        names.popleft()
+        names.append('soak-%i' % next(serial))
+
+
+def sizes(controller):
+    """Return the sizes of the state kept by the agent
+
+    :rtype: collections.OrderedDict
+
+    """
+    return collections.OrderedDict([
+        ('instances', len(controller.derive_last_interval)),
+        ('series', sum(len(store) for store in
+                       controller.derive_last_interval.values())),
+        ('min/max', sum(len(store) for store in
+                        controller.min_max_values.values())),
+        ('config', len(controller.config_last_result)),
+        ('names', len(controller.thread_names)),
+        ('jobs', len(controller.scheduler.jobs))])
+
+
+def rss_bytes():
+    """Return the resident set size of this process"""
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Allocators(object):
+    """Report where memory was allocated since the last report, using
+    tracemalloc when available and object counts by type otherwise"""
+
+    def __init__(self):
+        self.last = None
+        if tracemalloc:
+            tracemalloc.start()
+        self.top()
+
+    def top(self):
+        """Return the TOP lines describing the largest growth
+
+        :rtype: list
+
+        """
+        if tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            lines = list()
+            if self.last is not None:
+                lines = ['%+.1f KB %s' % (stat.size_diff / 1024.0,
+                                          stat.traceback)
+                         for stat in snapshot.compare_to(self.last,
+                                                         'lineno')[:TOP]]
+            self.last = snapshot
+            return lines
+        gc.collect()
+        counts = collections.Counter(type(obj).__name__
+                                     for obj in gc.get_objects())
+        lines = list()
+        if self.last is not None:
+            growth = sorted(((count - self.last.get(name, 0), name)
+                             for name, count in counts.items()),
+                            reverse=True)[:TOP]
+            lines = ['%+i %s objects' % row for row in growth]
+        self.last = counts
+        return lines
+
+    @staticmethod
+    def traced():
+        """Return the bytes currently traced, or None
+
+        :rtype: int
+
+        """
+        return tracemalloc.get_traced_memory()[0] if tracemalloc else None
+
+
+def grown(first, last, tolerance):
+    """Return the names of the values that grew by more than tolerance
+
+    :rtype: list
+
+    """
+    return [name for name, value in last.items()
+            if value > first[name] * (1 + tolerance) + 1]
+
+
+def run(args, services):
+    """Run the soak, returning the samples taken at each report"""
+    wall = time.time
+    clock = Clock(wall())
+    time.time = clock.time
+    handle, path = tempfile.mkstemp(suffix='.yml')
+    os.close(handle)
+    write_config(path, services)
+    try:
+        controller = agent.NewRelicPythonAgent(
+            argparse.Namespace(config=path, foreground=True), 'linux')
+        controller.setup()
+    finally:
+        os.unlink(path)
+    controller.scheduler.stop()
+    controller.scheduler = scheduler.Scheduler(InlineExecutor(), clock.time)
+
+    serial = itertools.count()
+    instances = collections.deque('soak-%i' % next(serial)
+                                  for _offset in range(args.instances))
+    configs = collections.deque('soak-%i' % next(serial)
+                                for _offset in range(max(args.instances //
+                                                         20, 1)))
+    allocators = Allocators()
+    samples = list()
+    start = wall()
+    try:
+        for cycle in range(1, args.cycles + 1):
+            if cycle % args.reload_every == 1:
+                if cycle > 1:
+                    replace(instances, args.instances * args.churn // 100,
+                            serial)
+                    replace(configs, len(configs) * args.churn // 100, serial)
+                controller.config.application['soak'] = [
+                    {'name': name, 'metrics': args.metrics,
+                     'churn': args.churn} for name in instances]
+                controller.config.application['soak_config'] = [
+                    {'name': name} for name in configs]
+                controller.configuration_reloaded()
+            controller.process()
+            controller.uploader.queue.join()
+            controller.scheduler.run_pending()
+            clock.advance(INTERVAL)
+            if cycle % args.report == 0:
+                gc.collect()
+                sample = sizes(controller)
+                sample['rss'] = rss_bytes()
+                traced = allocators.traced()
+                if traced is not None:
+                    sample['traced'] = traced
+                samples.append((cycle, sample))
+                print('%7i %8.1f %8.1f %9s %9i %9i %9i %7i %7i %7i' %
+                      (cycle, wall() - start, sample['rss'] / 1048576.0,
+                       '-' if traced is None else '%.1f' % (traced / 1024.0),
+                       sample['instances'], sample['series'],
+                       sample['min/max'], sample['config'], sample['names'],
+                       sample['jobs']))
+                for line in allocators.top():
+                    print('        %s' % line)
+                sys.stdout.flush()
+    finally:
+        controller.cleanup()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--instances', type=int, default=100)
+    parser.add_argument('--metrics', type=int, default=20,
+                        help='metrics per instance')
+    parser.add_argument('--churn', type=int, default=10,
+                        help='percent of instances and queues replaced')
+    parser.add_argument('--reload-every', type=int, default=10,
+                        help='cycles between config reloads')
+    parser.add_argument('--report', type=int, default=100,
+                        help='cycles between reports')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    plugins.available['soak'] = '__main__.SoakPlugin'
+    plugins.available['soak_config'] = '__main__.SoakConfig'
+    services = stubs.StubServices()
+    services.start()
+    print('%i cycles, %i instances, %i metrics each, %i%% churn, reload '
+          'every %i cycles' % (args.cycles, args.instances, args.metrics,
+                               args.churn, args.reload_every))
+    print('%7s %8s %8s %9s %9s %9s %9s %7s %7s %7s' %
+          ('cycle', 'seconds', 'rss MB', 'traced KB', 'instances', 'series',
+           'min/max', 'config', 'names', 'jobs'))
+    try:
+        samples = run(args, services)
+    finally:
+        services.stop()
+
+    steady = [sample for cycle, sample in samples
+              if cycle >= args.cycles // 2]
+    if len(steady) < 2:
+        print('Not enough reports to compare, run more cycles')
+        sys.exit(2)
+    growth = grown(steady[0], steady[-1], args.tolerance)
+    if growth:
+        print('FAIL: %s grew by more than %i%% over the second half' %
+              (', '.join(growth), args.tolerance * 100))
+        sys.exit(1)
+    print('OK: memory and state stayed within %i%% over the second half' %
+          (args.tolerance * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Startup
+
+Measure how long a new agent takes to import, set up and return its first
+poll, the memory and modules it has loaded by then, and the time each wake
+interval spends resolving the configured plugins, with the plugin classes
+cached and with the cache cleared as a config reload does.
+
+    python benchmarks/startup.py [plugins ...]
+
+Each argument is a comma separated list of plugins to configure one
+instance of, polling the stand-in services in stubs.py, and defaults to
+redis alone and to every plugin stubs.py serves. Plugins whose drivers are
+not installed, such as mysql, can be listed too: their modules import the
+drivers on the first poll, so their polls fail but resolving them does not.
+Every list runs in a new interpreter so nothing is imported beforehand.
+
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGINS = ['redis', 'redis,memcached,uwsgi,elasticsearch,rabbitmq,haproxy,riak']
+RESOLVES = 100
+
+
+def write_config(path, plugins, ports, platform_url):
+    """Write the agent config with one instance of each plugin"""
+    lines = ['Application:',
+             '  license_key: benchmark',
+             '  endpoint: %s' % platform_url]
+    for plugin in plugins:
+        port = ports.get(plugin, ports['http'])
+        lines.extend(['  %s:' % plugin,
+                      '    - name: startup',
+                      '      host: 127.0.0.1',
+                      '      port: %i' % port])
+        if plugin == 'haproxy':
+            lines.append('      path: /haproxy;csv')
+    with open(path, 'w') as handle:
+        handle.write('\n'.join(lines) + '\n')
+
+
+def resolve_seconds(controller, reload_config):
+    """Return the mean time start_plugins takes, clearing the plugin class
+    cache before each call if reload_config is set
+
+    :rtype: float
+
+    """
+    start = time.time()
+    for _offset in range(RESOLVES):
+        if reload_config:
+            controller.configuration_reloaded()
+        controller.start_plugins()
+    return (time.time() - start) / RESOLVES
+
+
+def child(plugins, ports, platform_url):
+    """Start an agent in this new interpreter and print what it measured
+    as JSON"""
+    import logging
+
+    sys.path.insert(0, ROOT)
+    logging.basicConfig(level=logging.CRITICAL)
+    from newrelic_python_agent import agent
+    imported = time.time()
+
+    handle, path = tempfile.mkstemp(suffix='.yml')
+    os.close(handle)
+    write_config(path, plugins, ports, platform_url)
+    try:
+        controller = agent.NewRelicPythonAgent(
+            argparse.Namespace(config=path, foreground=True), 'linux')
+        controller.setup()
+    finally:
+        os.unlink(path)
+    ready = time.time()
+    controller.process()
+    while not controller.scheduler.jobs or any(
+            job.future is None or not job.future.done()
+            for job in list(controller.scheduler.jobs.values())):
+        time.sleep(0.001)
+    polled = time.time()
+    with open('/proc/self/statm') as handle:
+        rss = int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    modules = len(sys.modules)
+    cached = resolve_seconds(controller, False)
+    uncached = resolve_seconds(controller, True)
+    controller.cleanup()
+    print(json.dumps({'imported': imported, 'ready': ready,
+                      'polled': polled, 'rss': rss, 'modules': modules,
+                      'cached': cached, 'uncached': uncached}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument('plugins', nargs='*', default=PLUGINS,
+                        help='comma separated plugins to configure')
+    args = parser.parse_args()
+    if args.child:
+        plugins, ports, platform_url = args.child
+        child(plugins.split(','), json.loads(ports), platform_url)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import stubs
+
+    services = stubs.StubServices()
+    services.start()
+    print('%-24s %9s %9s %11s %8s %8s %11s %11s' %
+          ('plugins', 'import s', 'setup s', 'first poll', 'rss MB',
+           'modules', 'cached ms', 'reload ms'))
+    try:
+        for plugins in args.plugins:
+            launched = time.time()
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), '--child',
+                 plugins, json.dumps(services.ports), services.platform_url])
+            result = json.loads(output.decode('utf-8').splitlines()[-1])
+            label = plugins if len(plugins) <= 24 else \
+                '%i plugins' % len(plugins.split(','))
+            print('%-24s %9.3f %9.3f %11.3f %8.1f %8i %11.3f %11.3f' %
+                  (label, result['imported'] - launched,
+                   result['ready'] - result['imported'],
+                   result['polled'] - launched, result['rss'] / 1048576.0,
+                   result['modules'], result['cached'] * 1000,
+                   result['uncached'] * 1000))
+    finally:
+        services.stop()
+
+
+if __name__ == '__main__':
+    main()
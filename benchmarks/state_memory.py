@@ -0,0 +1,130 @@
+"""
+State Memory
+
+Compare the memory held for derive and min/max history by the dict-of-lists
+layout the agent used to keep with the compact state stores, while series
+come and go the way RabbitMQ queues or Redis databases do.
+
+    python benchmarks/state_memory.py [instances] [metrics] [cycles]
+
+Every cycle each instance reports its metrics, a tenth of which are for
+series that did not exist in the previous cycle. Memory is measured as the
+growth in max RSS of a forked child process that runs every cycle.
+
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_python_agent import state  # noqa: E402
+
+CHURN = 10
+GUID = 'com.meetme.newrelic_rabbitmq_agent'
+
+
+def metric_names(metrics, cycle):
+    """Return the metric names an instance reports in the cycle, with
+    metrics / CHURN of them renamed every cycle
+
+    :rtype: list
+
+    """
+    churned = metrics // CHURN
+    names = ['Component/Queue/production/orders.%05i/Messages/Published'
+             '[messages]' % offset for offset in range(metrics - churned)]
+    names.extend('Component/Queue/temporary/amq.gen-%05i-%05i/Messages/'
+                 'Published[messages]' % (cycle, offset)
+                 for offset in range(churned))
+    return names
+
+
+def legacy(instances, metrics, cycles):
+    """Keep history the way the agent used to, never trimming it"""
+    derive_last_interval = dict()
+    min_max_values = dict()
+    for cycle in range(cycles):
+        names = metric_names(metrics, cycle)
+        now = time.time()
+        for instance in range(instances):
+            name = 'rabbitmq-%i' % instance
+            last = derive_last_interval.setdefault(name, dict())
+            min_max = min_max_values.setdefault(GUID, dict()).setdefault(
+                name, dict())
+            for offset, metric in enumerate(names):
+                last['%s' % metric] = [offset * cycle, now]
+                min_max['%s' % metric] = None, offset * cycle
+    return derive_last_interval, min_max_values
+
+
+def compact(instances, metrics, cycles):
+    """Keep history in the state stores, evicting stale series"""
+    derive_last_interval = dict()
+    min_max_values = dict()
+    for cycle in range(cycles):
+        names = metric_names(metrics, cycle)
+        now = time.time()
+        for instance in range(instances):
+            name = 'rabbitmq-%i' % instance
+            last = derive_last_interval.get(name)
+            if last is None:
+                last = derive_last_interval[name] = state.DeriveStore()
+            min_max = min_max_values.get((GUID, name))
+            if min_max is None:
+                min_max = min_max_values[(GUID, name)] = state.MinMaxStore()
+            last.advance()
+            min_max.advance()
+            for offset, metric in enumerate(names):
+                last.record('%s' % metric, offset * cycle, now)
+                min_max.set('%s' % metric, None, offset * cycle)
+            last.evict()
+            min_max.evict()
+    return derive_last_interval, min_max_values
+
+
+def series(derive_last_interval):
+    """Return the number of derive series held"""
+    return sum(len(values) for values in derive_last_interval.values())
+
+
+def measure(function, args, results):
+    """Run in this (child) process and report the max RSS growth and the
+    number of series held at the end"""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    derive_last_interval, _min_max_values = function(*args)
+    duration = time.time() - start
+    results.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before,
+                 series(derive_last_interval), duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('instances', type=int, nargs='?', default=100)
+    parser.add_argument('metrics', type=int, nargs='?', default=500,
+                        help='metrics reported by each instance')
+    parser.add_argument('cycles', type=int, nargs='?', default=30)
+    args = parser.parse_args()
+    instances, metrics, cycles = args.instances, args.metrics, args.cycles
+    print('%i instances, %i metrics each, %i cycles, %i%% churn per cycle' %
+          (instances, metrics, cycles, 100 // CHURN))
+    print('%-12s %12s %12s %12s' %
+          ('layout', 'series', 'peak KiB', 'seconds'))
+    for label, function in (('dict/list', legacy), ('compact', compact)):
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(target=measure,
+                                        args=(function,
+                                              (instances, metrics, cycles),
+                                              results))
+        child.start()
+        peak, count, duration = results.get()
+        child.join()
+        print('%-12s %12i %12i %12.2f' % (label, count, peak, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Stand-in Services
+
+Local servers that answer the way the services the agent polls do, for
+benchmarks that drive the agent end to end without the real services:
+
+- a Redis server answering AUTH and INFO
+- a Memcached server answering stats
+- a uWSGI stats socket
+- an HTTP server with the Elasticsearch, RabbitMQ, HAProxy and Riak stats
+  endpoints
+- a NewRelic platform endpoint that counts the payloads it receives
+
+The servers run in a child process so serving requests does not take CPU
+time or the GIL from the agent being measured. They bind to free ports on
+127.0.0.1, reported in ``StubServices.ports`` once started.
+
+"""
+import json
+import multiprocessing
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+MEMCACHED_KEYS = ['curr_connections', 'curr_items', 'connection_structures',
+                  'cmd_get', 'cmd_set', 'cmd_flush', 'get_hits', 'get_misses',
+                  'delete_hits', 'delete_misses', 'incr_hits', 'incr_misses',
+                  'decr_hits', 'decr_misses', 'cas_hits', 'cas_misses',
+                  'cas_badval', 'auth_cmds', 'auth_errors', 'bytes_read',
+                  'bytes_written', 'bytes', 'total_items', 'evictions',
+                  'rusage_user', 'conn_yields', 'rusage_system']
+
+HAPROXY_COLUMNS = ['pxname', 'svname', 'qcur', 'qmax', 'scur', 'smax', 'stot',
+                   'bin', 'bout', 'dreq', 'dresp', 'ereq', 'econ', 'eresp',
+                   'wretr', 'wredis', 'downtime']
+
+
+def memcached_stats():
+    """Return the reply to the memcached stats command"""
+    return ''.join('STAT %s %i\r\n' % (key, offset * 1000)
+                   for offset, key in enumerate(MEMCACHED_KEYS)) + 'END\r\n'
+
+
+def redis_info():
+    """Return the reply to the Redis INFO command"""
+    info = '\r\n'.join(
+        ['# Server', 'redis_version:5.0.7', 'connected_clients:12',
+         'connected_slaves:1', 'used_memory:104857600',
+         'total_connections_received:12345',
+         'total_commands_processed:9876543', 'keyspace_hits:654321',
+         'keyspace_misses:1234', 'changes_since_last_save:10',
+         'last_save_time:1500000000', 'blocked_clients:0',
+         'expired_keys:100', 'evicted_keys:0', 'pubsub_channels:2'] +
+        ['db%i:keys=%i,expires=%i,avg_ttl=0' % (db, db * 1000, db * 10)
+         for db in range(16)]) + '\r\n'
+    return '$%i\r\n%s\r\n' % (len(info), info)
+
+
+def uwsgi_stats(workers=16):
+    """Return the uWSGI stats JSON for the number of workers"""
+    return json.dumps({
+        'listen_queue': 0,
+        'listen_queue_errors': 0,
+        'locks': [{'user 0': 0}, {'signal': 0}],
+        'workers': [{'id': worker,
+                     'requests': worker * 1000,
+                     'exceptions': worker,
+                     'harakiri_count': 0,
+                     'respawn_count': 1,
+                     'signals': 0,
+                     'apps': [{'id': app, 'requests': worker * 100,
+                               'exceptions': 0} for app in range(2)]}
+                    for worker in range(workers)]})
+
+
+def elasticsearch_nodes(nodes=3):
+    """Return the Elasticsearch _nodes/stats JSON for the number of nodes"""
+    stats = {
+        'indices': {'docs': {'count': 1000000, 'deleted': 100},
+                    'store': {'size_in_bytes': 1 << 30,
+                              'throttle_time_in_millis': 0},
+                    'indexing': {'index_total': 50000,
+                                 'index_time_in_millis': 12000,
+                                 'delete_total': 10,
+                                 'delete_time_in_millis': 5},
+                    'get': {'total': 1000, 'time_in_millis': 200,
+                            'exists_total': 900, 'exists_time_in_millis': 150,
+                            'missing_total': 100,
+                            'missing_time_in_millis': 50},
+                    'search': {'open_contexts': 1, 'query_total': 20000,
+                               'query_time_in_millis': 30000,
+                               'fetch_total': 20000,
+                               'fetch_time_in_millis': 4000},
+                    'merges': {'total': 100, 'total_time_in_millis': 9000},
+                    'flush': {'total': 50, 'total_time_in_millis': 300}},
+        'thread_pool': dict((pool, {'threads': 4, 'queue': 0, 'active': 1,
+                                    'rejected': 0, 'largest': 4,
+                                    'completed': 12345})
+                            for pool in ('bulk', 'get', 'index', 'search',
+                                         'refresh', 'flush', 'merge')),
+        'transport': {'rx_size_in_bytes': 123456, 'tx_size_in_bytes': 654321},
+        'network': {'tcp': {'active_opens': 100, 'passive_opens': 200,
+                            'estab_resets': 1, 'attempt_fails': 0,
+                            'in_segs': 10000, 'in_errs': 0,
+                            'out_segs': 9000, 'retrans_segs': 5}},
+        'http': {'current_open': 4, 'total_opened': 500}}
+    return json.dumps({'cluster_name': 'benchmark',
+                       'nodes': dict(('node-%i' % node, stats)
+                                     for node in range(nodes))})
+
+
+def elasticsearch_health():
+    """Return the Elasticsearch _cluster/health JSON"""
+    return json.dumps({'status': 'green', 'number_of_nodes': 3,
+                       'number_of_data_nodes': 3, 'active_shards': 30,
+                       'initializing_shards': 0, 'active_primary_shards': 15,
+                       'relocating_shards': 0, 'unassigned_shards': 0})
+
+
+def rabbitmq(kind, queues=50):
+    """Return the RabbitMQ management API JSON for channels, nodes or
+    queues"""
+    message_stats = {'ack': 100, 'deliver': 100, 'deliver_get': 110,
+                     'deliver_no_ack': 0, 'get': 10, 'get_no_ack': 0,
+                     'publish': 120, 'redeliver': 1}
+    if kind == 'nodes':
+        return json.dumps([{'name': 'rabbit@node-%i' % node, 'proc_used': 400,
+                            'fd_used': 60, 'mem_used': 1 << 27,
+                            'sockets_used': 20} for node in range(3)])
+    if kind == 'channels':
+        return json.dumps([{'node': 'rabbit@node-%i' % (channel % 3),
+                            'client_flow_blocked': False,
+                            'message_stats': message_stats}
+                           for channel in range(30)])
+    return json.dumps([{'name': 'queue.%03i' % queue, 'vhost': '/',
+                        'node': 'rabbit@node-%i' % (queue % 3),
+                        'consumers': 2, 'active_consumers': 1,
+                        'messages_ready': queue,
+                        'messages_unacknowledged': 1,
+                        'message_stats': message_stats}
+                       for queue in range(queues)])
+
+
+def haproxy_csv(rows=20):
+    """Return the HAProxy stats CSV with the number of rows"""
+    lines = ['# %s' % ','.join(HAPROXY_COLUMNS)]
+    for row in range(rows):
+        lines.append(','.join(['backend-%i' % (row // 4), 'server-%i' % row] +
+                              ['%i' % (row * column) for column in
+                               range(len(HAPROXY_COLUMNS) - 2)]))
+    return '\n'.join(lines) + '\n'
+
+
+def riak_stats():
+    """Return the Riak /stats JSON"""
+    return json.dumps(dict(
+        ('%s_%s' % (stat, suffix), 1000)
+        for stat in ('node_get_fsm_objsize', 'node_get_fsm_siblings',
+                     'node_get_fsm_time', 'node_put_fsm_time',
+                     'converge_delay', 'rebalance_delay')
+        for suffix in ('mean', 'median', '90', '95', '99', '100', 'min',
+                       'max', 'total')))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    """A threaded TCP server on a free port of 127.0.0.1"""
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 4096
+
+    def __init__(self, handler):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 handler)
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """Answer AUTH with +OK and INFO with the stats until the client closes
+    the connection"""
+    reply = redis_info()
+
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            command = line.strip().lower()
+            if command == b'auth':
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'info':
+                self.wfile.write(self.reply.encode('ascii'))
+
+
+class MemcachedHandler(socketserver.StreamRequestHandler):
+    """Answer the stats command until the client closes the connection"""
+    reply = memcached_stats()
+
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            if line.strip() == b'stats':
+                self.wfile.write(self.reply.encode('ascii'))
+
+
+class UWSGIHandler(socketserver.BaseRequestHandler):
+    """Send the stats JSON and close the connection"""
+    reply = uwsgi_stats()
+
+    def handle(self):
+        self.request.sendall(self.reply.encode('ascii'))
+
+
+class HTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve the stats endpoints of the HTTP based services"""
+    replies = {'/_nodes/stats': elasticsearch_nodes(),
+               '/_cluster/health': elasticsearch_health(),
+               '/api/channels': rabbitmq('channels'),
+               '/api/nodes': rabbitmq('nodes'),
+               '/api/queues': rabbitmq('queues'),
+               '/haproxy': haproxy_csv(),
+               '/stats': riak_stats()}
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].split(';', 1)[0]
+        body = self.replies.get(path)
+        if body is None:
+            self.send_error(404)
+            return
+        body = body.encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv' if path == '/haproxy'
+                         else 'application/json')
+        self.send_header('Content-Length', '%i' % len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PlatformHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Accept metric payloads, counting them and their size"""
+    protocol_version = 'HTTP/1.1'
+    counters = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payloads, size = self.counters
+        with payloads.get_lock():
+            payloads.value += 1
+            size.value += len(body)
+        reply = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '%i' % len(reply))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServices(object):
+    """Run the stand-in services in a child process."""
+
+    def __init__(self):
+        self.payloads = multiprocessing.Value('L', 0)
+        self.bytes = multiprocessing.Value('L', 0)
+        self.ports = dict()
+        self._process = None
+
+    def start(self):
+        """Start the services, returning once they are listening."""
+        ports = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=self._serve,
+                                                args=(ports,))
+        self._process.daemon = True
+        self._process.start()
+        self.ports = ports.get(timeout=30)
+
+    def stop(self):
+        """Stop the services."""
+        if self._process:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    @property
+    def platform_url(self):
+        """Return the URL of the platform endpoint
+
+        :rtype: str
+
+        """
+        return ('http://127.0.0.1:%i/platform/v1/metrics' %
+                self.ports['platform'])
+
+    def _serve(self, ports):
+        """Start every server on its own thread and report their ports"""
+        PlatformHandler.counters = self.payloads, self.bytes
+        servers = {'redis': Server(RedisHandler),
+                   'memcached': Server(MemcachedHandler),
+                   'uwsgi': Server(UWSGIHandler),
+                   'http': Server(HTTPHandler),
+                   'platform': Server(PlatformHandler)}
+        for server in servers.values():
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        ports.put(dict((name, server.server_address[1])
+                       for name, server in servers.items()))
+        while True:
+            time.sleep(3600)
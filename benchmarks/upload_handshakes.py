@@ -0,0 +1,185 @@
+"""
+Upload Handshakes
+
+Count the TLS handshakes made while uploading an hour's worth of payloads to
+a local HTTPS stand-in for the NewRelic platform endpoint, once with the
+agent's pooled keep-alive session and once with a new session per payload
+(the behaviour of the module level requests.post the agent used to call).
+
+    python benchmarks/upload_handshakes.py [payloads_per_interval]
+
+Requires the openssl command to create a self-signed certificate.
+
+"""
+import argparse
+import BaseHTTPServer
+import json
+import logging
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_python_agent import agent  # noqa: E402
+
+LOGGER = logging.getLogger(__name__)
+
+WAKE_INTERVAL = 60
+
+
+class PlatformHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Accept metric POSTs with HTTP/1.1 keep-alive"""
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = '{"status":"ok"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PlatformServer(BaseHTTPServer.HTTPServer):
+    """HTTPS server that counts the TLS handshakes it completes"""
+    handshakes = 0
+
+    def __init__(self, address, certfile, keyfile):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PlatformHandler)
+        self.certfile = certfile
+        self.keyfile = keyfile
+
+    def get_request(self):
+        connection, address = self.socket.accept()
+        connection = ssl.wrap_socket(connection, server_side=True,
+                                     certfile=self.certfile,
+                                     keyfile=self.keyfile)
+        self.handshakes += 1
+        return connection, address
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self._handle,
+                                  args=(request, client_address))
+        thread.daemon = True
+        thread.start()
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+
+def create_certificate(path):
+    """Create a self-signed certificate and key in path
+
+    :rtype: tuple(str, str)
+
+    """
+    certfile = os.path.join(path, 'cert.pem')
+    keyfile = os.path.join(path, 'key.pem')
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                               '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                               '-keyout', keyfile, '-out', certfile],
+                              stdout=devnull, stderr=devnull)
+    return certfile, keyfile
+
+
+def create_agent(path, endpoint):
+    """Return an agent configured to upload to the stand-in endpoint
+
+    :rtype: newrelic_python_agent.agent.NewRelicPythonAgent
+
+    """
+    config = os.path.join(path, 'agent.cfg')
+    with open(config, 'w') as handle:
+        json.dump({'Application': {'license_key': 'benchmark',
+                                   'endpoint': endpoint,
+                                   'verify_ssl_cert': False,
+                                   'wake_interval': WAKE_INTERVAL},
+                   'Daemon': {'pidfile': os.path.join(path, 'agent.pid')},
+                   'Logging': {'version': 1}}, handle)
+    args = argparse.Namespace(config=config, foreground=True)
+    obj = agent.NewRelicPythonAgent(args, 'benchmark')
+    obj.endpoint = endpoint
+    obj.http_headers['X-License-Key'] = 'benchmark'
+    obj.http_session = obj.create_http_session()
+    return obj
+
+
+def run(obj, server, payloads, reuse):
+    """Upload the payloads, returning the handshakes and seconds taken
+
+    :rtype: tuple(int, float)
+
+    """
+    components = [{'name': 'benchmark', 'guid': 'com.benchmark',
+                   'duration': WAKE_INTERVAL,
+                   'metrics': {'Component/Benchmark[things]': {
+                       'min': 0, 'max': 1, 'total': 1, 'count': 1,
+                       'sum_of_squares': 1}}}]
+    obj.http_session.close()
+    obj.http_session = obj.create_http_session()
+    start = server.handshakes
+    start_time = time.time()
+    for _payload in range(payloads):
+        if not reuse:
+            obj.http_session.close()
+            obj.http_session = obj.create_http_session()
+        obj.send_components(components, 1)
+    duration = time.time() - start_time
+    obj.http_session.close()
+    return server.handshakes - start, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('per_interval', type=int, nargs='?', default=4,
+                        help='payloads uploaded each interval')
+    per_interval = parser.parse_args().per_interval
+
+    logging.basicConfig(level=logging.WARNING)
+    requests.packages.urllib3.disable_warnings()
+    payloads = (3600 // WAKE_INTERVAL) * per_interval
+
+    path = tempfile.mkdtemp()
+    try:
+        certfile, keyfile = create_certificate(path)
+        server = PlatformServer(('127.0.0.1', 0), certfile, keyfile)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        endpoint = 'https://127.0.0.1:%i/platform/v1/metrics' % server.server_port
+        obj = create_agent(path, endpoint)
+        logging.getLogger('newrelic_python_agent').setLevel(logging.WARNING)
+
+        print('%i payloads per hour (%i per %i second interval)' %
+              (payloads, per_interval, WAKE_INTERVAL))
+        for label, reuse in (('new session per payload', False),
+                             ('pooled keep-alive session', True)):
+            handshakes, duration = run(obj, server, payloads, reuse)
+            print('%-28s %5i handshakes/hour  %6.2f seconds' %
+                  (label, handshakes, duration))
+        server.shutdown()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
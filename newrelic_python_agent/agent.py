@@ -2,25 +2,30 @@
 Multiple Plugin Agent for the New Relic Platform
 
 """
+import hashlib
 import helper
 import importlib
-import json
 import logging
+import math
 import os
 import requests
 import socket
 import sys
-import threading
+import six
 import time
-import gzip
 
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
+from concurrent import futures
 
 from newrelic_python_agent import __version__
+from newrelic_python_agent import encoder
+from newrelic_python_agent import eventloop
+from newrelic_python_agent import instrumentation
 from newrelic_python_agent import plugins
+from newrelic_python_agent import processes
+from newrelic_python_agent import scheduler
+from newrelic_python_agent import spool
+from newrelic_python_agent import state
+from newrelic_python_agent import uploader
 import newrelic_python_agent.plugins.base as base
 
 is_py2 = sys.version[0] == '2'
@@ -43,11 +48,41 @@ class NewRelicPythonAgent(helper.Controller):
     """
 
     IGNORE_KEYS = ['license_key', 'proxy', 'endpoint', 'verify_ssl_cert',
-                   'poll_interval', 'wake_interval', 'newrelic_api_timeout', 'skip_newrelic_upload']
-
+                   'poll_interval', 'wake_interval', 'newrelic_api_timeout', 'skip_newrelic_upload',
+                   'worker_pool_size', 'poll_timeout', 'upload_queue_size',
+                   'newrelic_api_pool_size', 'newrelic_api_retries', 'newrelic_api_backoff',
+                   'newrelic_api_compression_level', 'newrelic_api_concurrency',
+                   'newrelic_api_max_payload_bytes', 'spool_dir', 'spool_max_bytes',
+                   'spool_max_age', 'spool_mmap', 'spool_replay_rate',
+                   'stale_series_cycles', 'state_file', 'state_max_age',
+                   'state_snapshot_interval', 'engine', 'process_pool_size',
+                   'process_plugins', 'agent_metrics', 'breaker_threshold',
+                   'breaker_max_backoff', 'poll_spread']
+
+    # instance settings consumed by the agent that are not passed to the plugin
+    INSTANCE_KEYS = ['poll_interval', 'poll_timeout', 'breaker_threshold',
+                     'breaker_max_backoff', 'poll_spread']
+
+    # instance settings that name an instance that has no name field
+    IDENTITY_KEYS = ['host', 'port', 'path', 'dbname']
+
+    AGENT_GUID = 'com.meetme.newrelic_python_agent.agent'
+    COMPRESSION_RATIO = 0.1
+    ENGINES = ['threads', 'eventloop']
     MAX_METRICS_PER_REQUEST = 10000
+    NEWRELIC_API_BACKOFF = 1
+    NEWRELIC_API_CONCURRENCY = 4
+    NEWRELIC_API_MAX_PAYLOAD_BYTES = 262144
+    NEWRELIC_API_POOL_SIZE = 4
+    NEWRELIC_API_RETRIES = 3
+    NEWRELIC_API_RETRY_STATUS = [429, 500, 502, 503, 504]
     PLATFORM_URL = 'https://platform-api.newrelic.com/platform/v1/metrics'
+    POLL_SPREAD = 0
+    POLL_TIMEOUT_RATIO = 0.8
+    PROCESS_PLUGINS = ['elasticsearch', 'rabbitmq', 'uwsgi']
+    STATE_SNAPSHOT_INTERVAL = 60
     WAKE_INTERVAL = 60
+    WORKER_POOL_SIZE = 32
 
     def __init__(self, args, operating_system):
         """Initialize the NewRelicPythonAgent object.
@@ -59,20 +94,37 @@ class NewRelicPythonAgent(helper.Controller):
         super(NewRelicPythonAgent, self).__init__(args, operating_system)
         self.derive_last_interval = dict()
         self.config_last_result = dict()
+        self.changed_blocks = None
         self.clean_values = False
         self.endpoint = self.PLATFORM_URL
         self.http_headers = {'Accept': 'application/json',
                              'Content-Encoding': 'gzip',
                              'Content-Type': 'application/json'}
+        self.http_session = None
+        self.agent_stats = None
+        self.breakers = dict()
+        self.connections = dict()
         self.last_interval_start = None
+        self.last_snapshot = 0
         self.min_max_values = dict()
+        self.plugin_classes = dict()
         self._wake_interval = (self.config.application.get('wake_interval') or
                                self.config.application.get('poll_interval') or
                                self.WAKE_INTERVAL)
         self.next_wake_interval = int(self._wake_interval)
         self.config_queue = queue.Queue()
         self.publish_queue = queue.Queue()
-        self.threads = list()
+        self.compression_ratio = self.COMPRESSION_RATIO
+        self.loop = None
+        self.pool = None
+        self.processes = None
+        self.replayer = None
+        self.scheduler = None
+        self.spool = None
+        self.plugin_blocks = dict()
+        self.stats = instrumentation.Recorder()
+        self.uploader = None
+        self.thread_names = dict()
         info = tuple([__version__] + list(self.system_platform))
         LOGGER.info('Agent v%s initialized, %s %s v%s', *info)
 
@@ -87,7 +139,161 @@ class NewRelicPythonAgent(helper.Controller):
         if hasattr(self.config.application, 'endpoint'):
             self.endpoint = self.config.application.endpoint
         self.http_headers['X-License-Key'] = self.license_key
+        self.http_session = self.create_http_session()
         self.last_interval_start = time.time()
+        if self.config.application.get('state_file'):
+            self.load_state()
+        process_pool_size = int(self.config.application.get(
+            'process_pool_size', 0))
+        if process_pool_size > 0:
+            self.processes = processes.start_pool(process_pool_size)
+        pool_size = int(self.config.application.get('worker_pool_size',
+                                                    self.WORKER_POOL_SIZE))
+        LOGGER.info('Starting worker pool with %i workers', pool_size)
+        self.pool = futures.ThreadPoolExecutor(max_workers=pool_size)
+        engine = self.config.application.get('engine', 'threads')
+        if engine not in self.ENGINES:
+            LOGGER.error('Unknown engine %r, using threads', engine)
+            engine = 'threads'
+        if engine == 'eventloop':
+            LOGGER.info('Polling plugins that support it on the event loop')
+            self.loop = eventloop.EventLoop(self.pool)
+            self.loop.start()
+            self.scheduler = scheduler.Scheduler(
+                eventloop.LoopExecutor(self.loop, self.pool))
+            self.loop.call_soon_threadsafe(self.run_scheduler)
+        else:
+            self.scheduler = scheduler.Scheduler(self.pool)
+            self.scheduler.start()
+        queue_size = int(self.config.application.get('upload_queue_size',
+                                                     uploader.Uploader.QUEUE_SIZE))
+        self.uploader = uploader.Uploader(self.send_components, queue_size,
+                                          self.upload_concurrency)
+        self.uploader.start()
+        spool_dir = self.config.application.get('spool_dir')
+        if spool_dir:
+            self.start_spool(spool_dir)
+
+    def cleanup(self):
+        """Stop scheduling polls, wait for any polls in flight and stop the
+        worker pool, then upload the remaining results. This is invoked by
+        Controller.stop().
+
+        """
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
+        if self.loop:
+            self.loop.stop()
+            self.loop = None
+        if self.replayer:
+            self.replayer.stop()
+            self.replayer = None
+        if self.pool:
+            LOGGER.info('Waiting for the worker pool to finish')
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        if self.processes:
+            self.processes.shutdown(wait=True)
+            self.processes = None
+        for name in list(self.connections):
+            self.close_connection(name)
+        if self.config.application.get('state_file'):
+            self.save_state()
+        if self.uploader:
+            self.send_data_to_newrelic()
+            self.uploader.stop()
+            self.uploader = None
+        if self.spool:
+            self.spool.close()
+            self.spool = None
+        if self.http_session:
+            self.http_session.close()
+            self.http_session = None
+
+    def load_state(self):
+        """Restore the derive history and config plugin results saved by a
+        previous run of the agent, so derived metrics are reported from the
+        first poll. The config blocks returned by config plugins are applied
+        straight away.
+
+        Values older than ``state_max_age``, one wake interval by default,
+        are not restored, as the first poll would report everything counted
+        since they were taken as a single interval's value.
+
+        """
+        config = self.config.application
+        self.derive_last_interval, self.config_last_result = \
+            state.load_snapshot(config['state_file'],
+                                int(config.get('state_max_age',
+                                               self._wake_interval)))
+        for name, data in self.config_last_result.items():
+            self.config_queue.put((name, data))
+        self.process_config_plugins()
+        self.last_snapshot = time.time()
+
+    def save_state(self):
+        """Write the derive history and config plugin results to the state
+        file.
+
+        """
+        try:
+            state.save_snapshot(self.config.application['state_file'],
+                                self.derive_last_interval,
+                                self.config_last_result)
+        except (IOError, OSError, TypeError, ValueError) as error:
+            LOGGER.error('Could not save state snapshot: %s', error)
+        self.last_snapshot = time.time()
+
+    def start_spool(self, path):
+        """Open the spool that payloads which could not be uploaded are
+        written to, and start replaying anything already in it.
+
+        :param str path: The directory to keep spool segments in
+
+        """
+        config = self.config.application
+        LOGGER.info('Spooling failed uploads to %s', path)
+        self.spool = spool.Spool(
+            path,
+            int(config.get('spool_max_bytes', spool.Spool.MAX_BYTES)),
+            int(config.get('spool_max_age', spool.Spool.MAX_AGE)),
+            use_mmap=bool(config.get('spool_mmap', False)))
+        self.replayer = spool.Replayer(
+            self.spool, self.replay_payload,
+            float(config.get('spool_replay_rate', spool.Replayer.RATE)),
+            self._wake_interval)
+        self.replayer.start()
+
+    def create_http_session(self):
+        """Return a requests session used for every upload to NewRelic, so
+        connections to the platform are kept alive and reused across payloads
+        and intervals.
+
+        :rtype: requests.Session
+
+        """
+        pool_size = int(self.config.application.get('newrelic_api_pool_size',
+                                                    self.NEWRELIC_API_POOL_SIZE))
+        pool_size = max(pool_size, self.upload_concurrency)
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.http_headers)
+        return session
+
+    @property
+    def upload_concurrency(self):
+        """Return the number of payloads that may be uploaded at the same
+        time.
+
+        :rtype: int
+
+        """
+        return int(self.config.application.get('newrelic_api_concurrency',
+                                               self.NEWRELIC_API_CONCURRENCY))
 
     @property
     def agent_data(self):
@@ -112,37 +318,69 @@ class NewRelicPythonAgent(helper.Controller):
             licensekey = self.config.application.license_key
         return licensekey
 
-    def get_instance_name(self, plugin_name, instance):
+    def get_instance_name(self, plugin_name, instance, counts):
         """
         Determine a unique instance name for a plugin.  This is done by combining the
-        plugin block name + the name field + an instance number
+        plugin block name + the name field, or the host, port and path the
+        instance polls if it has none, so an instance keeps its name when other
+        entries in the block are added, removed or reordered.
 
         Example:
             plugin name = mysql[:desc]
-            block name = name field in block or unnamed
-            instance number = incremental number in case previous is not unique
+            instance key = name field in block, host:port or unnamed
+            instance number = appended to the second and later instances
+                with the same key
 
         :param str plugin_name: The plugin block name as defined in the application config
         :param dict instance: The instance config block
+        :param dict counts: The number of instances named so far in the block
+            for each name, updated in place
         :rtype: str
         """
-        # start with the base name of the plugin + name field
-        name = "%s:%s" % (plugin_name, instance.get('name', 'unnamed'))
-        i = 0
-        instance_name = "%s:%i" % (name, i)
-        while instance_name in self.thread_names:
-            i = i + 1
-            instance_name = "%s:%i" % (name, i)
+        key = instance.get('name')
+        if not key:
+            key = ':'.join(str(instance[field]) for field in self.IDENTITY_KEYS
+                           if instance.get(field) is not None) or 'unnamed'
+        name = "%s:%s" % (plugin_name, key)
+        i = counts.get(name, 0)
+        counts[name] = i + 1
+        return "%s:%i" % (name, i) if i else name
+
+    def instance_settings(self, instance):
+        """Return the application wide settings an instance uses for the
+        agent settings it does not set itself, so a change to one of them is
+        treated as a change to the instance.
 
-        return instance_name
+        :param dict instance: The instance config block
+        :rtype: dict
 
-    def start_plugin(self, plugin_name, plugin, config):
-        """Kick off a background thread to run the processing task.
+        """
+        return dict((key, self.config.application.get(key))
+                    for key in self.INSTANCE_KEYS
+                    if key not in instance and key != 'poll_interval')
+
+    def start_plugin(self, plugin_name, plugin, config, started=None,
+                     force=False):
+        """Add or update the poll schedule for each instance of the plugin.
+        Each instance is polled every ``poll_interval`` seconds as set in its
+        config, defaulting to the wake interval, at the phase offset
+        ``poll_offset`` returns. A poll that has not returned within
+        ``poll_timeout`` seconds has its metric results dropped.
+
+        Instances that were started with the same config and application
+        settings keep their schedule, circuit breaker, connection and derive
+        history, unless force is set. A changed instance is rescheduled with a
+        new breaker and connection, and its derive history is dropped.
 
         :param plugin: The plugin name as defined in the application config
         :param config: The set of instance configs for the plugin
+        :param dict started: The instance configs and settings the plugin was
+            last started with, by instance name
+        :param bool force: Update the schedule of every instance
         :type plugin: newrelic_python_agent.plugins.base.Plugin
         :type config: dict or list(dict)
+        :return: The instance configs and settings, by instance name
+        :rtype: dict
 
         """
 
@@ -151,29 +389,191 @@ class NewRelicPythonAgent(helper.Controller):
 
         LOGGER.debug("Plugin config: %s", config)
 
+        started = started or dict()
+        instances = dict()
+        counts = dict()
+
         # the instance names must be unique so we can store the results for each.
-        # use the 'name' field, if specified.  If there are duplicate names, we
-        # simply append a number so it is unique.  As long as the the order in the
-        # config remains the same, then the instance number will remain the same.
+        # use the 'name' field, or the host and port if there is none.  If
+        # there are duplicate names, we simply append a number so it is unique.
         for instance in config:
-            instance_name = self.get_instance_name(plugin_name, instance)
+            instance_name = self.get_instance_name(plugin_name, instance,
+                                                   counts)
+            settings = instance, self.instance_settings(instance)
+            instances[instance_name] = settings
+            self.thread_names[instance_name] = plugin.__name__
+            if not force and started.get(instance_name) == settings:
+                continue
+            if instance_name in started:
+                LOGGER.info('Restarting changed plugin instance %s',
+                            instance_name)
+                self.derive_last_interval.pop(instance_name, None)
+            poll_interval = int(instance.get('poll_interval',
+                                             self._wake_interval))
+            poll_timeout = float(instance.get('poll_timeout') or
+                                 self.config.application.get('poll_timeout') or
+                                 poll_interval * self.POLL_TIMEOUT_RATIO)
+            poll_offset = self.poll_offset(instance_name, instance,
+                                           poll_interval)
+            self.start_breaker(instance_name, plugin, instance, poll_interval)
+            self.close_connection(instance_name)
+            instance = dict((key, value) for key, value in instance.items()
+                            if key not in self.INSTANCE_KEYS)
 
             if issubclass(plugin, base.ConfigPlugin):
-                thread = threading.Thread(target=self.thread_config_process,
-                                          kwargs={'config': instance,
-                                                  'name': instance_name,
-                                                  'plugin': plugin})
+                self.scheduler.schedule(instance_name,
+                                        self.thread_config_process,
+                                        poll_interval,
+                                        {'config': instance,
+                                         'name': instance_name,
+                                         'plugin': plugin},
+                                        poll_timeout, poll_offset)
             else:
-                thread = threading.Thread(target=self.thread_metric_process,
-                                          kwargs={'config': instance,
-                                                  'name': instance_name,
-                                                  'plugin': plugin,
-                                                  'poll_interval':
-                                                      int(self._wake_interval)})
-            LOGGER.info("Starting plugin instance %s as thread %s", instance_name, thread.getName())
-            self.thread_names[instance_name] = thread.getName()
-            thread.start()
-            self.threads.append(thread)
+                target = self.thread_metric_process
+                if self.processes and \
+                        plugin_name.split(':', 1)[0] in self.process_plugins:
+                    target = self.process_metric_process
+                elif self.loop and plugin.ASYNC:
+                    target = self.coroutine_metric_process
+                self.scheduler.schedule(instance_name,
+                                        target,
+                                        poll_interval,
+                                        {'config': instance,
+                                         'name': instance_name,
+                                         'plugin': plugin,
+                                         'poll_interval': poll_interval},
+                                        poll_timeout, poll_offset)
+        return instances
+
+    def poll_offset(self, name, instance, poll_interval):
+        """Return the number of seconds into each poll interval to poll an
+        instance at. The offset is up to ``poll_spread`` of the interval,
+        set per instance or for all instances, and is derived from a hash of
+        the instance name, so instances polling the same backend are spread
+        over the interval and keep their offsets across restarts.
+
+        :param str name: The unique instance name of the plugin
+        :param dict instance: The instance config
+        :param int poll_interval: How often the instance is polled
+        :rtype: float
+
+        """
+        spread = float(instance.get(
+            'poll_spread', self.config.application.get('poll_spread',
+                                                       self.POLL_SPREAD)))
+        spread = min(max(spread, 0.0), 1.0)
+        if not spread:
+            return 0
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        fraction = int(hashlib.sha1(name).hexdigest()[:8], 16) / 4294967296.0
+        return fraction * spread * poll_interval
+
+    def start_breaker(self, name, plugin, instance, poll_interval):
+        """Give a new or changed metric plugin instance a closed circuit
+        breaker, backing off from ``poll_interval`` seconds up to
+        ``breaker_max_backoff`` seconds once ``breaker_threshold`` polls in a
+        row have failed. Both can be set per instance or for all instances,
+        and a threshold of 0 turns the breaker off.
+
+        :param str name: The unique instance name of the plugin
+        :param plugin: The plugin class
+        :param dict instance: The instance config
+        :param int poll_interval: How often the instance is polled
+
+        """
+        self.breakers.pop(name, None)
+        if issubclass(plugin, base.ConfigPlugin):
+            return
+        threshold = int(instance.get(
+            'breaker_threshold', self.config.application.get(
+                'breaker_threshold', plugin.BREAKER_THRESHOLD)))
+        if threshold > 0:
+            max_backoff = float(instance.get(
+                'breaker_max_backoff', self.config.application.get(
+                    'breaker_max_backoff', plugin.BREAKER_MAX_BACKOFF)))
+            self.breakers[name] = base.CircuitBreaker(threshold, poll_interval,
+                                                      max_backoff)
+
+    def breaker_allows(self, name):
+        """Return True unless the circuit breaker of the named instance is
+        open, counting the poll as suppressed if it is.
+
+        :param str name: The unique instance name of the plugin
+        :rtype: bool
+
+        """
+        breaker = self.breakers.get(name)
+        if breaker is None or breaker.allow():
+            return True
+        self.stats.increment('Agent/Polls/Suppressed', 'polls')
+        return False
+
+    def record_health(self, name, success):
+        """Record the outcome of a poll with the circuit breaker of the named
+        instance, logging when it opens or closes.
+
+        :param str name: The unique instance name of the plugin
+        :param bool success: True if the poll returned data
+
+        """
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            return
+        previous, failures = breaker.state, breaker.failures
+        breaker.record(success)
+        if breaker.state == breaker.OPEN and previous != breaker.OPEN:
+            LOGGER.warning('%s failed %i polls in a row, not polling it for '
+                           '%.0f seconds', name, breaker.failures,
+                           breaker.retry_at - time.time())
+        elif breaker.state == breaker.CLOSED and previous != breaker.CLOSED:
+            LOGGER.info('%s is polling again after %i failed polls', name,
+                        failures)
+
+    def persistent_connection(self, name, plugin, config):
+        """Return the connection kept open between polls of the named
+        instance, creating it on first use, or None unless the plugin can
+        reuse its connection and the instance sets ``persistent: true``.
+
+        :param str name: The unique instance name of the plugin
+        :param plugin: The plugin class
+        :param dict config: The plugin configuration
+        :rtype: newrelic_python_agent.plugins.base.PersistentConnection
+
+        """
+        if not (plugin.PERSISTENT and config.get('persistent')):
+            return None
+        connection = self.connections.get(name)
+        if connection is None:
+            connection = self.connections[name] = \
+                base.PersistentConnection()
+        return connection
+
+    def close_connection(self, name):
+        """Close the connection kept open for the named instance, if any, as
+        its config has changed or it is no longer polled.
+
+        :param str name: The unique instance name of the plugin
+
+        """
+        connection = self.connections.pop(name, None)
+        if connection is not None:
+            connection.close()
+
+    def retire_instance(self, name):
+        """Stop polling a plugin instance that is no longer configured and
+        remove the state kept for it.
+
+        :param str name: The unique instance name of the plugin
+
+        """
+        LOGGER.info('Removing unused plugin instance %s', name)
+        self.thread_names.pop(name, None)
+        self.breakers.pop(name, None)
+        self.close_connection(name)
+        self.scheduler.unschedule(name)
+        self.derive_last_interval.pop(name, None)
+        self.config_last_result.pop(name, None)
 
     def clean_last_values(self):
         """Remove any saved value data for plugins that are no longer configured"""
@@ -187,21 +587,62 @@ class NewRelicPythonAgent(helper.Controller):
                 self.config_last_result.pop(key)
         self.clean_values = False
 
+    def clean_min_max_values(self):
+        """Remove the min/max history of components that have not been
+        reported for stale_series_cycles of their poll interval.
+
+        """
+        for key in [key for key, store in self.min_max_values.items()
+                    if store.expired]:
+            LOGGER.info('Removing min/max values for unreported %s', key[1])
+            del self.min_max_values[key]
+
+    @property
+    def stale_series_cycles(self):
+        """Return the number of polls a metric may go unreported before its
+        history is removed.
+
+        :rtype: int
+
+        """
+        return int(self.config.application.get('stale_series_cycles',
+                                               state.STALE_CYCLES))
+
+    @property
+    def process_plugins(self):
+        """Return the names of the plugins polled in the process pool
+
+        :rtype: list
+
+        """
+        return self.config.application.get('process_plugins',
+                                           self.PROCESS_PLUGINS)
+
+    def run_scheduler(self):
+        """Dispatch the polls that are due from the event loop, then run
+        again when the next one is due, checking at least once a second for
+        changes to the schedule.
+
+        """
+        if not self.scheduler:
+            return
+        delay = self.scheduler.run_pending()
+        self.loop.call_later(min(delay if delay is not None else 1, 1),
+                             self.run_scheduler)
+
     def process(self):
-        """This method is called after every sleep interval. If the intention
-        is to use an IOLoop instead of sleep interval based daemon, override
-        the run method.
+        """This method is called after every sleep interval. Polls run on
+        their own schedules, so this only reconciles the schedule with the
+        current config and uploads the results that have arrived since the
+        last interval.
 
         """
         start_time = time.time()
         self.start_plugins()
 
-        # Sleep for a second while threads are running
-        while self.threads_running:
-            time.sleep(1)
-
-        # threads are done, so empty the list
-        self.threads = list()
+        component = self.agent_component()
+        if self.config.application.get('agent_metrics', True):
+            self.publish_queue.put(('agent', component))
 
         # send any collected metrics to newrelic
         self.send_data_to_newrelic()
@@ -211,16 +652,92 @@ class NewRelicPythonAgent(helper.Controller):
 
         if self.clean_values:
             self.clean_last_values()
+        self.clean_min_max_values()
+
+        if self.config.application.get('state_file'):
+            interval = int(self.config.application.get(
+                'state_snapshot_interval', self.STATE_SNAPSHOT_INTERVAL))
+            if time.time() - self.last_snapshot >= interval:
+                self.save_state()
+
+        LOGGER.debug('Upload queue: %(depth)i waiting, %(sent)i sent, '
+                     '%(skipped)i skipped, %(failed)i failed, '
+                     '%(dropped)i dropped',
+                     self.uploader.stats)
+        if self.spool:
+            LOGGER.debug('Spool: %(segments)i segments (%(bytes)i bytes), '
+                         '%(spooled)i spooled, %(replayed)i replayed, '
+                         '%(expired)i expired, %(discarded)i discarded',
+                         self.spool.stats)
 
         duration = time.time() - start_time
+        self.stats.timing('Agent/Interval', duration)
         self.next_wake_interval = self._wake_interval - duration
         if self.next_wake_interval < 1:
             LOGGER.warning('Poll interval took greater than %i seconds',
                            duration)
             self.next_wake_interval = int(self._wake_interval)
-        LOGGER.info('Threads processed in %.2f seconds, next wake in %i seconds',
+        LOGGER.info('Interval processed in %.2f seconds, next wake in %i seconds',
                     duration, self.next_wake_interval)
 
+    def agent_component(self):
+        """Return the agent's self-instrumentation as a component, holding
+        everything recorded since the last interval along with the current
+        queue depths and the counts of late, skipped and dropped polls. The
+        component is also kept as agent_stats for other consumers.
+
+        :rtype: dict
+
+        """
+        jobs = list(self.scheduler.jobs.values()) if self.scheduler else []
+        self.stats.total('Agent/Polls/Late', 'polls',
+                         sum(job.late for job in jobs))
+        self.stats.total('Agent/Polls/Skipped', 'polls',
+                         sum(job.skipped for job in jobs))
+        self.stats.gauge('Agent/Polls/Scheduled', 'instances', len(jobs))
+        for name, breaker in list(self.breakers.items()):
+            self.stats.gauge('Agent/Polls/%s/Health' % name, 'health',
+                             breaker.health)
+        self.stats.gauge('Agent/Queues/Publish', 'results',
+                         self.publish_queue.qsize())
+        self.stats.gauge('Agent/Queues/Config', 'results',
+                         self.config_queue.qsize())
+        if self.uploader:
+            stats = self.uploader.stats
+            self.stats.gauge('Agent/Queues/Upload', 'payloads',
+                             stats['depth'])
+            for key in ('sent', 'skipped', 'failed'):
+                self.stats.total('Agent/Uploads/%s' % key.title(), 'payloads',
+                                 stats[key])
+            self.stats.total('Agent/Uploads/Dropped', 'payloads',
+                             stats['dropped'])
+        if self.spool:
+            stats = self.spool.stats
+            self.stats.gauge('Agent/Spool/Size', 'bytes', stats['bytes'])
+            for key in ('spooled', 'replayed', 'expired', 'discarded'):
+                self.stats.total('Agent/Spool/%s' % key.title(), 'payloads',
+                                 stats[key])
+        self.agent_stats = {'name': socket.gethostname().split('.')[0],
+                            'guid': self.AGENT_GUID,
+                            'duration': int(self._wake_interval),
+                            'metrics': self.stats.collect()}
+        return self.agent_stats
+
+    def record_poll(self, name, start, timings):
+        """Record the latency of a finished poll of the named instance and
+        the time it spent in each phase.
+
+        :param str name: The unique instance name of the plugin
+        :param float start: When the poll started
+        :param dict timings: The seconds spent in each phase of the poll
+
+        """
+        self.stats.timing('Agent/Polls/%s/Latency' % name, time.time() - start,
+                          histogram=True)
+        for phase, seconds in timings.items():
+            self.stats.timing('Agent/Polls/%s/%s' % (name, phase.title()),
+                              seconds)
+
     def process_min_max_values(self, component):
         """Agent keeps track of previous values, so compute the differences for
         min/max values.
@@ -228,34 +745,36 @@ class NewRelicPythonAgent(helper.Controller):
         :param dict component: The component to calc min/max values for
 
         """
-        guid = component['guid']
-        name = component['name']
-
-        if guid not in self.min_max_values.keys():
-            self.min_max_values[guid] = dict()
-
-        if name not in self.min_max_values[guid].keys():
-            self.min_max_values[guid][name] = dict()
-
-        for metric in component['metrics']:
-            min_val, max_val = self.min_max_values[guid][name].get(
-                    metric,
-                    (None, None)
-            )
-            value = component['metrics'][metric]['total']
+        key = component['guid'], component['name']
+        store = self.min_max_values.get(key)
+        if store is None:
+            store = self.min_max_values[key] = state.MinMaxStore()
+        cycles = self.stale_series_cycles
+        store.expires = time.time() + cycles * max(
+            component.get('duration') or 0, self._wake_interval)
+        store.advance()
+
+        for metric, payload in six.iteritems(component['metrics']):
+            min_val, max_val = store.get(metric)
+            value = payload['total']
             if min_val is not None and min_val > value:
                 min_val = value
 
             if max_val is None or max_val < value:
                 max_val = value
 
-            if component['metrics'][metric]['min'] is None:
-                component['metrics'][metric]['min'] = min_val or value
+            if payload['min'] is None:
+                payload['min'] = min_val or value
+
+            if payload['max'] is None:
+                payload['max'] = max_val
 
-            if component['metrics'][metric]['max'] is None:
-                component['metrics'][metric]['max'] = max_val
+            store.set(metric, min_val, max_val)
 
-            self.min_max_values[guid][name][metric] = min_val, max_val
+        evicted = store.evict(cycles)
+        if evicted:
+            LOGGER.debug('Removed min/max values for %i unreported metrics '
+                         'of %s', evicted, key[1])
 
     @property
     def proxies(self):
@@ -275,6 +794,20 @@ class NewRelicPythonAgent(helper.Controller):
         # if the configuration was reloaded, then flag it so we can
         # check if we need to purget any old data.
         self.clean_values = True
+        # and import the plugin classes again, retrying any that failed,
+        # and compare every plugin block with the instances started for it
+        self.plugin_classes = dict()
+        self.changed_blocks = None
+
+    def block_changed(self, plugin):
+        """Note that a plugin block was changed by a config plugin so its
+        instances are reconciled on the next wake.
+
+        :param str plugin: The plugin block name
+
+        """
+        if self.changed_blocks is not None:
+            self.changed_blocks.add(plugin)
 
     def process_config_plugins(self):
         """Process the queue of config plugin results"""
@@ -284,8 +817,10 @@ class NewRelicPythonAgent(helper.Controller):
             if isinstance(data, dict) and data.get('application'):
                 LOGGER.debug("%s results" % name, extra={"results": data.get('application')})
 
-                # this is a success, so save this
-                self.config_last_result[name] = data
+                # this is a success, so save this unless the instance was
+                # removed while it was running
+                if name in self.thread_names:
+                    self.config_last_result[name] = data
 
                 # process each result individually
                 for plugin_name in data['application'].keys():
@@ -299,42 +834,86 @@ class NewRelicPythonAgent(helper.Controller):
                             # update or add new block
                             self.config.application.update({plugin_name: data['application'][plugin_name]})
                             action = "updated"
-                            self.clean_values = True
+                            self.block_changed(plugin_name)
                     elif plugin_name in self.config.application:
                         # config is empty for an existing plugin_name, so remove it
                         self.config.application.pop(plugin_name)
                         action = "removed"
-                        self.clean_values = True
+                        self.block_changed(plugin_name)
 
                     if action:
                         LOGGER.info("Plugin instance %s result %s %s", name, plugin_name, action)
 
     def send_data_to_newrelic(self):
-        """Process the queue of metric plugin results"""
-        metrics = 0
+        """Process the queue of metric plugin results, handing the payloads
+        to the background uploader. Payloads are split so that each stays
+        within the metric count limit and, going by the compression ratio of
+        recent uploads, within the configured compressed size.
+
+        """
+        max_bytes = int(self.config.application.get('newrelic_api_max_payload_bytes',
+                                                    self.NEWRELIC_API_MAX_PAYLOAD_BYTES))
+        max_size = max_bytes / self.compression_ratio
+        metrics, size = 0, 0
         components = list()
         while self.publish_queue.qsize():
-            (name, data, last_values) = self.publish_queue.get()
-            self.derive_last_interval[name] = last_values
+            (name, data) = self.publish_queue.get()
             if isinstance(data, dict):
                 data = [data]
             if isinstance(data, list):
                 for component in data:
                     self.process_min_max_values(component)
-                    components.append(component)
-                    metrics += len(component['metrics'].keys())
-                    if metrics >= self.MAX_METRICS_PER_REQUEST:
-                        self.send_components(components, metrics)
-                        components = list()
-                        metrics = 0
+                    for part in self.split_component(component, max_size):
+                        count = len(part['metrics'])
+                        part_size = encoder.estimate_size(part)
+                        if components and (
+                                metrics + count > self.MAX_METRICS_PER_REQUEST or
+                                size + part_size > max_size):
+                            self.uploader.put(components, metrics)
+                            components = list()
+                            metrics, size = 0, 0
+                        components.append(part)
+                        metrics += count
+                        size += part_size
 
         if metrics > 0:
             LOGGER.debug('Done, will send remainder of %i metrics', metrics)
-            self.send_components(components, metrics)
+            self.uploader.put(components, metrics)
+
+    def split_component(self, component, max_size):
+        """Split a component that would not fit in a single payload into
+        parts that each do.
+
+        :param dict component: The component to split
+        :param float max_size: The estimated uncompressed payload size limit
+        :rtype: list
+
+        """
+        metrics = len(component.get('metrics') or dict())
+        if metrics <= 1:
+            return [component]
+        size = encoder.estimate_size(component)
+        parts = max(int(math.ceil(size / max_size)),
+                    int(math.ceil(float(metrics) /
+                                  self.MAX_METRICS_PER_REQUEST)))
+        if parts <= 1:
+            return [component]
+        LOGGER.debug('Splitting %s into %i parts', component.get('name'), parts)
+        return encoder.split_component(component,
+                                       int(math.ceil(float(metrics) / parts)))
 
     def send_components(self, components, metrics):
         """Create the headers and payload to send to NewRelic platform as a
-        JSON encoded POST body.
+        JSON encoded POST body. This is invoked from an uploader thread.
+
+        If the payload could not be sent it is written to the spool, when
+        one is configured, to be replayed later.
+
+        :param list components: The components to send
+        :param int metrics: The number of metrics in the components
+        :return: False if the payload could not be sent, None if there was
+            nothing to send or uploads are disabled
+        :rtype: bool
 
         """
         if not metrics:
@@ -346,34 +925,106 @@ class NewRelicPythonAgent(helper.Controller):
             return
 
         LOGGER.info('Sending %i metrics to NewRelic', metrics)
-        body = {'agent': self.agent_data, 'components': components}
-        LOGGER.debug(body)
-
-        s = StringIO()
-        g = gzip.GzipFile(fileobj=s, mode='w')
-        g.write(json.dumps(body, ensure_ascii=False))
-        g.close()
-        gzipped_body = s.getvalue()
-        request_body = gzipped_body
+        compresslevel = int(self.config.application.get('newrelic_api_compression_level',
+                                                        encoder.COMPRESSION_LEVEL))
+        request_body, size = encoder.encode(self.agent_data, components,
+                                            compresslevel)
 
-        LOGGER.debug('POST data size before compression: %i bytes', len(json.dumps(body, ensure_ascii=False)))
+        LOGGER.debug('POST data size before compression: %i bytes', size)
         LOGGER.debug('POST data size after compression: %i bytes', len(request_body))
+        self.stats.observe('Agent/Uploads/Uncompressed', 'bytes', size)
+        self.stats.observe('Agent/Uploads/Compressed', 'bytes',
+                           len(request_body))
+        self.stats.observe('Agent/Uploads/Metrics', 'metrics', metrics)
+        estimate = sum(encoder.estimate_size(c) for c in components)
+        if estimate:
+            # learn the compressed size relative to the estimate used for
+            # chunking, correcting for estimation error as well
+            self.compression_ratio = (self.compression_ratio * 0.8 +
+                                      float(len(request_body)) / estimate * 0.2)
+
+        retries = int(self.config.application.get('newrelic_api_retries',
+                                                  self.NEWRELIC_API_RETRIES))
+        if self.post_payload(request_body, retries) is not False:
+            return True
+        if self.spool:
+            LOGGER.warning('Spooling %i metrics to be sent later', metrics)
+            self.spool.append(request_body, metrics)
+        return False
+
+    def replay_payload(self, request_body, metrics):
+        """Send a payload from the spool to NewRelic, without retrying.
+        This is invoked from the replayer thread.
+
+        :param bytes request_body: The gzipped payload
+        :param int metrics: The number of metrics in the payload
+        :return: False if the payload could not be sent
+        :rtype: bool
+
+        """
+        LOGGER.info('Replaying %i spooled metrics', metrics)
+        return self.post_payload(request_body, 0)
+
+    def post_payload(self, request_body, retries):
+        """POST a gzipped payload to NewRelic, retrying a 429 or 5xx
+        response with an exponential backoff.
 
+        :param bytes request_body: The gzipped payload
+        :param int retries: The number of times to retry the payload
+        :return: False if the payload could not be sent
+        :rtype: bool
+
+        """
+        backoff = float(self.config.application.get('newrelic_api_backoff',
+                                                    self.NEWRELIC_API_BACKOFF))
+        for attempt in range(retries + 1):
+            start = time.time()
+            try:
+                response = self.http_session.post(
+                    self.endpoint,
+                    proxies=self.proxies,
+                    data=request_body,
+                    timeout=self.config.application.get('newrelic_api_timeout', 10),
+                    verify=self.config.application.get('verify_ssl_cert', True))
+
+                LOGGER.debug('Response: %s: %r',
+                             response.status_code,
+                             response.content.strip())
+                self.stats.timing('Agent/Uploads/Latency', time.time() - start)
+            except requests.ConnectionError as error:
+                LOGGER.error('Error reporting stats: %s', error)
+                return False
+            except requests.Timeout as error:
+                LOGGER.error('TimeoutError reporting stats: %s', error)
+                return False
+
+            if response.status_code not in self.NEWRELIC_API_RETRY_STATUS:
+                return True
+            if attempt == retries:
+                break
+            delay = self.retry_delay(response, backoff * (2 ** attempt))
+            LOGGER.warning('NewRelic responded with %s, retrying in %.1f seconds',
+                           response.status_code, delay)
+            time.sleep(delay)
+
+        LOGGER.error('Error reporting stats: %s response after %i attempts',
+                     response.status_code, retries + 1)
+        return False
+
+    @staticmethod
+    def retry_delay(response, default):
+        """Return the number of seconds to wait before retrying an upload,
+        honoring the Retry-After header if NewRelic sent one.
+
+        :param requests.Response response: The response to retry
+        :param float default: The delay to use if no header was sent
+        :rtype: float
+
+        """
         try:
-            response = requests.post(self.endpoint,
-                                     headers=self.http_headers,
-                                     proxies=self.proxies,
-                                     data=request_body,
-                                     timeout=self.config.application.get('newrelic_api_timeout', 10),
-                                     verify=self.config.application.get('verify_ssl_cert', True))
-
-            LOGGER.debug('Response: %s: %r',
-                         response.status_code,
-                         response.content.strip())
-        except requests.ConnectionError as error:
-            LOGGER.error('Error reporting stats: %s', error)
-        except requests.Timeout as error:
-            LOGGER.error('TimeoutError reporting stats: %s', error)
+            return max(float(response.headers.get('Retry-After', default)), 0)
+        except ValueError:
+            return default
 
     @staticmethod
     def _get_plugin(plugin_path):
@@ -395,84 +1046,249 @@ class NewRelicPythonAgent(helper.Controller):
             LOGGER.exception('Attempting to import %s', plugin_path)
             return None
 
-    def start_plugins(self):
-        """Iterate through each plugin and start the thread(s)."""
+    def get_plugin_class(self, plugin_path):
+        """Return the class for a qualified class name, importing it the
+        first time it is needed after startup or a config reload. A class
+        that could not be imported is not tried again until the next reload.
 
-        # reset the configured instance names
-        self.thread_names = dict()
+        :param str plugin_path: The qualified class name
+        :rtype: object
+
+        """
+        if plugin_path not in self.plugin_classes:
+            self.plugin_classes[plugin_path] = self._get_plugin(plugin_path)
+        return self.plugin_classes[plugin_path]
 
-        for plugin in [key for key in self.config.application.keys()
-                       if key not in self.IGNORE_KEYS]:
+    def start_plugins(self):
+        """Reconcile the plugin instances with the config. After startup or
+        a config reload every plugin block is compared with the instances
+        started for it, otherwise only the blocks config plugins changed
+        are, so a wake where nothing changed does no work here.
 
-            # ignore this if the config is empty
-            if not self.config.application.get(plugin):
-                continue
+        """
+        if self.changed_blocks is None:
+            blocks = [key for key in self.config.application.keys()
+                      if key not in self.IGNORE_KEYS]
+            blocks.extend(key for key in self.plugin_blocks
+                          if key not in self.config.application)
+        else:
+            blocks = self.changed_blocks
+        self.changed_blocks = set()
+        for plugin in blocks:
+            self.reconcile_plugin(plugin)
+
+    def reconcile_plugin(self, plugin):
+        """Start the new instances of a plugin block, update the changed ones
+        and retire the ones that are no longer configured. Every instance is
+        updated if the plugin class has changed.
+
+        :param str plugin: The plugin block name
+
+        """
+        plugin_class, started = self.plugin_blocks.pop(plugin, (None, dict()))
+        config = None
+        if plugin not in self.IGNORE_KEYS:
+            config = self.config.application.get(plugin)
 
+        # ignore this if the config is empty
+        if config:
             LOGGER.info('Checking plugin config: %s', plugin)
             # support plugin:id format to allow multiple config blocks
             # for a single plugin
             plugin_name = plugin.split(":", 1)[0]
-            plugin_class = None
+            previous_class, plugin_class = plugin_class, None
 
             # If plugin is part of the core agent plugin list
             if plugin_name in plugins.available:
-                plugin_class = self._get_plugin(plugins.available[plugin_name])
+                plugin_class = self.get_plugin_class(
+                    plugins.available[plugin_name])
 
             # If plugin is in config and a qualified class name
             elif '.' in plugin_name:
-                plugin_class = self._get_plugin(plugin_name)
+                plugin_class = self.get_plugin_class(plugin_name)
 
             # If plugin class could not be imported
             if not plugin_class:
                 LOGGER.error('Plugin %s not available', plugin_name)
-                continue
-
-            self.start_plugin(plugin, plugin_class,
-                              self.config.application.get(plugin))
-
-    @property
-    def threads_running(self):
-        """Return True if any of the child threads are alive
-
-        :rtype: bool
+            else:
+                instances = self.start_plugin(
+                    plugin, plugin_class, config, started,
+                    plugin_class is not previous_class)
+                self.plugin_blocks[plugin] = plugin_class, instances
+                started = [name for name in started if name not in instances]
 
-        """
-        for thread in self.threads:
-            if thread.is_alive():
-                return True
-        return False
+        for name in started:
+            self.retire_instance(name)
 
-    def thread_config_process(self, name, plugin, config):
+    def thread_config_process(self, name, plugin, config, deadline=None):
         """
-        Create a thread process to return a dynamic config for a plugin.
+        Run a config plugin on a worker to return a dynamic config for a plugin.
         The result of this plugin is added to a Queue object which is used
-        to maintain the stack of running config plugins.
+        to maintain the stack of running config plugins. Late results are
+        still applied on the next wake.
 
         :param str name: The unique instance name of the plugin
         :param newrelic_python_agent.plugins.base.ConfigPlugin plugin: The plugin class
         :param dict config: The plugin configuration
+        :param float deadline: The time by which the run should have returned
         """
         previous_state = self.config_last_result.get(name)
         obj = plugin(config, previous_state)
         obj.start()
+        if deadline and time.time() > deadline:
+            LOGGER.warning('%s config finished %.2f seconds past its deadline',
+                           name, time.time() - deadline)
         self.config_queue.put((name, obj.results()))
 
-    def thread_metric_process(self, name, plugin, config, poll_interval):
-        """Created a thread process for the given name, plugin class,
+    def thread_metric_process(self, name, plugin, config, poll_interval,
+                              deadline=None):
+        """Run a metric plugin on a worker for the given name, plugin class,
         config and poll interval. Process is added to a Queue object which
-        used to maintain the stack of running metrics plugins.
+        used to maintain the stack of running metrics plugins. Results from a
+        poll that returns after its deadline are dropped.
 
         :param str name: The unique instance name of the plugin
         :param newrelic_python_agent.plugins.base.Plugin plugin: The plugin class
         :param dict config: The plugin configuration
         :param int poll_interval: How often the plugin is invoked
+        :param float deadline: The time by which the poll should have returned
 
         """
-        obj = plugin(config, poll_interval,
-                     self.derive_last_interval.get(name))
+        if not self.breaker_allows(name):
+            return
+        start = time.time()
+        obj = self.create_plugin(name, plugin, config, poll_interval,
+                                 deadline)
         obj.poll()
-        self.publish_queue.put((name, obj.values(),
-                                obj.derive_last_interval))
+        self.record_poll(name, start, obj.timings)
+        self.publish_results(name, obj, deadline)
+
+    def coroutine_metric_process(self, name, plugin, config, poll_interval,
+                                 deadline=None):
+        """Run a metric plugin as a coroutine on the event loop, like
+        thread_metric_process.
+
+        :param str name: The unique instance name of the plugin
+        :param newrelic_python_agent.plugins.base.Plugin plugin: The plugin class
+        :param dict config: The plugin configuration
+        :param int poll_interval: How often the plugin is invoked
+        :param float deadline: The time by which the poll should have returned
+
+        """
+        if not self.breaker_allows(name):
+            return
+        start = time.time()
+        obj = self.create_plugin(name, plugin, config, poll_interval,
+                                 deadline)
+        yield obj.poll_async()
+        self.record_poll(name, start, obj.timings)
+        self.publish_results(name, obj, deadline)
+
+    def process_metric_process(self, name, plugin, config, poll_interval,
+                               deadline=None):
+        """Run a metric plugin in the process pool, like
+        thread_metric_process, waiting on a worker thread for the result.
+
+        :param str name: The unique instance name of the plugin
+        :param newrelic_python_agent.plugins.base.Plugin plugin: The plugin class
+        :param dict config: The plugin configuration
+        :param int poll_interval: How often the plugin is invoked
+        :param float deadline: The time by which the poll should have returned
+
+        """
+        if not self.breaker_allows(name):
+            return
+        start = time.time()
+        last_values = self.derive_last_interval.get(name)
+        if last_values is None:
+            last_values = state.DeriveStore()
+        last_values.advance()
+        future = self.processes.submit(processes.poll, plugin, config,
+                                       poll_interval, last_values, deadline)
+        packed, last_values, has_data, timings = future.result()
+        self.record_poll(name, start, timings)
+        self.save_last_values(name, last_values, has_data)
+        if self.on_time(name, deadline):
+            self.publish_queue.put((name, processes.unpack(packed)))
+
+    def create_plugin(self, name, plugin, config, poll_interval,
+                      deadline=None):
+        """Return a plugin instance for a poll, handing it the last values
+        of the derived metrics of the named instance, the poll's deadline,
+        which its request timeouts are capped at, and, for socket plugins,
+        its persistent connection.
+
+        :param str name: The unique instance name of the plugin
+        :param newrelic_python_agent.plugins.base.Plugin plugin: The plugin class
+        :param dict config: The plugin configuration
+        :param int poll_interval: How often the plugin is invoked
+        :param float deadline: The time by which the poll should have returned
+        :rtype: newrelic_python_agent.plugins.base.Plugin
+
+        """
+        last_values = self.derive_last_interval.get(name)
+        if last_values is None:
+            last_values = state.DeriveStore()
+        last_values.advance()
+        if issubclass(plugin, base.SocketStatsPlugin):
+            obj = plugin(config, poll_interval, last_values,
+                         self.persistent_connection(name, plugin, config))
+        else:
+            obj = plugin(config, poll_interval, last_values)
+        obj.deadline = deadline
+        return obj
+
+    def publish_results(self, name, obj, deadline=None):
+        """Save the derive history of a finished poll and queue its results
+        for upload, unless the poll returned after its deadline.
+
+        :param str name: The unique instance name of the plugin
+        :param newrelic_python_agent.plugins.base.Plugin obj: The plugin
+        :param float deadline: The time by which the poll should have returned
+
+        """
+        self.save_last_values(name, obj.derive_last_interval,
+                              obj.derive_values or obj.gauge_values)
+        if self.on_time(name, deadline):
+            self.publish_queue.put((name, obj.values()))
+
+    def save_last_values(self, name, last_values, has_data):
+        """Keep the derive history of a finished poll for the next poll of
+        the named instance, aging out unreported metrics if it returned data,
+        and record whether it did with the instance's circuit breaker.
+
+        :param str name: The unique instance name of the plugin
+        :param newrelic_python_agent.state.DeriveStore last_values: The
+            derive history
+        :param bool has_data: True if the poll returned any metrics
+
+        """
+        self.record_health(name, bool(has_data))
+        if has_data:
+            evicted = last_values.evict(self.stale_series_cycles)
+            if evicted:
+                LOGGER.debug('Removed last values for %i unreported metrics '
+                             'of %s', evicted, name)
+        # the next poll of this instance may start before the next upload,
+        # unless the instance was removed while it was being polled
+        if name in self.thread_names:
+            self.derive_last_interval[name] = last_values
+
+    def on_time(self, name, deadline):
+        """Return True unless a poll of the named instance returned after its
+        deadline, in which case its results are dropped.
+
+        :param str name: The unique instance name of the plugin
+        :param float deadline: The time by which the poll should have returned
+        :rtype: bool
+
+        """
+        if deadline and time.time() > deadline:
+            LOGGER.warning('%s poll finished %.2f seconds past its deadline, '
+                           'dropping results', name, time.time() - deadline)
+            self.stats.increment('Agent/Polls/Dropped', 'polls')
+            return False
+        return True
 
     @property
     def wake_interval(self):
@@ -0,0 +1,160 @@
+"""
+Payload Encoding
+
+Encode platform payloads as gzipped JSON in a single pass. Components, and
+the metrics of large components, are serialized in batches and written to
+the gzip stream in chunks, so the full uncompressed document is never held in
+memory and is only built once.
+
+"""
+import gzip
+import io
+import itertools
+import json
+
+import six
+
+CHUNK_SIZE = 65536
+COMPRESSION_LEVEL = 6
+COMPONENT_OVERHEAD = 128
+METRIC_OVERHEAD = 96
+METRICS_PER_BATCH = 500
+
+
+class CountingGzipWriter(object):
+    """Buffer encoded chunks and write them to a gzip stream, counting the
+    uncompressed bytes written.
+
+    :param int compresslevel: The zlib compression level (1-9)
+    :param int chunk_size: The number of bytes buffered between writes
+
+    """
+    def __init__(self, compresslevel=COMPRESSION_LEVEL, chunk_size=CHUNK_SIZE):
+        self.buffer = io.BytesIO()
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._chunks = list()
+        self._pending = 0
+        self._gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb',
+                                   compresslevel=compresslevel)
+
+    def write(self, chunk):
+        """Add an encoded chunk to the stream
+
+        :param str chunk: The JSON text to add
+
+        """
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf-8')
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Compress the buffered chunks"""
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._gzip.write(data)
+            self.size += len(data)
+            self._chunks = list()
+            self._pending = 0
+
+    def close(self):
+        """Finish the gzip stream and return the compressed bytes
+
+        :rtype: bytes
+
+        """
+        self.flush()
+        self._gzip.close()
+        return self.buffer.getvalue()
+
+
+def encode(agent_data, components, compresslevel=COMPRESSION_LEVEL):
+    """Return the platform payload for the components encoded as gzipped
+    JSON, along with the size of the JSON before compression.
+
+    :param dict agent_data: The agent section of the payload
+    :param list components: The component dicts to send
+    :param int compresslevel: The zlib compression level (1-9)
+    :rtype: tuple(bytes, int)
+
+    """
+    writer = CountingGzipWriter(compresslevel)
+    writer.write('{"agent": ')
+    writer.write(json.dumps(agent_data))
+    writer.write(', "components": [')
+    for offset, component in enumerate(components):
+        if offset:
+            writer.write(', ')
+        write_component(writer, component)
+    writer.write(']}')
+    return writer.close(), writer.size
+
+
+def estimate_size(component):
+    """Return an estimate of the number of bytes the component takes up in
+    the JSON payload before compression, without encoding it. Each metric is
+    counted as its name plus a fixed allowance for its value.
+
+    :param dict component: The component to estimate
+    :rtype: int
+
+    """
+    metrics = component.get('metrics') or dict()
+    return (COMPONENT_OVERHEAD + len(component.get('name') or '') +
+            sum(len(key) for key in metrics) +
+            METRIC_OVERHEAD * len(metrics))
+
+
+def split_component(component, max_metrics):
+    """Split a component into components that share its name and guid but
+    carry no more than max_metrics metrics each.
+
+    :param dict component: The component to split
+    :param int max_metrics: The most metrics to put in each part
+    :rtype: list
+
+    """
+    metrics = component.get('metrics') or dict()
+    if len(metrics) <= max_metrics:
+        return [component]
+    head = dict((key, value) for key, value in component.items()
+                if key != 'metrics')
+    items = six.iteritems(metrics)
+    parts = list()
+    batch = dict(itertools.islice(items, max_metrics))
+    while batch:
+        part = dict(head)
+        part['metrics'] = batch
+        parts.append(part)
+        batch = dict(itertools.islice(items, max_metrics))
+    return parts
+
+
+def write_component(writer, component):
+    """Write a component to the stream, serializing its metrics in batches
+    of METRICS_PER_BATCH when it has more than that.
+
+    :param CountingGzipWriter writer: The stream to write to
+    :param dict component: The component to write
+
+    """
+    metrics = component.get('metrics') or dict()
+    if len(metrics) <= METRICS_PER_BATCH:
+        writer.write(json.dumps(component))
+        return
+
+    head = dict((key, value) for key, value in component.items()
+                if key != 'metrics')
+    writer.write(json.dumps(head)[:-1])
+    writer.write(', "metrics": {' if head else '"metrics": {')
+    items = six.iteritems(metrics)
+    batch = dict(itertools.islice(items, METRICS_PER_BATCH))
+    while batch:
+        writer.write(json.dumps(batch)[1:-1])
+        batch = dict(itertools.islice(items, METRICS_PER_BATCH))
+        if batch:
+            writer.write(', ')
+    writer.write('}}')
@@ -0,0 +1,651 @@
+"""
+Event loop engine
+
+An opt-in alternative to running each poll on its own worker thread. Polls
+of plugins that support it are written as generator based coroutines and
+run together on a single event loop thread, waiting on non-blocking sockets
+instead of blocking a thread each. Plugins that still block, such as the
+database drivers, are run on the worker pool as before.
+
+A coroutine may yield:
+
+- another coroutine, to run it and receive its result. A coroutine returns
+  a result by raising Return(value).
+- a Wait, to resume once a socket is ready or raise socket.timeout.
+- a concurrent.futures.Future, to resume with its result.
+- a Blocking call, to run a blocking function on the worker pool.
+
+"""
+import base64
+import collections
+import errno
+import fcntl
+import heapq
+import inspect
+import itertools
+import json
+import logging
+import math
+import os
+import select
+import socket
+import ssl
+import sys
+import threading
+import time
+import types
+
+from concurrent import futures
+import six
+from six.moves.urllib import parse
+
+from newrelic_python_agent import __version__
+
+LOGGER = logging.getLogger(__name__)
+
+READ = select.POLLIN | select.POLLPRI
+WRITE = select.POLLOUT
+ERROR = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+DEFAULT_TIMEOUT = 10
+RECV_SIZE = 65536
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS)
+
+
+class Return(Exception):
+    """Raised by a coroutine to return a value to the coroutine waiting
+    on it.
+
+    """
+    def __init__(self, value=None):
+        super(Return, self).__init__()
+        self.value = value
+
+
+class Wait(object):
+    """Yielded by a coroutine to wait for a socket to be ready.
+
+    :param socket.socket sock: The socket to wait on
+    :param int events: READ or WRITE
+    :param float timeout: Seconds to wait before raising socket.timeout
+
+    """
+    __slots__ = ['sock', 'events', 'timeout']
+
+    def __init__(self, sock, events, timeout=None):
+        self.sock = sock
+        self.events = events
+        self.timeout = timeout
+
+
+class Blocking(object):
+    """Yielded by a coroutine to run a blocking function on the worker pool.
+
+    :param callable function: The function to run
+    :param list args: The arguments to invoke it with
+
+    """
+    __slots__ = ['function', 'args']
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+
+class Timer(object):
+    """A callback scheduled on the loop"""
+    __slots__ = ['callback', 'args', 'cancelled']
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Do not run the callback"""
+        self.cancelled = True
+
+    def run(self):
+        """Invoke the callback unless the timer was cancelled, which may
+        happen after it expired but before the loop got to it.
+
+        """
+        if not self.cancelled:
+            self.callback(*self.args)
+
+
+class Task(object):
+    """Run a coroutine on the loop until it returns.
+
+    :param EventLoop loop: The loop to run on
+    :param generator coroutine: The coroutine to run
+    :param callable callback: Invoked with the task once it has finished
+
+    """
+    def __init__(self, loop, coroutine, callback=None):
+        self.loop = loop
+        self.callback = callback
+        self.result = None
+        self.exc_info = None
+        self._stack = [coroutine]
+        self._fd = None
+        self._timer = None
+        loop.call_soon(self._step)
+
+    def _step(self, value=None, exc_info=None):
+        """Resume the innermost coroutine with a value or an exception,
+        until it yields something to wait on.
+
+        """
+        while True:
+            coroutine = self._stack[-1]
+            try:
+                if exc_info:
+                    yielded = coroutine.throw(*exc_info)
+                else:
+                    yielded = coroutine.send(value)
+            except Return as result:
+                value, exc_info = result.value, None
+            except StopIteration:
+                value, exc_info = None, None
+            except Exception:
+                value, exc_info = None, sys.exc_info()
+            else:
+                value, exc_info = None, None
+                if isinstance(yielded, types.GeneratorType):
+                    self._stack.append(yielded)
+                elif isinstance(yielded, Wait):
+                    return self._wait(yielded)
+                elif isinstance(yielded, futures.Future):
+                    return yielded.add_done_callback(self._future_done)
+                elif isinstance(yielded, Blocking):
+                    future = self.loop.run_in_executor(yielded.function,
+                                                       *yielded.args)
+                    return future.add_done_callback(self._future_done)
+                else:
+                    error = TypeError('Can not yield %r' % yielded)
+                    exc_info = TypeError, error, None
+                continue
+            self._stack.pop()
+            if not self._stack:
+                return self._finish(value, exc_info)
+
+    def _finish(self, value, exc_info):
+        self.result, self.exc_info = value, exc_info
+        self.loop.tasks.discard(self)
+        if self.callback:
+            self.callback(self)
+
+    def _future_done(self, future):
+        """Resume from the loop thread once the future has finished"""
+        self.loop.call_soon_threadsafe(self._resume_future, future)
+
+    def _resume_future(self, future):
+        error = future.exception()
+        if error is not None:
+            return self._step(None, (type(error), error, None))
+        self._step(future.result())
+
+    def _ready(self, _events):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._step()
+
+    def _timed_out(self):
+        self.loop.remove_waiter(self._fd)
+        self._timer = None
+        self._step(None, (socket.timeout, socket.timeout('timed out'), None))
+
+    def _wait(self, wait):
+        self._fd = wait.sock.fileno()
+        self.loop.add_waiter(self._fd, wait.events, self._ready)
+        if wait.timeout is not None:
+            self._timer = self.loop.call_later(wait.timeout, self._timed_out)
+
+
+class EventLoop(object):
+    """Run coroutines and callbacks on a single thread, waiting on sockets
+    with poll(2) so the number of sockets is not limited by FD_SETSIZE.
+
+    :param concurrent.futures.Executor executor: Where Blocking calls run
+
+    """
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.tasks = set()
+        self._poller = select.poll()
+        self._waiters = dict()
+        self._timers = list()
+        self._counter = itertools.count()
+        self._ready = collections.deque()
+        self._running = False
+        self._stopping = False
+        self._thread = None
+        self._wake_read, self._wake_write = os.pipe()
+        for fd in (self._wake_read, self._wake_write):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._poller.register(self._wake_read, READ)
+
+    def add_waiter(self, fd, events, callback):
+        """Invoke callback(events) once, the next time fd is ready.
+
+        :param int fd: The file descriptor to wait on
+        :param int events: READ or WRITE
+        :param callable callback: Invoked with the events that occurred
+
+        """
+        self._waiters[fd] = callback
+        self._poller.register(fd, events | ERROR)
+
+    def remove_waiter(self, fd):
+        """Stop waiting on fd
+
+        :param int fd: The file descriptor
+
+        """
+        if self._waiters.pop(fd, None):
+            self._poller.unregister(fd)
+
+    def call_later(self, delay, callback, *args):
+        """Invoke callback after delay seconds, from the loop thread.
+
+        :rtype: Timer
+
+        """
+        timer = Timer(callback, args)
+        heapq.heappush(self._timers, (time.time() + delay,
+                                      next(self._counter), timer))
+        return timer
+
+    def call_soon(self, callback, *args):
+        """Invoke callback on the next pass of the loop, from the loop
+        thread.
+
+        """
+        self._ready.append((callback, args))
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Invoke callback on the next pass of the loop, from any thread"""
+        self._ready.append((callback, args))
+        try:
+            os.write(self._wake_write, b'x')
+        except OSError as error:
+            if error.errno not in WOULD_BLOCK:
+                raise
+
+    def run_in_executor(self, function, *args):
+        """Run a blocking function on the executor
+
+        :rtype: concurrent.futures.Future
+
+        """
+        return self.executor.submit(function, *args)
+
+    def spawn(self, coroutine, callback=None):
+        """Start running a coroutine, from the loop thread.
+
+        :param generator coroutine: The coroutine to run
+        :param callable callback: Invoked with the Task when it finishes
+        :rtype: Task
+
+        """
+        task = Task(self, coroutine, callback)
+        self.tasks.add(task)
+        return task
+
+    def start(self):
+        """Run the loop on a background thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self.run_forever,
+                                        name='EventLoop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the loop once the running tasks have finished, waiting for
+        the loop thread to exit.
+
+        """
+        if not self._thread:
+            return
+        LOGGER.info('Waiting for %i event loop tasks', len(self.tasks))
+        self.call_soon_threadsafe(self._stop)
+        self._thread.join()
+        self._thread = None
+        for fd in (self._wake_read, self._wake_write):
+            os.close(fd)
+
+    def run_forever(self):
+        """Run until stopped"""
+        self._running = True
+        while self._running:
+            self._run_once()
+            if self._stopping and not self.tasks:
+                self._running = False
+
+    def _run_once(self):
+        """Wait for sockets or the next timer, then run everything that is
+        ready.
+
+        """
+        if self._ready:
+            timeout = 0
+        elif self._timers:
+            timeout = math.ceil(max(self._timers[0][0] - time.time(), 0) * 1000)
+        else:
+            timeout = None
+        try:
+            events = self._poller.poll(timeout)
+        except (select.error, IOError, OSError) as error:
+            if error.args[0] != errno.EINTR:
+                raise
+            events = list()
+        for fd, event in events:
+            if fd == self._wake_read:
+                self._drain_wakeups()
+                continue
+            callback = self._waiters.pop(fd, None)
+            if callback:
+                self._poller.unregister(fd)
+                self._ready.append((callback, (event,)))
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)[2]
+            if not timer.cancelled:
+                self._ready.append((timer.run, ()))
+        for _offset in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            try:
+                callback(*args)
+            except Exception as error:
+                LOGGER.exception('Error in event loop callback: %s', error)
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except OSError as error:
+            if error.errno not in WOULD_BLOCK:
+                raise
+
+    def _stop(self):
+        self._stopping = True
+
+
+class LoopExecutor(object):
+    """An executor for the Scheduler that runs generator functions as
+    coroutines on the event loop and everything else on a fallback
+    executor.
+
+    :param EventLoop loop: The loop to run coroutines on
+    :param concurrent.futures.Executor executor: Where other work runs
+
+    """
+    def __init__(self, loop, executor):
+        self.loop = loop
+        self.executor = executor
+
+    def submit(self, function, *args, **kwargs):
+        """Schedule function to be run
+
+        :rtype: concurrent.futures.Future
+
+        """
+        if not inspect.isgeneratorfunction(function):
+            return self.executor.submit(function, *args, **kwargs)
+        future = futures.Future()
+
+        def finished(task):
+            if task.exc_info:
+                future.set_exception(task.exc_info[1])
+            else:
+                future.set_result(task.result)
+
+        def start():
+            if future.set_running_or_notify_cancel():
+                self.loop.spawn(function(*args, **kwargs), finished)
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+
+class Response(object):
+    """The parts of an HTTP response the plugins use, compatible with
+    requests.Response.
+
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    __nonzero__ = __bool__
+
+    def json(self):
+        """Return the decoded JSON body"""
+        return json.loads(self.content)
+
+
+def connect(address, family=socket.AF_INET, timeout=DEFAULT_TIMEOUT):
+    """Coroutine returning a non-blocking socket connected to address.
+    Host names are resolved on the worker pool.
+
+    :param address: A (host, port) tuple or UNIX socket path
+    :param int family: The socket family
+    :param float timeout: The connect timeout
+    :rtype: socket.socket
+
+    """
+    if family != socket.AF_UNIX and not _is_address(address[0]):
+        addresses = yield Blocking(socket.getaddrinfo, address[0], address[1],
+                                   socket.AF_UNSPEC, socket.SOCK_STREAM)
+        family, _type, _proto, _name, address = addresses[0]
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        result = sock.connect_ex(address)
+        if result in WOULD_BLOCK:
+            yield Wait(sock, WRITE, timeout)
+            result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if result:
+            raise socket.error(result, os.strerror(result))
+    except Exception:
+        sock.close()
+        raise
+    raise Return(sock)
+
+
+def start_tls(sock, server_hostname, verify=True, timeout=DEFAULT_TIMEOUT):
+    """Coroutine returning the socket wrapped for TLS once the handshake has
+    completed.
+
+    :param socket.socket sock: The connected socket
+    :param str server_hostname: The host name to verify the certificate for
+    :param verify: False, True or the path to a CA bundle
+    :param float timeout: The handshake timeout
+    :rtype: ssl.SSLSocket
+
+    """
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif isinstance(verify, six.string_types):
+        context.load_verify_locations(verify)
+    sock = context.wrap_socket(sock, server_hostname=server_hostname,
+                               do_handshake_on_connect=False)
+    while True:
+        try:
+            sock.do_handshake()
+            break
+        except ssl.SSLWantReadError:
+            yield Wait(sock, READ, timeout)
+        except ssl.SSLWantWriteError:
+            yield Wait(sock, WRITE, timeout)
+    raise Return(sock)
+
+
+def recv(sock, size=RECV_SIZE, timeout=DEFAULT_TIMEOUT):
+    """Coroutine returning the next data received on sock, or an empty
+    string once the peer has closed the connection.
+
+    :rtype: bytes
+
+    """
+    while True:
+        try:
+            data = sock.recv(size)
+        except (ssl.SSLZeroReturnError, ssl.SSLEOFError):
+            data = b''
+        except ssl.SSLWantReadError:
+            yield Wait(sock, READ, timeout)
+            continue
+        except ssl.SSLWantWriteError:
+            yield Wait(sock, WRITE, timeout)
+            continue
+        except socket.error as error:
+            if error.args[0] not in WOULD_BLOCK:
+                raise
+            yield Wait(sock, READ, timeout)
+            continue
+        raise Return(data)
+
+
+def sendall(sock, data, timeout=DEFAULT_TIMEOUT):
+    """Coroutine sending all of data on sock"""
+    data = memoryview(data)
+    while data:
+        try:
+            data = data[sock.send(data):]
+        except ssl.SSLWantReadError:
+            yield Wait(sock, READ, timeout)
+        except ssl.SSLWantWriteError:
+            yield Wait(sock, WRITE, timeout)
+        except socket.error as error:
+            if error.args[0] not in WOULD_BLOCK:
+                raise
+            yield Wait(sock, WRITE, timeout)
+
+
+def read_response(sock, complete=None, timeout=DEFAULT_TIMEOUT,
+                  max_size=None):
+    """Coroutine returning the data received on sock until complete(data)
+    returns True or the peer closes the connection.
+
+    :param socket.socket sock: The socket to read from
+    :param callable complete: Returns True when all of the data is received
+    :param float timeout: The timeout for each read
+    :param int max_size: Stop reading after this many bytes
+    :rtype: bytes
+
+    """
+    chunks = list()
+    size = 0
+    while True:
+        chunk = yield recv(sock, RECV_SIZE, timeout)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+        if max_size and size >= max_size:
+            break
+        if complete and complete(b''.join(chunks)):
+            break
+    raise Return(b''.join(chunks))
+
+
+def http_get(url, params=None, auth=None, verify=True,
+             timeout=DEFAULT_TIMEOUT):
+    """Coroutine performing an HTTP GET of url on a new connection.
+
+    :param str url: The URL to fetch
+    :param dict params: Query string parameters to add to the URL
+    :param tuple auth: Username and password for basic authentication
+    :param verify: False, True or the path to a CA bundle
+    :param timeout: Seconds, or a (connect, read) tuple
+    :rtype: Response
+
+    """
+    connect_timeout, read_timeout = (timeout if isinstance(timeout, tuple)
+                                     else (timeout, timeout))
+    parts = parse.urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    target = parts.path or '/'
+    query = '&'.join(value for value in
+                     (parts.query, parse.urlencode(params or {})) if value)
+    if query:
+        target += '?' + query
+    headers = ['GET %s HTTP/1.0' % target,
+               'Host: %s' % parts.netloc.rsplit('@', 1)[-1],
+               'User-Agent: newrelic-python-agent/%s' % __version__,
+               'Accept-Encoding: identity',
+               'Connection: close']
+    if auth:
+        token = base64.b64encode(('%s:%s' % auth).encode('utf-8'))
+        headers.append('Authorization: Basic %s' % token.decode('ascii'))
+    request = ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8')
+
+    sock = yield connect((parts.hostname, port), timeout=connect_timeout)
+    try:
+        if secure:
+            sock = yield start_tls(sock, parts.hostname, verify,
+                                   connect_timeout)
+        yield sendall(sock, request, read_timeout)
+        data = yield read_response(sock, timeout=read_timeout)
+    finally:
+        sock.close()
+    raise Return(parse_http_response(data))
+
+
+def parse_http_response(data):
+    """Return a Response for the raw HTTP response
+
+    :param bytes data: The response as received
+    :rtype: Response
+
+    """
+    head, _sep, body = data.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = lines[0].split(' ', 2)
+    if len(status) < 2 or not status[0].startswith('HTTP/'):
+        raise socket.error('Malformed HTTP response: %r' % lines[0][:80])
+    headers = dict()
+    for line in lines[1:]:
+        key, _sep, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = _dechunk(body)
+    return Response(int(status[1]), headers, body)
+
+
+def _dechunk(body):
+    """Return a chunked transfer encoded body decoded"""
+    chunks = list()
+    offset = 0
+    while True:
+        end = body.find(b'\r\n', offset)
+        if end < 0:
+            break
+        size = int(body[offset:end].split(b';')[0], 16)
+        if not size:
+            break
+        chunks.append(body[end + 2:end + 2 + size])
+        offset = end + 4 + size
+    return b''.join(chunks)
+
+
+def _is_address(host):
+    """Return True if host is an IP address rather than a name"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (socket.error, ValueError):
+            pass
+    return False
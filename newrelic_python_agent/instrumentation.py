@@ -0,0 +1,213 @@
+"""
+Self-instrumentation
+
+The agent records where it spends its time, such as how long each poll
+took, how large each payload was and how many polls were late or dropped,
+in a Recorder shared by the scheduler, worker, event loop and uploader
+threads. Once per wake interval the recorded values are collected into
+NewRelic metric payloads, which the agent reports as a component of its
+own next to the components of the plugins.
+
+"""
+import bisect
+import threading
+
+import six
+
+BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Summary(object):
+    """The count, total, minimum, maximum and sum of squares of the values
+    observed for a metric, optionally counting them in buckets.
+
+    :param tuple buckets: The upper bound of each bucket, in ascending order
+
+    """
+    __slots__ = ['buckets', 'counts', 'count', 'total', 'min', 'max',
+                 'sum_of_squares']
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) if buckets else None
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sum_of_squares = 0
+
+    def add(self, value):
+        """Add an observed value
+
+        :param float value: The value
+
+        """
+        self.count += 1
+        self.total += value
+        self.sum_of_squares += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.counts is not None:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+
+    def payload(self):
+        """Return the summary in the NewRelic metric payload format
+
+        :rtype: dict
+
+        """
+        return {'min': self.min,
+                'max': self.max,
+                'total': self.total,
+                'count': self.count,
+                'sum_of_squares': self.sum_of_squares}
+
+    def bucket_payloads(self):
+        """Return the count of each bucket that values fell in, keyed by
+        the label of the bucket.
+
+        :rtype: dict
+
+        """
+        payloads = dict()
+        for offset, count in enumerate(self.counts or ()):
+            if not count:
+                continue
+            if offset < len(self.buckets):
+                label = '%s' % self.buckets[offset]
+            else:
+                label = 'Over %s' % self.buckets[-1]
+            payloads[label] = {'min': count, 'max': count, 'total': count,
+                               'count': 1, 'sum_of_squares': count * count}
+        return payloads
+
+
+class Recorder(object):
+    """Record timings, sizes, counts and levels from any thread, to be
+    collected as metric payloads once per wake interval.
+
+    Metric names are given without the ``Component/`` prefix and units,
+    as they are for ``Plugin.add_gauge_value``.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summaries = dict()
+        self._counters = dict()
+        self._gauges = dict()
+        self._totals = dict()
+
+    def timing(self, name, seconds, histogram=False):
+        """Record a duration, reported in milliseconds
+
+        :param str name: The metric name
+        :param float seconds: The duration in seconds
+        :param bool histogram: Also count the duration in BUCKETS
+
+        """
+        self.observe(name, 'ms', seconds * 1000,
+                     BUCKETS if histogram else None)
+
+    def observe(self, name, units, value, buckets=None):
+        """Record a value, reported as the count, total, minimum and maximum
+        of the values recorded in the interval.
+
+        :param str name: The metric name
+        :param str units: The unit type
+        :param float value: The value
+        :param tuple buckets: The upper bound of each histogram bucket
+
+        """
+        key = name, units
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary(buckets)
+            summary.add(value)
+
+    def increment(self, name, units, count=1):
+        """Add to a count that is reported and reset every interval
+
+        :param str name: The metric name
+        :param str units: The unit type
+        :param int count: The amount to add
+
+        """
+        key = name, units
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def total(self, name, units, value):
+        """Record a running total kept elsewhere, such as the uploader's
+        count of failed uploads, reporting how much it grew in the interval.
+
+        :param str name: The metric name
+        :param str units: The unit type
+        :param int value: The running total
+
+        """
+        key = name, units
+        with self._lock:
+            previous = self._totals.get(key)
+            self._totals[key] = value
+            if previous is not None and value >= previous:
+                self._counters[key] = (self._counters.get(key, 0) +
+                                       value - previous)
+
+    def gauge(self, name, units, value):
+        """Record the current level of something, such as a queue depth
+
+        :param str name: The metric name
+        :param str units: The unit type
+        :param float value: The value
+
+        """
+        with self._lock:
+            self._gauges[(name, units)] = value
+
+    def collect(self):
+        """Return the metric payloads for everything recorded since the last
+        collection and start a new interval.
+
+        :rtype: dict
+
+        """
+        with self._lock:
+            summaries, self._summaries = self._summaries, dict()
+            counters, self._counters = self._counters, dict()
+            gauges, self._gauges = self._gauges, dict()
+        metrics = dict()
+        for (name, units), summary in six.iteritems(summaries):
+            metrics[metric_name(name, units)] = summary.payload()
+            for label, payload in six.iteritems(summary.bucket_payloads()):
+                metrics[metric_name('%s/Histogram/%s' % (name, label),
+                                    'samples')] = payload
+        for (name, units), value in six.iteritems(counters):
+            metrics[metric_name(name, units)] = gauge_payload(value)
+        for (name, units), value in six.iteritems(gauges):
+            metrics[metric_name(name, units)] = gauge_payload(value)
+        return metrics
+
+
+def gauge_payload(value):
+    """Return a single value in the NewRelic metric payload format
+
+    :param float value: The value
+    :rtype: dict
+
+    """
+    return {'min': value, 'max': value, 'total': value, 'count': 1,
+            'sum_of_squares': value * value}
+
+
+def metric_name(name, units):
+    """Return the metric name in the format for the NewRelic platform
+
+    :param str name: The metric name
+    :param str units: The unit type
+    :rtype: str
+
+    """
+    return 'Component/%s[%s]' % (name, units)
@@ -5,15 +5,93 @@ Base Plugin Classes
 import csv
 import logging
 from os import path
+import random
 import requests
+import select
 import socket
 import tempfile
+import threading
 import time
 import urlparse
 import six
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from newrelic_python_agent import eventloop
+from newrelic_python_agent import state
+
 LOGGER = logging.getLogger(__name__)
 
+# the fewest values derived with NumPy, below which plain Python is faster
+NUMPY_MIN_VALUES = 32
+
+
+def derive(current, previous, timestamps, now, rate=False):
+    """Return the change from each previous value to its current value with
+    NumPy, divided by the seconds since the previous value's timestamp if
+    rate is set. A rate whose duration is not positive is returned as None.
+
+    :param list current: The values read now
+    :param list previous: The values read at the previous poll
+    :param list timestamps: When each previous value was read
+    :param float now: When the current values were read
+    :param bool rate: Return the change per second
+    :rtype: list
+
+    """
+    current, previous = _numeric_array(current), _numeric_array(previous)
+    if current.dtype != previous.dtype:
+        # an int64 and a float64 column would subtract as float64
+        current, previous = (current.astype(object),
+                             previous.astype(object))
+    deltas = current - previous
+    if not rate:
+        return deltas.tolist()
+    durations = now - numpy.asarray(timestamps, dtype=float)
+    valid = durations > 0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rates = deltas / numpy.where(valid, durations, 1.0)
+    return [value if ok else None
+            for value, ok in zip(rates.tolist(), valid.tolist())]
+
+
+def _numeric_array(values):
+    """Return values as a NumPy array, as Python objects unless they are
+    all signed integers or all floats, so unsigned 64 bit counters,
+    booleans and integers too large for a float subtract as they do in
+    Python
+
+    """
+    array = numpy.asarray(values)
+    if array.dtype.kind == 'f' and \
+            not all(isinstance(value, float) for value in values):
+        # a mix of ints and floats, which float64 would round
+        array = numpy.asarray(values, dtype=object)
+    elif array.dtype.kind not in 'if':
+        array = numpy.asarray(values, dtype=object)
+    return array
+
+
+def connection_alive(connection):
+    """Return True if a socket that was left idle can be used for another
+    request. A socket that is readable while no request is outstanding has
+    either been closed by the server or holds data nothing asked for, so it
+    is not.
+
+    :param socket.socket connection: The socket
+    :rtype: bool
+
+    """
+    try:
+        poller = select.poll()
+        poller.register(connection, select.POLLIN | select.POLLPRI)
+        return not poller.poll(0)
+    except (socket.error, ValueError):
+        return False
+
 
 class PluginLogger(logging.LoggerAdapter):
     """
@@ -97,20 +175,355 @@ class ConfigPlugin(object):
         self.state['application'][name] = data
 
 
+class CircuitBreaker(object):
+    """Stop polling an instance that keeps failing. Once threshold polls in
+    a row have returned no data the breaker opens and polls are skipped for
+    a backoff, starting at backoff seconds and doubling up to max_backoff
+    each time it opens again, with jitter so instances that failed together
+    are not retried together. The first poll after the backoff is a trial
+    (half open): if it returns data the breaker closes, otherwise it opens
+    for the next backoff.
+
+    :param int threshold: The failed polls in a row that open the breaker
+    :param float backoff: The first backoff in seconds
+    :param float max_backoff: The longest backoff in seconds
+
+    """
+    CLOSED = 'closed'
+    HALF_OPEN = 'half-open'
+    OPEN = 'open'
+
+    HEALTH = {CLOSED: 1, HALF_OPEN: 0.5, OPEN: 0}
+
+    def __init__(self, threshold, backoff, max_backoff):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0
+
+    def allow(self):
+        """Return True if the instance should be polled now, moving an open
+        breaker to half open once its backoff has passed.
+
+        :rtype: bool
+
+        """
+        if self.state == self.OPEN:
+            if time.time() < self.retry_at:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    def record(self, success):
+        """Record the outcome of a poll
+
+        :param bool success: True if the poll returned data
+
+        """
+        if success:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            delay = min(float(self.backoff) * 2 ** min(self.opened, 32),
+                        self.max_backoff)
+            self.retry_at = time.time() + delay / 2 + random.uniform(
+                0, delay / 2)
+            self.opened += 1
+            self.state = self.OPEN
+
+    @property
+    def health(self):
+        """Return 1 while the breaker is closed, 0.5 while it is half open
+        and 0 while it is open.
+
+        :rtype: float
+
+        """
+        return self.HEALTH[self.state]
+
+
+class Accumulator(object):
+    """The count, total, minimum, maximum, sum of squares and spread of a
+    stream of values, updated one value at a time so no values are kept. The
+    spread is kept with Welford's method, the sum of squares exactly.
+    Accumulators for parts of the stream, such as the queues of each node,
+    can be merged into one for the whole stream. Pass an accumulator to
+    Plugin.metric_payload or Plugin.add_gauge_value to report it.
+
+    :param iter values: Values to add straight away
+
+    """
+    __slots__ = ['count', 'total', 'squares', 'min', 'max', 'mean',
+                 'deviations']
+
+    def __init__(self, values=None):
+        self.count = 0
+        self.total = 0
+        self.squares = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.deviations = 0.0
+        for value in values or ():
+            self.add(value)
+
+    def add(self, value):
+        """Add a value
+
+        :param int value: The value
+
+        """
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+        delta = value - self.mean
+        self.mean += delta / float(self.count)
+        self.deviations += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the values of another accumulator, returning this one
+
+        :param Accumulator other: The accumulator to merge
+        :rtype: Accumulator
+
+        """
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.deviations += (other.deviations +
+                            delta * delta * self.count * other.count / count)
+        self.mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        self.squares += other.squares
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        return self
+
+    @property
+    def sum_of_squares(self):
+        """Return the sum of the squares of the values
+
+        :rtype: int or float
+
+        """
+        return self.squares
+
+
+class PersistentConnection(object):
+    """A socket kept open between the polls of a SocketStatsPlugin instance.
+    The agent holds it for the instance, so it outlives the plugin object
+    created for each poll. A poll acquires the socket and releases it once
+    the response has been read, and a socket the server has closed in
+    between is not handed out again.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._socket = None
+        self.closed = False
+
+    def acquire(self):
+        """Return the open socket, or None if there is none or it is no
+        longer alive
+
+        :rtype: socket.socket
+
+        """
+        with self._lock:
+            connection, self._socket = self._socket, None
+        if connection is not None and not connection_alive(connection):
+            LOGGER.debug('Discarding persistent connection closed by the '
+                         'server')
+            connection.close()
+            connection = None
+        return connection
+
+    def release(self, connection):
+        """Keep the socket open for the next poll, closing it instead if
+        the instance was removed while it was being polled
+
+        :param socket.socket connection: The socket
+
+        """
+        with self._lock:
+            if not self.closed and self._socket is None:
+                self._socket, connection = connection, None
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """Close the socket and stop keeping sockets open"""
+        with self._lock:
+            self.closed = True
+            connection, self._socket = self._socket, None
+        if connection is not None:
+            connection.close()
+
+
+class MetricSchema(object):
+    """The fixed set of metrics a plugin class reports, compiled once so a
+    poll only fills in a row of values. Each metric has a slot in the row,
+    holding the value of a key in the stats the plugin reads, and the full
+    metric names are built and interned ahead of time.
+
+    A key may be a path into nested stats, such as those decoded from JSON,
+    given as a tuple of keys or as a string of keys joined by dots. The
+    paths are compiled into nested extractors that fill a row from the
+    stats in one walk. Only numbers are read, and a value read with a scale
+    is divided by it, without flooring an int.
+
+    The kind of a metric is gauge, derive or rate, as reported by
+    add_gauge_value, add_derive_value and add_derive_value with rate set,
+    or None for a value kept in the row for the plugin to use but not
+    reported.
+
+    :param list metrics: ``(key, metric_name, units, kind)`` or
+        ``(key, metric_name, units, kind, scale)`` tuples
+    :param callable metric_name: Returns the full name for a metric name
+        and units
+
+    """
+    KINDS = ('gauge', 'derive', 'rate', None)
+
+    def __init__(self, metrics, metric_name):
+        self.keys = list()
+        self.names = list()
+        self.units = list()
+        self.kinds = list()
+        self.scales = list()
+        self.slots = dict()
+        for metric in metrics:
+            key, name, units, kind = metric[:4]
+            if kind not in self.KINDS:
+                raise ValueError('Unknown kind %r for %s' % (kind, key))
+            self.slots.setdefault(key, len(self.keys))
+            self.keys.append(key)
+            if kind is not None:
+                name = metric_name(name, units)
+                if isinstance(name, str):
+                    name = six.moves.intern(name)
+            self.names.append(name)
+            self.units.append(units)
+            self.kinds.append(kind)
+            self.scales.append(metric[4] if len(metric) > 4 else None)
+        self.gauges = self.kind_slots('gauge')
+        self.derives = self.kind_slots('derive')
+        self.rates = self.kind_slots('rate')
+        self.empty = [None] * len(self.keys)
+        self.extract = self.extractor(self.tree())
+
+    def kind_slots(self, kind):
+        """Return the slots of the metrics of a kind
+
+        :param str kind: gauge, derive or rate
+        :rtype: list
+
+        """
+        return [slot for slot, value in enumerate(self.kinds)
+                if value == kind]
+
+    def tree(self):
+        """Return the key paths as a tree of ``[children, slots]`` by key
+
+        :rtype: dict
+
+        """
+        tree = dict()
+        for slot, key in enumerate(self.keys):
+            path = key.split('.') if isinstance(key, six.string_types) \
+                else key
+            node = tree
+            for part in path[:-1]:
+                node = node.setdefault(part, [dict(), list()])[0]
+            node.setdefault(path[-1], [dict(), list()])[1].append(slot)
+        return tree
+
+    def extractor(self, tree):
+        """Return a function that copies the values of the slots in the tree
+        from the stats it is passed into a row
+
+        :param dict tree: A tree returned by tree
+        :rtype: callable
+
+        """
+        numbers = six.integer_types + (float,)
+        leaves = [(key, [(slot, self.scales[slot]) for slot in slots])
+                  for key, (children, slots) in tree.items() if slots]
+        branches = [(key, self.extractor(children))
+                    for key, (children, slots) in tree.items() if children]
+
+        def extract(stats, row):
+            for key, slots in leaves:
+                value = stats.get(key)
+                if isinstance(value, numbers):
+                    for slot, scale in slots:
+                        row[slot] = value if scale is None else \
+                            value / float(scale)
+            for key, branch in branches:
+                value = stats.get(key)
+                if isinstance(value, dict):
+                    branch(value, row)
+        return extract
+
+    def row(self, stats=None, default=None):
+        """Return a new row, with every value default or taken from stats
+
+        :param dict stats: The stats to read the values from
+        :param mixed default: The value of the slots not in stats
+        :rtype: list
+
+        """
+        row = list(self.empty) if default is None else \
+            [default] * len(self.keys)
+        if stats is not None:
+            self.extract(stats, row)
+        return row
+
+
 class Plugin(object):
 
+    # set to True on plugins that implement poll_async
+    ASYNC = False
+    # failed polls in a row before an instance is backed off, 0 to never
+    BREAKER_THRESHOLD = 3
+    BREAKER_MAX_BACKOFF = 1800
+    DEFAULT_TIMEOUT = 10
     GUID = 'com.meetme.newrelic_python_agent'
     MAX_VAL = 2147483647
+    # the shortest timeout given to a poll that is at or past its deadline
+    MIN_TIMEOUT = 0.1
+    # (key, metric_name, units, kind) for plugins reporting a fixed set of
+    # metrics, compiled into a MetricSchema
+    SCHEMA = None
 
     def __init__(self, config, poll_interval, last_interval_values=None):
         self.config = config
         LOGGER.debug('%s config: %r', self.__class__.__name__, self.config)
         self.poll_interval = poll_interval
         self.poll_start_time = 0
+        # set by the agent to the time by which the poll should have returned
+        self.deadline = None
 
         self.derive_values = dict()
-        self.derive_last_interval = last_interval_values or dict()
+        if last_interval_values is None:
+            last_interval_values = state.DeriveStore()
+        self.derive_last_interval = last_interval_values
         self.gauge_values = dict()
+        self.timings = dict()
 
     def add_datapoints(self, data):
         """Extend this method to process the data points retrieved during the
@@ -136,30 +549,81 @@ class Plugin(object):
         :param bool rate: Calculate value as rate since last value (/sec)
 
         """
-        if value is None:
-            value = 0
-        metric = self.metric_name(metric_name, units)
-        if metric not in self.derive_last_interval.keys():
-            LOGGER.debug('Bypassing initial %s value for first run', metric)
-            self.derive_values[metric] = self.metric_payload(0, count=0)
+        self.add_derive_values([(metric_name, units, value)], count=count,
+                               rate=rate)
+
+    def add_derive_values(self, metrics, units=None, count=None, rate=False):
+        """Add many values read at the same time, deriving each from the
+        difference between its last interval value and its current value,
+        as add_derive_value does for a single value. All of the values share
+        one timestamp, and when NumPy is installed a large batch is derived
+        in one vectorized pass.
+
+        :param metrics: The values by metric name, all in units, or a list
+            of ``(metric_name, units, value)`` tuples
+        :type metrics: dict or list
+        :param str units: The unit type when metrics is a dict
+        :param int count: The number of items the timings are for
+        :param bool rate: Calculate values as rates since last values (/sec)
+
+        """
+        if isinstance(metrics, dict):
+            metrics = [(self.metric_name(metric_name, units), value)
+                       for metric_name, value in six.iteritems(metrics)]
         else:
-            pvalue, ptimestamp = self.derive_last_interval[metric]
-            cval = value - pvalue
-            if rate:
-                duration = time.time() - ptimestamp
-                if duration > 0:
-                    cval = cval / duration
-                else:
-                    LOGGER.warning('Duration (%.3f) for %s metric is not at least 1 second.', duration, metric)
-                    cval = None
-
-            if cval is not None:
-                self.derive_values[metric] = self.metric_payload(cval, count=count)
+            metrics = [(self.metric_name(metric_name, metric_units), value)
+                       for metric_name, metric_units, value in metrics]
+        self.add_metric_derive_values(metrics, count, rate)
+
+    def add_metric_derive_values(self, metrics, count=None, rate=False):
+        """Derive values read at the same time for metrics whose full names
+        have already been built, such as those of a MetricSchema.
+
+        :param list metrics: ``(metric, value)`` tuples
+        :param int count: The number of items the timings are for
+        :param bool rate: Calculate values as rates since last values (/sec)
+
+        """
+        now = time.time()
+        store = self.derive_last_interval
+        vectorize = numpy is not None and len(metrics) >= NUMPY_MIN_VALUES
+        derived = list()
+        for metric, value in metrics:
+            if value is None:
+                value = 0
+            last = store.get(metric)
+            # store the value and the current timestamp
+            store.record(metric, value, now)
+            if last is None:
+                LOGGER.debug('Bypassing initial %s value for first run',
+                             metric)
+                self.derive_values[metric] = self.metric_payload(0, count=0)
+                continue
+            pvalue, ptimestamp = last
+            cval = None
+            if not vectorize:
+                cval = value - pvalue
+                if rate:
+                    cval = cval / (now - ptimestamp) \
+                        if now > ptimestamp else None
+            derived.append([metric, value, pvalue, ptimestamp, cval])
+        if vectorize and derived:
+            columns = list(zip(*derived))
+            for row, cval in zip(derived, derive(columns[1], columns[2],
+                                                 columns[3], now, rate)):
+                row[4] = cval
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        for metric, value, pvalue, ptimestamp, cval in derived:
+            if cval is None:
+                LOGGER.warning('Duration (%.3f) for %s metric is not at '
+                               'least 1 second.', now - ptimestamp, metric)
+                continue
+            self.derive_values[metric] = self.metric_payload(cval,
+                                                             count=count)
+            if debug:
                 LOGGER.debug('%s: Last: %r, Current: %r, Reporting: %r',
-                             metric, self.derive_last_interval[metric][0], value,
+                             metric, pvalue, value,
                              self.derive_values[metric])
-        # store the value and the current timestamp
-        self.derive_last_interval[metric] = [value, time.time()]
 
     def add_derive_timing_value(self, metric_name, units, count, total_value,
                                 last_value=None):
@@ -181,6 +645,35 @@ class Plugin(object):
         self.add_derive_value('%s/Last' % metric_name,
                               units, last_value, count)
 
+    def add_schema_values(self, row):
+        """Report a row of values filled in the slots of the plugin class's
+        SCHEMA. Values left as None are not reported.
+
+        :param list row: The values, from MetricSchema.row
+
+        """
+        schema = self.metric_schema()
+        names = schema.names
+        for slot in schema.gauges:
+            if row[slot] is not None:
+                self.gauge_values[names[slot]] = self.metric_payload(row[slot])
+        for slots, rate in ((schema.derives, False), (schema.rates, True)):
+            if slots:
+                self.add_metric_derive_values([(names[slot], row[slot])
+                                               for slot in slots
+                                               if row[slot] is not None],
+                                              rate=rate)
+
+    def add_timing(self, phase, start):
+        """Add the time since start to the named phase of the poll, such as
+        fetch, parse or derive, reported by the agent's self-instrumentation.
+
+        :param str phase: The phase of the poll
+        :param float start: When the phase started
+
+        """
+        self.timings[phase] = self.timings.get(phase, 0) + time.time() - start
+
     def add_gauge_value(self, metric_name, units, value,
                         min_val=None, max_val=None, count=None,
                         sum_of_squares=None):
@@ -189,7 +682,7 @@ class Plugin(object):
 
         :param str metric_name: The name of the metric
         :param str units: The unit type
-        :param int value: The value to add
+        :param int value: The value to add, or an Accumulator of values
         :param float value: The sum of squares for the values
 
         """
@@ -265,14 +758,47 @@ class Plugin(object):
             return 'Component/%s' % metric
         return 'Component/%s[%s]' % (metric, units)
 
+    def metric_schema(self):
+        """Return the SCHEMA of the plugin class compiled into a
+        MetricSchema, compiling it the first time it is used. Metrics listed
+        in the ``extra_metrics`` setting of the instance, each with a
+        ``path``, ``name`` and optional ``units``, ``kind`` and ``scale``,
+        are added to it.
+
+        :rtype: MetricSchema
+
+        """
+        cls = type(self)
+        extra = self.config.get('extra_metrics')
+        key = repr(extra) if extra else None
+        schemas = cls.__dict__.get('_metric_schemas')
+        if schemas is None:
+            schemas = cls._metric_schemas = dict()
+        schema = schemas.get(key)
+        if schema is None:
+            metrics = list(cls.SCHEMA or [])
+            for metric in extra or []:
+                metrics.append((metric['path'], metric['name'],
+                                metric.get('units'),
+                                metric.get('kind', 'gauge'),
+                                metric.get('scale')))
+            schema = schemas[key] = MetricSchema(metrics, self.metric_name)
+        return schema
+
     def metric_payload(self, value, min_value=None, max_value=None, count=None,
                        squares=None):
         """Return the metric in the standard payload format for the NewRelic
-        agent.
+        agent. The value may be an Accumulator, whose count, total, minimum,
+        maximum and sum of squares are reported.
 
         :rtype: dict
 
         """
+        if isinstance(value, Accumulator):
+            value, min_value, max_value, count, squares = (
+                value.total, value.min, value.max, value.count,
+                value.sum_of_squares)
+
         if not value:
             value = 0
 
@@ -305,6 +831,35 @@ class Plugin(object):
         """
         raise NotImplementedError
 
+    def timeouts(self):
+        """Return the seconds to wait for the connection to be made and for
+        each read, set by ``connect_timeout`` and ``read_timeout`` or both
+        by ``timeout``, which may also be a ``[connect, read]`` pair. Neither
+        is longer than the time left until the poll's deadline.
+
+        :rtype: tuple(float, float)
+
+        """
+        timeout = self.config.get('timeout', self.DEFAULT_TIMEOUT)
+        if isinstance(timeout, (list, tuple)):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        connect_timeout = self.config.get('connect_timeout', connect_timeout)
+        read_timeout = self.config.get('read_timeout', read_timeout)
+        if self.deadline is not None:
+            remaining = max(self.deadline - time.time(), self.MIN_TIMEOUT)
+            connect_timeout = min(connect_timeout, remaining)
+            read_timeout = min(read_timeout, remaining)
+        return connect_timeout, read_timeout
+
+    def poll_async(self):
+        """Poll the server without blocking, as a coroutine run by the
+        event loop engine. Plugins implementing this set ASYNC to True.
+
+        """
+        raise NotImplementedError
+
     def sum_of_squares(self, values):
         """Return the sum_of_squares for the given values
 
@@ -312,13 +867,10 @@ class Plugin(object):
         :rtype: float
 
         """
-        value_sum = sum(values)
-        if not value_sum:
+        accumulator = Accumulator(values)
+        if not accumulator.total:
             return 0
-        squares = list()
-        for value in values:
-            squares.append(value * value)
-        return sum(squares) - float(value_sum * value_sum) / len(values)
+        return accumulator.deviations
 
     def values(self):
         """Return the poll results
@@ -330,18 +882,63 @@ class Plugin(object):
 
 
 class SocketStatsPlugin(Plugin):
-    """Connect to a socket and collect stats data"""
+    """Connect to a socket and collect stats data.
+
+    Plugins that implement request, response_complete and parse_response
+    can use exchange for their blocking fetch_data and set ASYNC to be
+    polled by the event loop engine.
+
+    Plugins whose responses are complete without the server closing the
+    connection set PERSISTENT, and an instance with ``persistent: true``
+    then keeps its connection open between polls in the PersistentConnection
+    the agent passes in. A kept connection that fails or returns no data is
+    replaced by a new one within the same poll.
+
+    :param dict config: The plugin configuration
+    :param int poll_interval: How often the plugin is invoked
+    :param newrelic_python_agent.state.DeriveStore last_interval_values:
+        The derive history of the instance
+    :param PersistentConnection connection: The connection kept open for
+        the instance, if any
+
+    """
     DEFAULT_HOST = 'localhost'
     DEFAULT_PORT = 0
+    DEFAULT_TIMEOUT = 10
+    # set to True on plugins that can reuse a connection for the next poll
+    PERSISTENT = False
     SOCKET_RECV_MAX = 10485760
 
+    def __init__(self, config, poll_interval, last_interval_values=None,
+                 connection=None):
+        super(SocketStatsPlugin, self).__init__(config, poll_interval,
+                                                last_interval_values)
+        self.persistent_connection = connection
+        self.reused = False
+
+    def address(self):
+        """Return the address to connect to and its socket family
+
+        :rtype: tuple
+
+        """
+        if 'path' in self.config:
+            return self.config['path'], socket.AF_UNIX
+        return ((self.config.get('host', self.DEFAULT_HOST),
+                 self.config.get('port', self.DEFAULT_PORT)),
+                socket.AF_INET)
+
     def connect(self):
         """Top level interface to create a socket and connect it to the
-        socket.
+        socket, or to reuse the persistent connection if it is still open.
 
         :rtype: socket
 
         """
+        connection = self.reuse_connection()
+        if connection is not None:
+            connection.settimeout(self.timeouts()[1])
+            return connection
         try:
             connection = self.socket_connect()
         except socket.error as error:
@@ -350,6 +947,19 @@ class SocketStatsPlugin(Plugin):
         else:
             return connection
 
+    def disconnect(self, connection, keep=False):
+        """Close the connection, or keep it open for the next poll if keep
+        is set and the instance has a persistent connection
+
+        :param socket connection: The connection
+        :param bool keep: True if the poll read a complete response
+
+        """
+        if keep and self.persistent_connection is not None:
+            self.persistent_connection.release(connection)
+        else:
+            connection.close()
+
     def fetch_data(self, connection, read_till_empty=False):
         """Read the data from the socket
 
@@ -357,6 +967,7 @@ class SocketStatsPlugin(Plugin):
 
         """
         LOGGER.debug('Fetching data')
+        start = time.time()
         received = connection.recv(self.SOCKET_RECV_MAX)
         while read_till_empty:
             chunk = connection.recv(self.SOCKET_RECV_MAX)
@@ -364,6 +975,7 @@ class SocketStatsPlugin(Plugin):
                 received += chunk
             else:
                 break
+        self.add_timing('fetch', start)
         return received
 
     def poll(self):
@@ -376,43 +988,188 @@ class SocketStatsPlugin(Plugin):
         self.initialize()
 
         # Fetch the data from the remote socket
-        connection = self.connect()
-        if not connection:
-            LOGGER.error('%s could not connect, skipping poll interval',
+        while True:
+            start = time.time()
+            connection = self.connect()
+            self.add_timing('fetch', start)
+            if not connection:
+                LOGGER.error('%s could not connect, skipping poll interval',
+                             self.__class__.__name__)
+                return
+            reused, failure = self.reused, None
+            try:
+                data = self.fetch_data(connection)
+            except socket.error as error:
+                data, failure = None, error
+            if data or not reused:
+                break
+            connection.close()
+            LOGGER.debug('Persistent connection to %s failed, reconnecting',
                          self.__class__.__name__)
+
+        self.disconnect(connection, bool(data))
+        if failure is not None:
+            LOGGER.error('Error polling %s: %s',
+                         self.__class__.__name__, failure)
             return
 
-        data = self.fetch_data(connection)
-        connection.close()
+        if data:
+            start = time.time()
+            self.add_datapoints(data)
+            self.add_timing('derive', start)
+            self.finish()
+        else:
+            self.error_message()
+
+    def poll_async(self):
+        """Poll the server over a non-blocking socket on the event loop"""
+        LOGGER.info('Polling %s', self.__class__.__name__)
+        self.initialize()
+        connect_timeout, timeout = self.timeouts()
+        address, family = self.address()
+        while True:
+            start = time.time()
+            connection = self.reuse_connection()
+            if connection is None:
+                try:
+                    connection = yield eventloop.connect(address, family,
+                                                         connect_timeout)
+                except socket.error as error:
+                    LOGGER.error('Error connecting to %s: %s',
+                                 self.__class__.__name__, error)
+                    self.add_timing('fetch', start)
+                    return
+            else:
+                connection.setblocking(False)
+            reused, failure, data = self.reused, None, None
+            try:
+                request = self.request()
+                if request:
+                    yield eventloop.sendall(connection, request, timeout)
+                data = yield eventloop.read_response(connection,
+                                                     self.response_complete,
+                                                     timeout,
+                                                     self.SOCKET_RECV_MAX)
+            except socket.error as error:
+                failure = error
+            finally:
+                self.add_timing('fetch', start)
+            if failure is None:
+                start = time.time()
+                data = self.parse_response(data)
+                self.add_timing('parse', start)
+            if data or not reused:
+                break
+            connection.close()
+            LOGGER.debug('Persistent connection to %s failed, reconnecting',
+                         self.__class__.__name__)
+
+        self.disconnect(connection, bool(data))
+        if failure is not None:
+            LOGGER.error('Error polling %s: %s',
+                         self.__class__.__name__, failure)
+            return
 
         if data:
+            start = time.time()
             self.add_datapoints(data)
+            self.add_timing('derive', start)
             self.finish()
         else:
             self.error_message()
 
+    def exchange(self, connection):
+        """Send the request and read until the response is complete or the
+        connection is closed, returning the parsed response.
+
+        :param socket connection: The connection
+        :rtype: mixed
+
+        """
+        start = time.time()
+        request = self.request()
+        if request:
+            connection.sendall(request)
+        received = ''
+        while len(received) < self.SOCKET_RECV_MAX:
+            chunk = connection.recv(self.SOCKET_RECV_MAX)
+            if not chunk:
+                break
+            received += chunk
+            if self.response_complete(received):
+                break
+        self.add_timing('fetch', start)
+        start = time.time()
+        try:
+            return self.parse_response(received)
+        finally:
+            self.add_timing('parse', start)
+
+    def parse_response(self, data):
+        """Return the stats parsed from a complete response
+
+        :param str data: The data received
+        :rtype: mixed
+
+        """
+        return data
+
+    def request(self):
+        """Return the data to send to request stats, if any
+
+        :rtype: str
+
+        """
+        return None
+
+    def response_complete(self, data):
+        """Return True if data holds the whole response. By default the
+        response is read until the connection is closed.
+
+        :param str data: The data received so far
+        :rtype: bool
+
+        """
+        return False
+
+    def reuse_connection(self):
+        """Return the persistent connection of the instance if it is still
+        open, setting reused to whether it was
+
+        :rtype: socket
+
+        """
+        connection = None
+        if self.persistent_connection is not None:
+            connection = self.persistent_connection.acquire()
+        self.reused = connection is not None
+        return connection
+
     def socket_connect(self):
         """Low level interface to create a socket and connect to it.
 
         :rtype: socket
 
         """
-        if 'path' in self.config:
-            if path.exists(self.config['path']):
-                LOGGER.debug('Connecting to UNIX domain socket: %s',
-                             self.config['path'])
-                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                connection.connect(self.config['path'])
-            else:
+        connect_timeout, timeout = self.timeouts()
+        address, family = self.address()
+        if family == socket.AF_UNIX:
+            if not path.exists(address):
                 LOGGER.error('UNIX domain socket path does not exist: %s',
-                             self.config['path'])
+                             address)
                 return None
+            LOGGER.debug('Connecting to UNIX domain socket: %s', address)
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         else:
-            remote_host = (self.config.get('host', self.DEFAULT_HOST),
-                           self.config.get('port', self.DEFAULT_PORT))
-            LOGGER.debug('Connecting to %r', remote_host)
+            LOGGER.debug('Connecting to %r', address)
             connection = socket.socket()
-            connection.connect(remote_host)
+        connection.settimeout(connect_timeout)
+        try:
+            connection.connect(address)
+        except socket.error:
+            connection.close()
+            raise
+        connection.settimeout(timeout)
         return connection
 
 
@@ -423,6 +1180,16 @@ class HTTPStatsPlugin(Plugin):
     """
     DEFAULT_PATH = '/'
     DEFAULT_QUERY = None
+    DEFAULT_TIMEOUT = 10
+
+    def decode_response(self, response):
+        """Return the stats data from the HTTP response
+
+        :param requests.models.Response response: The response
+        :rtype: str
+
+        """
+        return response.content if response else ''
 
     def fetch_data(self):
         """Fetch the data from the stats URL
@@ -430,8 +1197,14 @@ class HTTPStatsPlugin(Plugin):
         :rtype: str
 
         """
-        data = self.http_get()
-        return data.content if data else ''
+        start = time.time()
+        response = self.http_get()
+        self.add_timing('fetch', start)
+        start = time.time()
+        try:
+            return self.decode_response(response)
+        finally:
+            self.add_timing('parse', start)
 
     def http_get(self, url=None):
         """Fetch the data from the stats URL or a specified one.
@@ -461,7 +1234,38 @@ class HTTPStatsPlugin(Plugin):
         self.initialize()
         data = self.fetch_data()
         if data:
+            start = time.time()
+            self.add_datapoints(data)
+            self.add_timing('derive', start)
+        self.finish()
+
+    def poll_async(self):
+        """Poll HTTP server for stats data on the event loop"""
+        self.initialize()
+        kwargs = self.request_kwargs
+        LOGGER.debug('Polling %s Stats at %s',
+                     self.__class__.__name__, kwargs['url'])
+        start = time.time()
+        try:
+            response = yield eventloop.http_get(
+                kwargs['url'], auth=kwargs.get('auth'),
+                verify=kwargs.get('verify', True),
+                timeout=kwargs['timeout'])
+        except socket.error as error:
+            LOGGER.error('Error polling stats: %s', error)
+            response = None
+        if response is not None and response.status_code >= 300:
+            LOGGER.error('Error response from %s (%s): %s', kwargs['url'],
+                         response.status_code, response.content)
+            response = None
+        self.add_timing('fetch', start)
+        start = time.time()
+        data = self.decode_response(response)
+        self.add_timing('parse', start)
+        if data:
+            start = time.time()
             self.add_datapoints(data)
+            self.add_timing('derive', start)
         self.finish()
 
     @property
@@ -491,7 +1295,7 @@ class HTTPStatsPlugin(Plugin):
         :rtype: dict
 
         """
-        kwargs = {'url': self.stats_url}
+        kwargs = {'url': self.stats_url, 'timeout': self.timeouts()}
         if self.config.get('scheme') == 'https':
             kwargs['verify'] = self.config.get('verify_ssl_cert', False)
 
@@ -507,13 +1311,14 @@ class CSVStatsPlugin(HTTPStatsPlugin):
     for stats collection
 
     """
-    def fetch_data(self):
-        """Fetch the data from the stats URL
+    def decode_response(self, response):
+        """Return the rows of the CSV response
 
-        :rtype: dict
+        :param requests.models.Response response: The response
+        :rtype: list
 
         """
-        data = super(CSVStatsPlugin, self).fetch_data()
+        data = super(CSVStatsPlugin, self).decode_response(response)
         if not data:
             return dict()
         temp = tempfile.TemporaryFile()
@@ -531,7 +1336,9 @@ class CSVStatsPlugin(HTTPStatsPlugin):
         self.initialize()
         data = self.fetch_data()
         if data:
+            start = time.time()
             self.add_datapoints(data)
+            self.add_timing('derive', start)
         self.finish()
 
 
@@ -540,15 +1347,15 @@ class JSONStatsPlugin(HTTPStatsPlugin):
     for stats collection
 
     """
-    def fetch_data(self):
-        """Fetch the data from the stats URL
+    def decode_response(self, response):
+        """Return the decoded JSON response
 
+        :param requests.models.Response response: The response
         :rtype: dict
 
         """
-        data = self.http_get()
         try:
-            return data.json() if data else {}
+            return response.json() if response else {}
         except Exception as error:
             LOGGER.error('JSON decoding error: %r', error)
         return {}
@@ -558,5 +1365,7 @@ class JSONStatsPlugin(HTTPStatsPlugin):
         self.initialize()
         data = self.fetch_data()
         if data:
+            start = time.time()
             self.add_datapoints(data)
+            self.add_timing('derive', start)
         self.finish()
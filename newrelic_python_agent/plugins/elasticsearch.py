@@ -24,6 +24,76 @@ class ElasticSearch(base.JSONStatsPlugin):
 
     STATUS_CODE = {'green': 0, 'yellow': 1, 'red': 2}
 
+    SCHEMA = [
+        ('indices.docs.count', 'Indices/Documents/Count', 'docs', 'gauge'),
+        ('indices.docs.count', 'Indices/Documents/Added', 'docs', 'derive'),
+        ('indices.docs.deleted', 'Indices/Documents/Deleted', 'docs',
+         'derive'),
+
+        ('indices.store.size_in_bytes', 'Indices/Storage', 'bytes', 'gauge'),
+        ('indices.store.throttle_time_in_millis', 'Indices/Storage Throttled',
+         'ms', 'derive'),
+
+        ('indices.indexing.index_time_in_millis', 'Indices/Indexing', 'ms',
+         'derive'),
+        ('indices.indexing.index_total', 'Indices/Indexing', 'count',
+         'derive'),
+        ('indices.indexing.delete_time_in_millis', 'Indices/Index Deletes',
+         'ms', 'derive'),
+        ('indices.indexing.delete_total', 'Indices/Index Deletes', 'count',
+         'derive'),
+
+        ('indices.get.total', 'Indices/Get', 'count', 'derive'),
+        ('indices.get.time_in_millis', 'Indices/Get', 'ms', 'derive'),
+        ('indices.get.exists_total', 'Indices/Get Hits', 'count', 'derive'),
+        ('indices.get.exists_time_in_millis', 'Indices/Get Hits', 'ms',
+         'derive'),
+        ('indices.get.missing_total', 'Indices/Get Misses', 'count',
+         'derive'),
+        ('indices.get.missing_time_in_millis', 'Indices/Get Misses', 'ms',
+         'derive'),
+
+        ('indices.search.open_contexts', 'Indices/Open Search Contexts',
+         'count', 'gauge'),
+        ('indices.search.query_total', 'Indices/Search Query', 'count',
+         'derive'),
+        ('indices.search.query_time_in_millis', 'Indices/Search Query', 'ms',
+         'derive'),
+        ('indices.search.fetch_total', 'Indices/Search Fetch', 'count',
+         'derive'),
+        ('indices.search.fetch_time_in_millis', 'Indices/Search Fetch', 'ms',
+         'derive'),
+
+        ('indices.merge.total', 'Indices/Merge', 'count', 'derive'),
+        ('indices.merge.total_time_in_millis', 'Indices/Merge', 'ms',
+         'derive'),
+
+        ('indices.flush.total', 'Indices/Flush', 'count', 'gauge'),
+        ('indices.flush.total_time_in_millis', 'Indices/Flush', 'ms',
+         'derive'),
+
+        ('transport.rx_size_in_bytes', 'Network/Traffic/Received', 'bytes',
+         'derive'),
+        ('transport.tx_size_in_bytes', 'Network/Traffic/Sent', 'bytes',
+         'derive'),
+
+        ('network.active_opens', 'Network/Connections/Active', 'conn',
+         'derive'),
+        ('network.passive_opens', 'Network/Connections/Passive', 'conn',
+         'derive'),
+        ('network.estab_resets', 'Network/Connections/Reset', 'conn',
+         'derive'),
+        ('network.attempt_fails', 'Network/Connections/Failures', 'conn',
+         'derive'),
+
+        ('http.total_opened', 'Network/HTTP Connections', 'conn', 'derive'),
+
+        ('network.in_seg', 'Network/Segments/In', 'seg', 'derive'),
+        ('network.in_errs', 'Network/Segments/In', 'errors', 'derive'),
+        ('network.out_seg', 'Network/Segments/Out', 'seg', 'derive'),
+        ('network.retrans_segs', 'Network/Segments/Retransmitted', 'seg',
+         'derive')]
+
     def add_datapoints(self, stats):
         """Add all of the datapoints for the Elasticsearch poll
 
@@ -39,8 +109,7 @@ class ElasticSearch(base.JSONStatsPlugin):
                     self.process_tree(totals[key],
                                       stats['nodes'][node][key])
 
-        self.add_index_datapoints(totals)
-        self.add_network_datapoints(totals)
+        self.add_schema_values(self.metric_schema().row(totals, 0))
         self.add_cluster_stats()
 
     def add_cluster_stats(self):
@@ -69,111 +138,6 @@ class ElasticSearch(base.JSONStatsPlugin):
             LOGGER.error('Error collecting cluster stats (%s): %s',
                          response.status_code, response.content)
 
-    def add_index_datapoints(self, stats):
-        """Add the data points for Component/Indices
-
-        :param dict stats: The stats to process for the values
-
-        """
-        indices = stats.get('indices', dict())
-
-        docs = indices.get('docs', dict())
-        self.add_gauge_value('Indices/Documents/Count', 'docs',
-                             docs.get('count', 0))
-        self.add_derive_value('Indices/Documents/Added', 'docs',
-                              docs.get('count', 0))
-        self.add_derive_value('Indices/Documents/Deleted', 'docs',
-                              docs.get('deleted', 0))
-
-        store = indices.get('store', dict())
-        self.add_gauge_value('Indices/Storage', 'bytes',
-                             store.get('size_in_bytes', 0))
-        self.add_derive_value('Indices/Storage Throttled', 'ms',
-                              store.get('throttle_time_in_millis', 0))
-
-        indexing = indices.get('indexing', dict())
-        self.add_derive_value('Indices/Indexing', 'ms',
-                              indexing.get('index_time_in_millis', 0))
-        self.add_derive_value('Indices/Indexing', 'count',
-                              indexing.get('index_total', 0))
-        self.add_derive_value('Indices/Index Deletes', 'ms',
-                              indexing.get('delete_time_in_millis', 0))
-        self.add_derive_value('Indices/Index Deletes', 'count',
-                              indexing.get('delete_total', 0))
-
-        get_stats = indices.get('get', dict())
-        self.add_derive_value('Indices/Get', 'count',
-                              get_stats.get('total', 0))
-        self.add_derive_value('Indices/Get', 'ms',
-                              get_stats.get('time_in_millis', 0))
-        self.add_derive_value('Indices/Get Hits', 'count',
-                              get_stats.get('exists_total', 0))
-        self.add_derive_value('Indices/Get Hits', 'ms',
-                              get_stats.get('exists_time_in_millis', 0))
-        self.add_derive_value('Indices/Get Misses', 'count',
-                              get_stats.get('missing_total', 0))
-        self.add_derive_value('Indices/Get Misses', 'ms',
-                              get_stats.get('missing_time_in_millis', 0))
-
-        search = indices.get('search', dict())
-        self.add_gauge_value('Indices/Open Search Contexts', 'count',
-                              search.get('open_contexts', 0))
-        self.add_derive_value('Indices/Search Query', 'count',
-                              search.get('query_total', 0))
-        self.add_derive_value('Indices/Search Query', 'ms',
-                              search.get('query_time_in_millis', 0))
-
-        self.add_derive_value('Indices/Search Fetch', 'count',
-                              search.get('fetch_total', 0))
-        self.add_derive_value('Indices/Search Fetch', 'ms',
-                              search.get('fetch_time_in_millis', 0))
-
-        merge_stats = indices.get('merge', dict())
-        self.add_derive_value('Indices/Merge', 'count',
-                              merge_stats.get('total', 0))
-        self.add_derive_value('Indices/Merge', 'ms',
-                              merge_stats.get('total_time_in_millis', 0))
-
-        flush_stats = indices.get('flush', dict())
-        self.add_gauge_value('Indices/Flush', 'count',
-                             flush_stats.get('total', 0))
-        self.add_derive_value('Indices/Flush', 'ms',
-                              flush_stats.get('total_time_in_millis', 0))
-
-    def add_network_datapoints(self, stats):
-        """Add the data points for Component/Network
-
-        :param dict stats: The stats to process for the values
-
-        """
-        transport = stats.get('transport', dict())
-        self.add_derive_value('Network/Traffic/Received', 'bytes',
-                              transport.get('rx_size_in_bytes', 0))
-        self.add_derive_value('Network/Traffic/Sent', 'bytes',
-                              transport.get('tx_size_in_bytes', 0))
-
-        network = stats.get('network', dict())
-        self.add_derive_value('Network/Connections/Active', 'conn',
-                              network.get('active_opens', 0))
-        self.add_derive_value('Network/Connections/Passive', 'conn',
-                              network.get('passive_opens', 0))
-        self.add_derive_value('Network/Connections/Reset', 'conn',
-                              network.get('estab_resets', 0))
-        self.add_derive_value('Network/Connections/Failures', 'conn',
-                              network.get('attempt_fails', 0))
-
-        self.add_derive_value('Network/HTTP Connections', 'conn',
-                              stats.get('http', dict()).get('total_opened', 0))
-
-        self.add_derive_value('Network/Segments/In', 'seg',
-                              network.get('in_seg', 0))
-        self.add_derive_value('Network/Segments/In', 'errors',
-                              network.get('in_errs', 0))
-        self.add_derive_value('Network/Segments/Out', 'seg',
-                              network.get('out_seg', 0))
-        self.add_derive_value('Network/Segments/Retransmitted', 'seg',
-                              network.get('retrans_segs', 0))
-
     def process_tree(self, tree, values):
         """Recursively combine all node stats into a single top-level value
 
@@ -12,6 +12,7 @@ LOGGER = logging.getLogger(__name__)
 class HAProxy(base.CSVStatsPlugin):
 
     DEFAULT_PATH = 'haproxy?stats;csv'
+    ASYNC = True
     GUID = 'com.meetme.newrelic_haproxy_agent'
     UNIT = {'Queue': {'Current': 'connections', 'Max': 'connections'},
             'Sessions': {'Current': 'sessions', 'Max': 'sessions',
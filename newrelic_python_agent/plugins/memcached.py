@@ -11,84 +11,69 @@ LOGGER = logging.getLogger(__name__)
 
 class Memcached(base.SocketStatsPlugin):
 
+    ASYNC = True
     GUID = 'com.meetme.newrelic_memcached_agent'
     DEFAULT_PORT = 11211
-    KEYS = ['curr_connections',
-            'curr_items',
-            'connection_structures',
-            'cmd_get',
-            'cmd_set',
-            'cmd_flush',
-            'get_hits',
-            'get_misses',
-            'delete_hits',
-            'delete_misses',
-            'incr_hits',
-            'incr_misses',
-            'decr_hits',
-            'decr_misses',
-            'cas_hits',
-            'cas_misses',
-            'cas_badval',
-            'auth_cmds',
-            'auth_errors',
-            'bytes_read',
-            'bytes_written',
-            'bytes',
-            'total_items',
-            'evictions',
-            'rusage_user',
-            'conn_yields',
-            'rusage_system']
+    PERSISTENT = True
+    SCHEMA = [('cmd_flush', 'Command/Requests/Flush', 'flush', 'derive'),
+              ('cas_badval', 'Command/Errors/CAS', 'errors', 'derive'),
+              ('cmd_set', 'Command/Requests/Set', 'requests', 'derive'),
+              ('curr_connections', 'Connection/Count', 'connections',
+               'gauge'),
+              ('connection_structures', 'Connection/Structures',
+               'connection structures', 'gauge'),
+              ('conn_yields', 'Connection/Yields', 'yields', 'derive'),
+              ('evictions', 'Evictions', 'items', 'derive'),
+              ('curr_items', 'Items', 'items', 'gauge'),
+              ('bytes_read', 'Network/In', 'bytes', 'derive'),
+              ('bytes_written', 'Network/Out', 'bytes', 'derive'),
+              ('rusage_system', 'System/CPU/System', 'seconds', 'derive'),
+              ('rusage_user', 'System/CPU/User', 'seconds', 'derive'),
+              ('bytes', 'System/Memory', 'bytes', 'gauge'),
+              # read for the command totals and hit ratios
+              ('cmd_get', None, None, None),
+              ('get_hits', None, None, None),
+              ('get_misses', None, None, None),
+              ('delete_hits', None, None, None),
+              ('delete_misses', None, None, None),
+              ('incr_hits', None, None, None),
+              ('incr_misses', None, None, None),
+              ('decr_hits', None, None, None),
+              ('decr_misses', None, None, None),
+              ('cas_hits', None, None, None),
+              ('cas_misses', None, None, None),
+              ('auth_cmds', None, None, None),
+              ('auth_errors', None, None, None),
+              ('total_items', None, None, None)]
 
     SOCKET_RECV_MAX = 32768
 
     def add_datapoints(self, stats):
         """Add all of the data points for a node
 
-        :param dict stats: all of the nodes
+        :param list stats: The row of stats values from process_data
 
         """
+        self.add_schema_values(stats)
         self.command_value('CAS', 'cas', stats)
-        self.add_derive_value('Command/Requests/Flush', 'flush',
-                              stats['cmd_flush'])
-        self.add_derive_value('Command/Errors/CAS', 'errors',
-                              stats['cas_badval'])
         self.command_value('Decr', 'decr', stats)
         self.command_value('Delete', 'delete', stats)
         self.command_value('Get', 'get', stats)
         self.command_value('Incr', 'incr', stats)
-        self.add_derive_value('Command/Requests/Set', 'requests', stats['cmd_set'])
-
-        self.add_gauge_value('Connection/Count', 'connections',
-                             stats['curr_connections'])
-        self.add_gauge_value('Connection/Structures', 'connection structures',
-                             stats['connection_structures'])
-        self.add_derive_value('Connection/Yields', 'yields',
-                              stats['conn_yields'])
-        self.add_derive_value('Evictions', 'items', stats['evictions'])
-        self.add_gauge_value('Items', 'items', stats['curr_items'])
-
-        self.add_derive_value('Network/In', 'bytes', stats['bytes_read'])
-        self.add_derive_value('Network/Out', 'bytes', stats['bytes_written'])
-
-        self.add_derive_value('System/CPU/System', 'seconds',
-                              stats['rusage_user'])
-        self.add_derive_value('System/CPU/User', 'seconds',
-                              stats['rusage_user'])
-        self.add_gauge_value('System/Memory', 'bytes', stats['bytes'])
 
     def command_value(self, name, prefix, stats):
         """Process commands adding the command and the hit ratio.
 
         :param str name: The command name
         :param str prefix: The command prefix
-        :param dict stats: The request stats
+        :param list stats: The row of stats values
 
         """
-        total = stats['%s_hits' % prefix] + stats['%s_misses' % prefix]
+        slots = self.metric_schema().slots
+        hits = stats[slots['%s_hits' % prefix]]
+        total = hits + stats[slots['%s_misses' % prefix]]
         if total > 0:
-            ratio = (float(stats['%s_hits' % prefix]) / float(total)) * 100
+            ratio = (float(hits) / float(total)) * 100
         else:
             ratio = 0
         self.add_derive_value('Command/Requests/%s' % name, 'requests', total)
@@ -100,8 +85,32 @@ class Memcached(base.SocketStatsPlugin):
         :param  socket connection: The connection
 
         """
-        connection.send("stats\n")
-        data = super(Memcached, self).fetch_data(connection)
+        return self.exchange(connection)
+
+    def request(self):
+        """Return the stats command
+
+        :rtype: str
+
+        """
+        return "stats\n"
+
+    def response_complete(self, data):
+        """Return True once the END line has been received
+
+        :param str data: The data received so far
+        :rtype: bool
+
+        """
+        return data.endswith('END\r\n') or data.endswith('ERROR\r\n')
+
+    def parse_response(self, data):
+        """Parse the stats response into a dict of values
+
+        :param str data: The data received
+        :rtype: dict
+
+        """
         data_in = []
         for line in data.replace('\r', '').split('\n'):
             if line == 'END':
@@ -111,31 +120,34 @@ class Memcached(base.SocketStatsPlugin):
 
     def process_data(self, data):
         """Loop through all the rows and parse each line, looking to see if it
-        is in the data points we would like to process, adding the key => value
-        pair to values if it is.
+        is in the data points we would like to process, adding the value to
+        its slot in the row of stats values if it is.
 
         :param list data: The list of rows
-        :returns: dict
+        :rtype: list
 
         """
-        values = dict()
+        schema = self.metric_schema()
+        values = schema.row()
         for row in data:
             parts = row.split(' ')
-            if parts[1] in self.KEYS:
+            slot = schema.slots.get(parts[1])
+            if slot is not None:
                 try:
-                    values[parts[1]] = int(parts[2])
+                    values[slot] = int(parts[2])
                 except ValueError:
                     try:
-                        values[parts[1]] = float(parts[2])
+                        values[slot] = float(parts[2])
                     except ValueError:
                         LOGGER.warning('Could not parse line: %r', parts)
-                        values[parts[1]] = 0
+                        values[slot] = 0
 
         # Back fill any missed data
-        for key in self.KEYS:
-            if key not in values:
-                LOGGER.info('Populating missing element with 0: %s', key)
-                values[key] = 0
+        for slot, value in enumerate(values):
+            if value is None:
+                LOGGER.info('Populating missing element with 0: %s',
+                            schema.keys[slot])
+                values[slot] = 0
 
-        # Return the values dict
+        # Return the row of values
         return values
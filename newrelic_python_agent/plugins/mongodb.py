@@ -3,9 +3,7 @@ MongoDB Support
 
 """
 import datetime
-from pymongo import errors
 import logging
-import pymongo
 
 from newrelic_python_agent.plugins import base
 
@@ -16,6 +14,78 @@ class MongoDB(base.Plugin):
 
     GUID = 'com.meetme.newrelic_mongodb_plugin_agent'
 
+    # the serverStatus metrics
+    SCHEMA = [
+        ('asserts.regular', 'Asserts/Regular', 'asserts', 'derive'),
+        ('asserts.warning', 'Asserts/Warning', 'asserts', 'derive'),
+        ('asserts.msg', 'Asserts/Message', 'asserts', 'derive'),
+        ('asserts.user', 'Asserts/User', 'asserts', 'derive'),
+        ('asserts.rollovers', 'Asserts/Rollovers', 'asserts', 'derive'),
+
+        ('connections.available', 'Connections/Available', 'connections',
+         'gauge'),
+        ('connections.current', 'Connections/Current', 'connections',
+         'gauge'),
+
+        ('cursors.totalOpen', 'Cursors/Open', 'cursors', 'gauge'),
+        ('cursors.timedOut', 'Cursors/Timed Out', 'cursors', 'derive'),
+
+        ('dur.commitsInWriteLock', 'Durability/Commits in Write Lock',
+         'commits', 'gauge'),
+        ('dur.earlyCommits', 'Durability/Early Commits', 'commits', 'gauge'),
+        ('dur.commits', 'Durability/Journal Commits', 'commits', 'gauge'),
+        ('dur.journaledMB', 'Durability/Journal Bytes Written', 'bytes',
+         'gauge', 1048576),
+        ('dur.writeToDataFilesMB', 'Durability/Data File Bytes Written',
+         'bytes', 'gauge', 1048576),
+
+        ('dur.timeMs.dt', 'Durability/Timings/Duration Measured', 'ms',
+         'gauge'),
+        ('dur.timeMs.prepLogBuffer',
+         'Durability/Timings/Log Buffer Preparation', 'ms', 'gauge'),
+        ('dur.timeMs.writeToJournal', 'Durability/Timings/Write to Journal',
+         'ms', 'gauge'),
+        ('dur.timeMs.writeToDataFiles',
+         'Durability/Timings/Write to Data Files', 'ms', 'gauge'),
+        ('dur.timeMs.remapPrivateView',
+         'Durability/Timings/Remaping Private View', 'ms', 'gauge'),
+
+        ('globalLock.lockTime', 'Global Locks/Held', 'ms', 'derive', 1000),
+        ('globalLock.ratio', 'Global Locks/Ratio', 'ratio', 'derive'),
+        ('globalLock.activeClients.total', 'Global Locks/Active Clients/Total',
+         'clients', 'derive'),
+        ('globalLock.activeClients.readers',
+         'Global Locks/Active Clients/Readers', 'clients', 'derive'),
+        ('globalLock.activeClients.writers',
+         'Global Locks/Active Clients/Writers', 'clients', 'derive'),
+        ('globalLock.currentQueue.total', 'Global Locks/Queue/Total', 'locks',
+         'derive'),
+        ('globalLock.currentQueue.readers', 'Global Locks/Queue/Readers',
+         'readers', 'derive'),
+        ('globalLock.currentQueue.writers', 'Global Locks/Queue/Writers',
+         'writers', 'derive'),
+
+        ('mem.mapped', 'Memory/Mapped', 'bytes', 'gauge', 1048576),
+        ('mem.mappedWithJournal', 'Memory/Mapped with Journal', 'bytes',
+         'gauge', 1048576),
+        ('mem.resident', 'Memory/Resident', 'bytes', 'gauge', 1048576),
+        ('mem.virtual', 'Memory/Virtual', 'bytes', 'gauge', 1048576),
+
+        ('network.numRequests', 'Network/Requests', 'requests', 'derive'),
+        ('network.bytesIn', 'Network/Transfer/In', 'bytes', 'derive'),
+        ('network.bytesOut', 'Network/Transfer/Out', 'bytes', 'derive'),
+
+        ('opcounters.insert', 'Operations/Insert', 'ops', 'derive'),
+        ('opcounters.query', 'Operations/Query', 'ops', 'derive'),
+        ('opcounters.update', 'Operations/Update', 'ops', 'derive'),
+        ('opcounters.delete', 'Operations/Delete', 'ops', 'derive'),
+        ('opcounters.getmore', 'Operations/Get More', 'ops', 'derive'),
+        ('opcounters.command', 'Operations/Command', 'ops', 'derive'),
+
+        ('extra_info.heap_usage_bytes', 'System/Heap Usage', 'bytes',
+         'gauge'),
+        ('extra_info.page_faults', 'System/Page Faults', 'faults', 'derive')]
+
     def add_datapoints(self, name, stats):
         """Add all of the data points for a database
 
@@ -45,17 +115,7 @@ class MongoDB(base.Plugin):
         :param dict stats: The stats data to add
 
         """
-        asserts = stats.get('asserts', dict())
-        self.add_derive_value('Asserts/Regular', 'asserts',
-                              asserts.get('regular', 0))
-        self.add_derive_value('Asserts/Warning', 'asserts',
-                              asserts.get('warning', 0))
-        self.add_derive_value('Asserts/Message', 'asserts',
-                              asserts.get('msg', 0))
-        self.add_derive_value('Asserts/User', 'asserts',
-                              asserts.get('user', 0))
-        self.add_derive_value('Asserts/Rollovers', 'asserts',
-                              asserts.get('rollovers', 0))
+        self.add_schema_values(self.metric_schema().row(stats, 0))
 
         flush = stats.get('backgroundFlushing', dict())
         self.add_derive_timing_value('Background Flushes',
@@ -69,64 +129,6 @@ class MongoDB(base.Plugin):
                               flush.get('last_finished',
                                         datetime.datetime.now())).seconds)
 
-        conn = stats.get('connections', dict())
-        self.add_gauge_value('Connections/Available', 'connections',
-                             conn.get('available', 0))
-        self.add_gauge_value('Connections/Current', 'connections',
-                             conn.get('current', 0))
-
-        cursors = stats.get('cursors', dict())
-        self.add_gauge_value('Cursors/Open', 'cursors',
-                             cursors.get('totalOpen', 0))
-        self.add_derive_value('Cursors/Timed Out', 'cursors',
-                              cursors.get('timedOut', 0))
-
-        dur = stats.get('dur', dict())
-        self.add_gauge_value('Durability/Commits in Write Lock', 'commits',
-                             dur.get('commitsInWriteLock', 0))
-        self.add_gauge_value('Durability/Early Commits', 'commits',
-                             dur.get('earlyCommits', 0))
-        self.add_gauge_value('Durability/Journal Commits', 'commits',
-                             dur.get('commits', 0))
-        self.add_gauge_value('Durability/Journal Bytes Written', 'bytes',
-                             dur.get('journaledMB', 0) / 1048576)
-        self.add_gauge_value('Durability/Data File Bytes Written', 'bytes',
-                             dur.get('writeToDataFilesMB', 0) / 1048576)
-
-        timems = dur.get('timeMs', dict())
-        self.add_gauge_value('Durability/Timings/Duration Measured', 'ms',
-                             timems.get('dt', 0))
-        self.add_gauge_value('Durability/Timings/Log Buffer Preparation', 'ms',
-                             timems.get('prepLogBuffer', 0))
-        self.add_gauge_value('Durability/Timings/Write to Journal', 'ms',
-                             timems.get('writeToJournal', 0))
-        self.add_gauge_value('Durability/Timings/Write to Data Files', 'ms',
-                             timems.get('writeToDataFiles', 0))
-        self.add_gauge_value('Durability/Timings/Remaping Private View', 'ms',
-                             timems.get('remapPrivateView', 0))
-
-        locks = stats.get('globalLock', dict())
-        self.add_derive_value('Global Locks/Held', 'ms',
-                              locks.get('lockTime', 0) / 1000)
-        self.add_derive_value('Global Locks/Ratio', 'ratio',
-                              locks.get('ratio', 0))
-
-        active = locks.get('activeClients', dict())
-        self.add_derive_value('Global Locks/Active Clients/Total', 'clients',
-                              active.get('total', 0))
-        self.add_derive_value('Global Locks/Active Clients/Readers', 'clients',
-                              active.get('readers', 0))
-        self.add_derive_value('Global Locks/Active Clients/Writers', 'clients',
-                              active.get('writers', 0))
-
-        queue = locks.get('currentQueue', dict())
-        self.add_derive_value('Global Locks/Queue/Total', 'locks',
-                              queue.get('total', 0))
-        self.add_derive_value('Global Locks/Queue/Readers', 'readers',
-                              queue.get('readers', 0))
-        self.add_derive_value('Global Locks/Queue/Writers', 'writers',
-                              queue.get('writers', 0))
-
         index = stats.get('indexCounters', dict())
         btree_index = index.get('btree', dict())
         self.add_derive_value('Index/Accesses', 'accesses',
@@ -142,40 +144,6 @@ class MongoDB(base.Plugin):
                               index.get('resets', 0) +
                               btree_index.get('resets', 0))
 
-        mem = stats.get('mem', dict())
-        self.add_gauge_value('Memory/Mapped', 'bytes',
-                             mem.get('mapped', 0) / 1048576)
-        self.add_gauge_value('Memory/Mapped with Journal', 'bytes',
-                             mem.get('mappedWithJournal', 0) / 1048576)
-        self.add_gauge_value('Memory/Resident', 'bytes',
-                             mem.get('resident', 0) / 1048576)
-        self.add_gauge_value('Memory/Virtual', 'bytes',
-                             mem.get('virtual', 0) / 1048576)
-
-        net = stats.get('network', dict())
-        self.add_derive_value('Network/Requests', 'requests',
-                              net.get('numRequests', 0))
-        self.add_derive_value('Network/Transfer/In', 'bytes',
-                              net.get('bytesIn', 0))
-        self.add_derive_value('Network/Transfer/Out', 'bytes',
-                              net.get('bytesOut', 0))
-
-        ops = stats.get('opcounters', dict())
-        self.add_derive_value('Operations/Insert', 'ops', ops.get('insert', 0))
-        self.add_derive_value('Operations/Query', 'ops', ops.get('query', 0))
-        self.add_derive_value('Operations/Update', 'ops', ops.get('update', 0))
-        self.add_derive_value('Operations/Delete', 'ops', ops.get('delete', 0))
-        self.add_derive_value('Operations/Get More', 'ops',
-                              ops.get('getmore', 0))
-        self.add_derive_value('Operations/Command', 'ops',
-                              ops.get('command', 0))
-
-        extra = stats.get('extra_info', dict())
-        self.add_gauge_value('System/Heap Usage', 'bytes',
-                             extra.get('heap_usage_bytes', 0))
-        self.add_derive_value('System/Page Faults', 'faults',
-                              extra.get('page_faults', 0))
-
     def connect(self):
         kwargs = {'host': self.config.get('host', 'localhost'),
                   'port': self.config.get('port', 27017)}
@@ -183,6 +151,7 @@ class MongoDB(base.Plugin):
                     'ssl_cert_reqs', 'ssl_ca_certs']:
             if key in self.config:
                 kwargs[key] = self.config[key]
+        import pymongo
         try:
             return pymongo.MongoClient(**kwargs)
         except pymongo.errors.ConnectionFailure as error:
@@ -206,6 +175,7 @@ class MongoDB(base.Plugin):
 
         """
         LOGGER.debug('Processing list of mongo databases')
+        from pymongo import errors
         client = self.connect()
         if not client:
             return
@@ -224,6 +194,7 @@ class MongoDB(base.Plugin):
 
         """
         LOGGER.debug('Processing dict of mongo databases')
+        from pymongo import errors
         client = self.connect()
         if not client:
             return
@@ -193,9 +193,6 @@ import re
 import os
 import urllib2
 import json
-import credstash
-import boto3
-from botocore.exceptions import ClientError
 
 from newrelic_python_agent.plugins import base
 
@@ -328,6 +325,7 @@ class MySQLConfig(base.ConfigPlugin):
         :rtype: str
         """
         LOGGER.info('Obtaining region from default session.')
+        import boto3
         return [boto3.session.Session().region_name]
 
     def string_to_list(self, string):
@@ -349,6 +347,9 @@ class MySQLConfig(base.ConfigPlugin):
         :return: None
         """
 
+        # the AWS clients are only loaded when a config is built
+        from botocore.exceptions import ClientError
+
         plugin = self.config.get('target_plugin_name', 'mysql')
         if not plugin:
             LOGGER.error("must specify 'target_plugin_name' config value")
@@ -382,6 +383,7 @@ class MySQLConfig(base.ConfigPlugin):
         """
 
         LOGGER.info("querying cloudformation exports for %s", region)
+        import boto3
         c = boto3.client('cloudformation', region_name=region)
         more = True
         args = dict()
@@ -496,6 +498,7 @@ class MySQLConfig(base.ConfigPlugin):
         """
         table = self.get_region_setting(region, "credstash_table")
         if table:
+            import credstash
             r = credstash.getSecret(key,
                                     region=region,
                                     table=table)
@@ -604,6 +607,7 @@ class MySQLConfig(base.ConfigPlugin):
         include = self.get_region_setting(region, 'include')
         exclude = self.get_region_setting(region, 'exclude')
 
+        import boto3
         c = boto3.client('rds', region_name=region)
         while more:
             LOGGER.debug("querying for db instances in %s with args: %s", region, args)
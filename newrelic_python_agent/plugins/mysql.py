@@ -68,28 +68,12 @@ import re
 import time
 import logging
 
-# Support both PyMySQL and mysql-connector-python interfaces
-try:
-    import pymysql as sql
-
-    def _errno(err):
-        """Extract error code from pymysql.Error"""
-        return err.args[0]
-    from pymysql.constants.ER import ACCESS_DENIED_ERROR as ER_ACCESS_DENIED_ERROR, BAD_DB_ERROR as ER_BAD_DB_ERROR
-except ImportError as e1:
-    import mysql.connector as sql
-
-    def _errno(err):
-        """Extract error code from mysql.connector.Error"""
-        return err.errno
-    from mysql.connector.errorcode import ER_ACCESS_DENIED_ERROR, ER_BAD_DB_ERROR
-
 from newrelic_python_agent.plugins import base
 
 LOGGER = logging.getLogger(__name__)
 
+# metrics not in META are reported as gauges in this unit
 DEFAULT_UNIT = "Operations"
-DEFAULT_TYPE = "gauge"
 DEFAULT_METRICS = ['status', 'newrelic']
 DEFAULT_CONNECT_ARGS = {
     "port": 3306,
@@ -418,10 +402,38 @@ META = {
 }
 
 
+def schema(meta):
+    """
+    Walk the META dict and build the plugin SCHEMA from it, reporting counters
+    as rates per second. A metric listed as both is a gauge.
+
+    :param dict meta: The metrics by type and category
+    :return: ``(category/metric, category/metric, unit, kind)`` tuples
+    """
+    metrics = dict()
+    for t in sorted(meta):
+        for c in sorted(meta[t]):
+            for i in meta[t][c]:
+                unit = DEFAULT_UNIT
+                if (isinstance(i, (tuple, list))):
+                    val, unit = i
+                else:
+                    val = i
+                # category/metric
+                n = "/".join((c, val))
+                if t == "counter":
+                    # Unit/Second
+                    metrics[n] = (n, n, "/".join((unit, "Second")), "rate")
+                else:
+                    metrics[n] = (n, n, unit, "gauge")
+    return [metrics[n] for n in sorted(metrics)]
+
+
 class MySQL(base.Plugin):
 
     # pretend to be the official mysql plugin
     GUID = 'com.newrelic.plugins.mysql.instance'
+    SCHEMA = schema(META)
 
     is_true = re.compile("^(on|yes|true)$", re.I)
     is_false = re.compile("^(off|no|false)$", re.I)
@@ -515,38 +527,19 @@ class MySQL(base.Plugin):
 
     def add_stats(self):
         """
-        Walk the raw_metrics and pass them over to the agent as a counter or gauge
-        type and with the correct units defined
+        Walk the raw_metrics and fill them into the row of the plugin SCHEMA,
+        reporting the metrics that are not in it as gauges
         """
-        units = self.get_unit_map()
+        schema = self.metric_schema()
+        row = schema.row()
         for metric in self.raw_metrics:
-            unit, metric_type = units.get(metric, (DEFAULT_UNIT, DEFAULT_TYPE))
-            if metric_type == "counter":
-                # Unit/Second
-                unit = "/".join((unit, "Second"))
-                self.add_derive_value(metric, unit, self.raw_metrics[metric], rate=True)
+            value = self.raw_metrics[metric]
+            slot = schema.slots.get(metric)
+            if slot is None:
+                self.add_gauge_value(metric, DEFAULT_UNIT, value)
             else:
-                self.add_gauge_value(metric, unit, self.raw_metrics[metric])
-
-    def get_unit_map(self):
-        """
-        Walk the META dict and build a category/metric => [unit, type] map
-
-        :return: The dict mapping "category/metric" names to their unit and type
-        """
-        units = dict()
-        for t in META:
-            for c in META[t]:
-                for i in META[t][c]:
-                    unit = DEFAULT_UNIT
-                    if (isinstance(i, (tuple, list))):
-                        val, unit = i
-                    else:
-                        val = i
-                    # category/metric
-                    n = "/".join((c, val))
-                    units[n] = (unit, t)
-        return units
+                row[slot] = 0 if value is None else value
+        self.add_schema_values(row)
 
     def get_values(self, names):
         """
@@ -886,6 +879,11 @@ class MySQL(base.Plugin):
 
         """
 
+        # Support both PyMySQL and mysql-connector-python interfaces
+        try:
+            import pymysql as sql
+        except ImportError:
+            import mysql.connector as sql
         self.logger.debug("creating DB connection")
         conn = sql.connect(**self.connection_arguments)
         self.logger.debug("DB connection ready: %r", conn.get_host_info())
@@ -911,6 +909,24 @@ class MySQL(base.Plugin):
         return args
 
     def poll(self):
+        # Support both PyMySQL and mysql-connector-python interfaces
+        try:
+            import pymysql as sql
+            from pymysql.constants import ER as errorcode
+
+            def errno(err):
+                return err.args[0]
+            access_denied = errorcode.ACCESS_DENIED_ERROR
+            bad_db = errorcode.BAD_DB_ERROR
+        except ImportError:
+            import mysql.connector as sql
+            from mysql.connector import errorcode
+
+            def errno(err):
+                return err.errno
+            access_denied = errorcode.ER_ACCESS_DENIED_ERROR
+            bad_db = errorcode.ER_BAD_DB_ERROR
+
         # initialize a custom logger to always add these fields
         self.logger = base.PluginLogger(LOGGER, dict(target_name=self.config['name'],
                                                      hostname=self.config['host']))
@@ -928,9 +944,9 @@ class MySQL(base.Plugin):
         except ValueError as err:
             self.logger.exception(err)
         except sql.Error as err:
-            if _errno(err) == ER_ACCESS_DENIED_ERROR:
+            if errno(err) == access_denied:
                 self.logger.error("Something is wrong with your user name or password")
-            elif _errno(err) == ER_BAD_DB_ERROR:
+            elif errno(err) == bad_db:
                 self.logger.error("Database does not exist")
             else:
                 self.logger.error('Could not connect to %s, skipping stats run: %s' %
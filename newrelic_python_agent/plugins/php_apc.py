@@ -11,6 +11,7 @@ LOGGER = logging.getLogger(__name__)
 
 class APC(base.JSONStatsPlugin):
 
+    ASYNC = True
     GUID = 'com.meetme.newrelic_php_apc_agent'
 
     def add_datapoints(self, stats):
@@ -3,9 +3,6 @@ PostgreSQL Plugin
 
 """
 import logging
-import psycopg2
-from psycopg2 import extensions
-from psycopg2 import extras
 
 from newrelic_python_agent.plugins import base
 
@@ -263,6 +260,8 @@ class PostgreSQL(base.Plugin):
         :rtype: psycopg2.connection
 
         """
+        import psycopg2
+        from psycopg2 import extensions
         conn = psycopg2.connect(**self.connection_arguments)
         conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
         return conn
@@ -284,6 +283,8 @@ class PostgreSQL(base.Plugin):
         return args
 
     def poll(self):
+        import psycopg2
+        from psycopg2 import extras
         self.initialize()
         try:
             self.connection = self.connect()
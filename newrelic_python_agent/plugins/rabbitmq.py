@@ -4,8 +4,10 @@ rabbitmq
 """
 import logging
 import requests
+import socket
 import time
 
+from newrelic_python_agent import eventloop
 from newrelic_python_agent.plugins import base
 
 LOGGER = logging.getLogger(__name__)
@@ -13,6 +15,7 @@ LOGGER = logging.getLogger(__name__)
 
 class RabbitMQ(base.Plugin):
 
+    ASYNC = True
     GUID = 'com.meetme.newrelic_rabbitmq_agent'
 
     DEFAULT_USER = 'guest'
@@ -67,7 +70,8 @@ class RabbitMQ(base.Plugin):
 
         # Summary stats
         self.add_gauge_value('Summary/Channels', 'channels', channels)
-        self.add_gauge_value('Summary/Consumers', 'consumers', self.consumers)
+        self.add_gauge_value('Summary/Consumers', 'consumers',
+                             self.consumers.total)
 
     def add_node_channel_datapoints(self, node, channel_data):
         """Add datapoints for a node, creating summary values for top-level
@@ -96,27 +100,15 @@ class RabbitMQ(base.Plugin):
         """
         base_name = 'Node/%s/Messages' % node
 
-        # Top level message stats
-        keys = self.DUMMY_STATS.keys()
-        count, total, min_val, max_val, values = self.initialize_counters(keys)
-
-        for channel in channel_data:
-            if channel['node'].split('@')[-1] == node:
-                for key in keys:
-                    total[key] += channel.get(key, 0)
-
         # Per-Channel message Rates
-        count, total, min_val, max_val, values = self.initialize_counters(keys)
-        message_stats = list()
+        keys = self.DUMMY_STATS.keys()
+        total = dict.fromkeys(keys, 0)
         for channel in channel_data:
             if channel['node'].split('@')[-1] == node:
                 stats = channel.get('message_stats')
                 if stats:
-                    message_stats.append(stats)
-
-        for stat_block in message_stats:
-            for key in keys:
-                total[key] += stat_block.get(key, 0)
+                    for key in keys:
+                        total[key] += stats.get(key, 0)
 
         for key in keys:
             name = key
@@ -141,7 +133,7 @@ class RabbitMQ(base.Plugin):
                                   total[key])
 
         keys = ['messages_ready', 'messages_unacknowledged']
-        count, total, min_val, max_val, values = self.initialize_counters(keys)
+        total = dict.fromkeys(keys, 0)
         for queue in queue_data:
             if queue['node'].split('@')[-1] == node:
                 for key in keys:
@@ -161,45 +153,22 @@ class RabbitMQ(base.Plugin):
         :param list queue_data: The full stack of queue metrics
 
         """
-        keys = ['consumers', 'active_consumers', 'idle_consumers']
-        count, total, min_val, max_val, values = self.initialize_counters(keys)
-        del keys[2]
+        consumers, active, idle = (base.Accumulator(), base.Accumulator(),
+                                   base.Accumulator())
         for queue in queue_data:
             if queue['node'].split('@')[-1] == node:
-                for key in keys:
-                    count[key] += 1
-                    value = queue.get(key, 0)
-                    total[key] += value
-                    values[key].append(value)
-
-                # Inventing a new key here, so it's a manual override
-                key = 'idle_consumers'
-                count[key] += count['consumers']
-                idle_count = total['consumers'] - total['active_consumers']
-                total[key] += idle_count
-                values[key].append(idle_count)
-
-        base_name = 'Node/%s/Consumers' % node
-        self.add_gauge_value('%s/Count' % base_name, 'consumers',
-                             total['consumers'],
-                             None,
-                             None,
-                             count['consumers'])
-
-        self.consumers += total['consumers']
-
-        self.add_gauge_value('%s/Active' % base_name, 'consumers',
-                             total['active_consumers'],
-                             None,
-                             None,
-                             count['active_consumers'])
+                value = queue.get('consumers', 0)
+                active_value = queue.get('active_consumers', 0)
+                consumers.add(value)
+                active.add(active_value)
+                # Inventing a new value here, so it's a manual override
+                idle.add(value - active_value)
 
         base_name = 'Node/%s/Consumers' % node
-        self.add_gauge_value('%s/Idle' % base_name, 'consumers',
-                             total['idle_consumers'],
-                             None,
-                             None,
-                             count['idle_consumers'])
+        self.add_gauge_value('%s/Count' % base_name, 'consumers', consumers)
+        self.consumers.merge(consumers)
+        self.add_gauge_value('%s/Active' % base_name, 'consumers', active)
+        self.add_gauge_value('%s/Idle' % base_name, 'consumers', idle)
 
     def track_vhost_queue(self, vhost_name, queue_name):
         """ Checks whether the data for a vhost queue should be tracked or not
@@ -286,11 +255,12 @@ class RabbitMQ(base.Plugin):
         self.add_gauge_value('Summary/Messages Unacknowledged', 'messages',
                              unacked, count=count)
 
-    def http_get(self, url, params=None):
-        """Make a HTTP request for the URL.
+    def request_kwargs(self, url, params=None):
+        """Return kwargs for a HTTP request for the URL.
 
         :param str url: The URL to request
         :param dict params: Get query string parameters
+        :rtype: dict
 
         """
         kwargs = {
@@ -298,16 +268,21 @@ class RabbitMQ(base.Plugin):
             'auth': (self.config.get('username', self.DEFAULT_USER),
                      self.config.get('password', self.DEFAULT_PASSWORD)),
             'verify': self.config.get('verify_ssl_cert', True),
-            'timeout': self.config.get('timeout', self.DEFAULT_TIMEOUT)
+            'timeout': self.timeouts()
         }
-        if isinstance(kwargs['timeout'], list):
-            # convert list to tuple form
-            kwargs['timeout'] = tuple(kwargs['timeout'])
         if params:
             kwargs['params'] = params
+        return kwargs
+
+    def http_get(self, url, params=None):
+        """Make a HTTP request for the URL.
+
+        :param str url: The URL to request
+        :param dict params: Get query string parameters
 
+        """
         s = time.time()
-        r = self.requests_session.get(**kwargs)
+        r = self.requests_session.get(**self.request_kwargs(url, params))
         LOGGER.debug('%s took %.2f seconds', url, time.time() - s)
         return r
 
@@ -321,7 +296,45 @@ class RabbitMQ(base.Plugin):
         """
         url = '%s/%s' % (self.rabbitmq_base_url, data_type)
         params = {'columns': ','.join(columns)} if columns else {}
+        start = time.time()
         response = self.http_get(url, params)
+        self.add_timing('fetch', start)
+        start = time.time()
+        try:
+            return self.decode_response(url, response)
+        finally:
+            self.add_timing('parse', start)
+
+    def fetch_data_async(self, data_type, columns=None):
+        """Coroutine fetching the data from the RabbitMQ server for the
+        specified data type on the event loop
+
+        :param str data_type: The type of data to query
+        :param list columns: Ask for specific columns
+        :rtype: list
+
+        """
+        url = '%s/%s' % (self.rabbitmq_base_url, data_type)
+        params = {'columns': ','.join(columns)} if columns else {}
+        kwargs = self.request_kwargs(url, params)
+        s = time.time()
+        response = yield eventloop.http_get(**kwargs)
+        LOGGER.debug('%s took %.2f seconds', url, time.time() - s)
+        self.add_timing('fetch', s)
+        start = time.time()
+        data = self.decode_response(url, response)
+        self.add_timing('parse', start)
+        raise eventloop.Return(data)
+
+    def decode_response(self, url, response):
+        """Return the decoded JSON response, or an empty list if the request
+        failed
+
+        :param str url: The URL requested
+        :param requests.models.Response response: The response
+        :rtype: list
+
+        """
         if not response or response.status_code != 200:
             if response:
                 LOGGER.error('Error response from %s (%s): %s', url,
@@ -357,18 +370,21 @@ class RabbitMQ(base.Plugin):
         """
         return self.fetch_data('queues')
 
+    def initialize(self):
+        """Initialize the values each iteration"""
+        super(RabbitMQ, self).initialize()
+        self.derive = dict()
+        self.gauge = dict()
+        self.rate = dict()
+        self.consumers = base.Accumulator()
+
     def poll(self):
         """Poll the RabbitMQ server"""
         LOGGER.info('Polling RabbitMQ via %s', self.rabbitmq_base_url)
         start_time = time.time()
 
         self.requests_session = requests.Session()
-
-        # Initialize the values each iteration
-        self.derive = dict()
-        self.gauge = dict()
-        self.rate = dict()
-        self.consumers = 0
+        self.initialize()
 
         try:
             # Fetch the data from RabbitMQ
@@ -377,8 +393,10 @@ class RabbitMQ(base.Plugin):
             queue_data = self.fetch_queue_data()
 
             # Create all of the metrics
+            start = time.time()
             self.add_queue_datapoints(queue_data)
             self.add_node_datapoints(node_data, queue_data, channel_data)
+            self.add_timing('derive', start)
             LOGGER.info('Polling complete in %.2f seconds',
                         time.time() - start_time)
 
@@ -389,6 +407,33 @@ class RabbitMQ(base.Plugin):
             LOGGER.exception('Polling failed after %.2f seconds',
                              time.time() - start_time)
 
+    def poll_async(self):
+        """Poll the RabbitMQ server on the event loop"""
+        LOGGER.info('Polling RabbitMQ via %s', self.rabbitmq_base_url)
+        start_time = time.time()
+        self.initialize()
+
+        try:
+            # Fetch the data from RabbitMQ
+            channel_data = yield self.fetch_data_async('channels')
+            node_data = yield self.fetch_data_async('nodes')
+            queue_data = yield self.fetch_data_async('queues')
+
+            # Create all of the metrics
+            start = time.time()
+            self.add_queue_datapoints(queue_data)
+            self.add_node_datapoints(node_data, queue_data, channel_data)
+            self.add_timing('derive', start)
+            LOGGER.info('Polling complete in %.2f seconds',
+                        time.time() - start_time)
+
+        except socket.error as error:
+            LOGGER.error('Polling failed after %.2f seconds',
+                         time.time() - start_time, extra={"error": error})
+        except Exception:
+            LOGGER.exception('Polling failed after %.2f seconds',
+                             time.time() - start_time)
+
     @property
     def rabbitmq_base_url(self):
         """Return the fully composed RabbitMQ base URL
@@ -11,7 +11,9 @@ LOGGER = logging.getLogger(__name__)
 
 class Redis(base.SocketStatsPlugin):
 
+    ASYNC = True
     GUID = 'com.meetme.newrelic_redis_agent'
+    PERSISTENT = True
 
     DEFAULT_PORT = 6379
 
@@ -101,47 +103,74 @@ class Redis(base.SocketStatsPlugin):
         self.add_gauge_value('Keys/Total', 'keys', keys)
         self.add_gauge_value('Keys/Will Expire', 'keys', expires)
 
-    def connect(self):
-        """Top level interface to create a socket and connect it to the
-        redis daemon.
+    def fetch_data(self, connection):
+        """Read in the INFO response until we have received it all.
 
-        :rtype: socket
+        :param  socket connection: The connection
+        :rtype: dict
 
         """
-        connection = super(Redis, self).connect()
-        if connection and self.config.get('password'):
-            connection.send("*2\r\n$4\r\nAUTH\r\n$%i\r\n%s\r\n" %
-                            (len(self.config['password']),
-                             self.config['password']))
-            buffer_value = connection.recv(self.SOCKET_RECV_MAX)
-            if buffer_value == '+OK\r\n':
-                return connection
-            LOGGER.error('Authentication error: %s', buffer_value[4:].strip())
-            return None
-        return connection
+        return self.exchange(connection)
 
-    def fetch_data(self, connection):
-        """Loop in and read in all the data until we have received it all.
+    def request(self):
+        """Return the INFO command, preceded by AUTH if a password is
+        configured so both are sent in one round trip. A reused persistent
+        connection is already authenticated.
 
-        :param  socket connection: The connection
-        :rtype: dict
+        :rtype: str
 
         """
-        connection.send("*0\r\ninfo\r\n")
+        command = "*0\r\ninfo\r\n"
+        if self.config.get('password') and not self.reused:
+            return ("*2\r\n$4\r\nAUTH\r\n$%i\r\n%s\r\n" %
+                    (len(self.config['password']),
+                     self.config['password'])) + command
+        return command
 
-        # Read in the first line $1437
-        buffer_value = connection.recv(self.SOCKET_RECV_MAX)
-        lines = buffer_value.split('\r\n')
+    def split_auth_reply(self, data):
+        """Return the reply to AUTH, or None if it was not sent, and the
+        data that follows it.
 
-        if lines[0][0] == '$':
-            byte_size = int(lines[0][1:].strip())
-        else:
+        :param str data: The data received
+        :rtype: tuple(str, str)
+
+        """
+        if not self.config.get('password') or self.reused:
+            return None, data
+        reply, _sep, data = data.partition('\r\n')
+        return reply, data
+
+    def response_complete(self, data):
+        """Return True once the whole INFO bulk reply has been received
+
+        :param str data: The data received so far
+        :rtype: bool
+
+        """
+        _reply, data = self.split_auth_reply(data)
+        header, sep, body = data.partition('\r\n')
+        if not sep:
+            return False
+        if header[:1] != '$':
+            return True
+        return len(body) >= int(header[1:])
+
+    def parse_response(self, data):
+        """Parse the INFO reply into a dict of stats
+
+        :param str data: The data received
+        :rtype: dict
+
+        """
+        reply, data = self.split_auth_reply(data)
+        if reply is not None and reply != '+OK':
+            LOGGER.error('Authentication error: %s', reply[4:].strip())
             return None
 
-        while len(buffer_value) < byte_size:
-            buffer_value += connection.recv(self.SOCKET_RECV_MAX)
+        lines = data.split('\r\n')
+        if lines[0][:1] != '$':
+            return None
 
-        lines = buffer_value.split('\r\n')
         values = dict()
         for line in lines:
             if ':' in line:
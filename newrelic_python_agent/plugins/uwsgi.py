@@ -13,6 +13,7 @@ LOGGER = logging.getLogger(__name__)
 
 class uWSGI(base.SocketStatsPlugin):
 
+    ASYNC = True
     GUID = 'com.meetme.newrelic_uwsgi_agent'
 
     DEFAULT_HOST = 'localhost'
@@ -93,7 +94,15 @@ class uWSGI(base.SocketStatsPlugin):
         :return: dict
 
         """
-        data = super(uWSGI, self).fetch_data(connection, read_till_empty=True)
+        return self.exchange(connection)
+
+    def parse_response(self, data):
+        """Parse the stats JSON, read until the connection was closed
+
+        :param str data: The data received
+        :rtype: dict
+
+        """
         if data:
             data = re.sub(r'"HTTP_COOKIE=[^"]*"', '""', data)
             return json.loads(data)
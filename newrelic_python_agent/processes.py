@@ -0,0 +1,113 @@
+"""
+Process pool execution
+
+Plugins that spend most of a poll parsing, such as Elasticsearch node stats,
+RabbitMQ queue lists and uWSGI stats, can be polled in a pool of worker
+processes so parsing large payloads does not contend for the GIL with the
+scheduler, the uploader and the other polls.
+
+A poll is sent to a worker along with the derive history of its instance
+and returns the updated history with its results, so the agent remains the
+owner of all per-instance state. Results come back as a packed component,
+holding the metric payloads as rows instead of a dict per metric, which
+keeps the pickle sent between processes small.
+
+"""
+import logging
+import os
+import signal
+
+from concurrent import futures
+
+LOGGER = logging.getLogger(__name__)
+
+FIELDS = ('min', 'max', 'total', 'count', 'sum_of_squares')
+
+# signals the agent handles that are left to the agent process
+IGNORED_SIGNALS = ('SIGINT', 'SIGHUP', 'SIGUSR1', 'SIGUSR2')
+
+
+def start_pool(max_workers):
+    """Return a process pool with its workers already started.
+
+    Workers are forked straight away, before the agent starts its other
+    threads, and with the agent's signal handlers replaced so a signal sent
+    to the process group is left for the agent to act on. The agent stops
+    the workers when it shuts the pool down.
+
+    :param int max_workers: The number of worker processes
+    :rtype: concurrent.futures.ProcessPoolExecutor
+
+    """
+    handlers = dict()
+    for name in IGNORED_SIGNALS + ('SIGTERM',):
+        if hasattr(signal, name):
+            signum = getattr(signal, name)
+            handlers[signum] = signal.getsignal(signum)
+            signal.signal(signum, signal.SIG_DFL if name == 'SIGTERM'
+                          else signal.SIG_IGN)
+    try:
+        pool = futures.ProcessPoolExecutor(max_workers=max_workers)
+        list(pool.map(ready, range(max_workers)))
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    LOGGER.info('Started %i worker processes', max_workers)
+    return pool
+
+
+def ready(_offset=None):
+    """Return the id of the worker process, used to start the workers"""
+    return os.getpid()
+
+
+def poll(plugin, config, poll_interval, last_values, deadline=None):
+    """Poll a plugin instance in a worker process.
+
+    :param newrelic_python_agent.plugins.base.Plugin plugin: The plugin class
+    :param dict config: The plugin configuration
+    :param int poll_interval: How often the plugin is invoked
+    :param newrelic_python_agent.state.DeriveStore last_values: The derive
+        history of the instance
+    :param float deadline: The time by which the poll should have returned
+    :return: The packed component, the updated derive history, whether
+        the poll returned any data and the time spent in each phase
+    :rtype: tuple(tuple, DeriveStore, bool, dict)
+
+    """
+    obj = plugin(config, poll_interval, last_values)
+    obj.deadline = deadline
+    obj.poll()
+    return (pack(obj.values()), obj.derive_last_interval,
+            bool(obj.derive_values or obj.gauge_values), obj.timings)
+
+
+def pack(component):
+    """Return the component with its metrics as a tuple of names and a tuple
+    of ``FIELDS`` rows.
+
+    :param dict component: The component to pack
+    :rtype: tuple(dict, tuple, tuple)
+
+    """
+    head = dict((key, value) for key, value in component.items()
+                if key != 'metrics')
+    metrics = component.get('metrics') or dict()
+    names = tuple(metrics)
+    rows = tuple(tuple(metrics[name].get(field) for field in FIELDS)
+                 for name in names)
+    return head, names, rows
+
+
+def unpack(packed):
+    """Return the component dict for a packed component
+
+    :param tuple packed: The component returned by pack
+    :rtype: dict
+
+    """
+    head, names, rows = packed
+    component = dict(head)
+    component['metrics'] = dict((name, dict(zip(FIELDS, row)))
+                                for name, row in zip(names, rows))
+    return component
@@ -0,0 +1,257 @@
+"""
+Per-instance poll scheduling
+
+Each plugin instance is tracked as a Job with its own poll interval and next
+due time. Jobs are kept in a heap ordered by due time and are dispatched to
+an executor as they come due, so a slow instance never holds up the others.
+
+Every dispatched poll has a deadline. A poll that overruns it is flagged as
+late and the job is not dispatched again until that poll has returned, so a
+hung instance can tie up at most one worker.
+
+A job may be given a phase offset, the number of seconds into each of its
+intervals at which it is polled, counted from when the scheduler was
+created. Spreading the offsets of many instances keeps them from polling
+a shared backend at the same instant, while every instance is still polled
+once per interval, in step with the interval the agent uploads on.
+
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Job(object):
+    """A recurring poll of a single plugin instance.
+
+    :param str name: The unique instance name
+    :param callable target: The function to invoke for each poll
+    :param int interval: The number of seconds between polls
+    :param dict kwargs: The keyword arguments to invoke target with
+    :param float timeout: The number of seconds a poll may run
+    :param float offset: The number of seconds into each interval the job
+        is polled at
+
+    """
+    __slots__ = ['name', 'target', 'interval', 'kwargs', 'timeout', 'offset',
+                 'due', 'deadline', 'future', 'late', 'skipped']
+
+    def __init__(self, name, target, interval, kwargs, timeout, offset=0):
+        self.name = name
+        self.target = target
+        self.interval = interval
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.offset = offset
+        self.due = 0
+        self.deadline = None
+        self.future = None
+        self.late = 0
+        self.skipped = 0
+
+    @property
+    def running(self):
+        """Return True if a poll for this job has not returned yet
+
+        :rtype: bool
+
+        """
+        return self.future is not None and not self.future.done()
+
+
+class Scheduler(object):
+    """Dispatch jobs to an executor as they come due. The scheduler runs in
+    its own thread once started, but run_pending may also be driven by hand.
+
+    Targets are invoked with the job kwargs and a ``deadline`` keyword
+    argument, the time by which the poll should have returned.
+
+    :param concurrent.futures.Executor executor: Where polls are run
+    :param callable clock: Returns the current time in seconds
+
+    """
+    def __init__(self, executor, clock=time.time):
+        self.executor = executor
+        self.clock = clock
+        self.epoch = clock()
+        self.jobs = dict()
+        self._heap = list()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def schedule(self, name, target, interval, kwargs, timeout=None,
+                 offset=0):
+        """Add a job for the named instance, or update the existing job in
+        place so its schedule is kept. A new job is due immediately, or at
+        its next phase offset if it has one.
+
+        :param str name: The unique instance name
+        :param callable target: The function to invoke for each poll
+        :param int interval: The number of seconds between polls
+        :param dict kwargs: The keyword arguments to invoke target with
+        :param float timeout: The number of seconds a poll may run,
+            defaulting to the interval
+        :param float offset: The number of seconds into each interval the
+            job is polled at
+
+        """
+        timeout = timeout or interval
+        with self._condition:
+            job = self.jobs.get(name)
+            now = self.clock()
+            if job is None:
+                job = Job(name, target, interval, kwargs, timeout, offset)
+                job.due = self._next_due(job, now) if offset else now
+                self.jobs[name] = job
+                LOGGER.debug('Scheduled %s every %i seconds at %.1f seconds '
+                             'in', name, interval, offset)
+            else:
+                job.target, job.kwargs, job.timeout = target, kwargs, timeout
+                if job.interval == interval and job.offset == offset:
+                    return
+                LOGGER.debug('Rescheduled %s every %i seconds at %.1f '
+                             'seconds in', name, interval, offset)
+                job.interval, job.offset = interval, offset
+                if offset:
+                    job.due = self._next_due(job, now)
+                else:
+                    job.due = min(job.due, now + interval)
+            self._push(job)
+            self._condition.notify()
+
+    def unschedule(self, name):
+        """Remove the job for the named instance. A poll that is already
+        running is left to finish.
+
+        :param str name: The unique instance name
+
+        """
+        with self._condition:
+            if self.jobs.pop(name, None):
+                LOGGER.debug('Unscheduled %s', name)
+
+    def retain(self, names):
+        """Remove every job whose name is not in names.
+
+        :param names: The instance names to keep
+        :type names: dict or set
+
+        """
+        with self._condition:
+            for name in [key for key in self.jobs if key not in names]:
+                self.unschedule(name)
+
+    def run_pending(self):
+        """Dispatch all of the jobs that are due to the executor and flag the
+        running polls that have passed their deadline.
+
+        :return: The number of seconds until the next event, or None
+        :rtype: float
+
+        """
+        with self._condition:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                when, _seq, job, future = heapq.heappop(self._heap)
+                if self.jobs.get(job.name) is not job:
+                    # removed since this was pushed
+                    continue
+                if future is not None:
+                    if job.future is future and job.running:
+                        job.late += 1
+                        LOGGER.warning('%s has not returned within its %.1f '
+                                       'second deadline', job.name,
+                                       job.timeout)
+                    continue
+                if job.due != when:
+                    # superseded by a reschedule
+                    continue
+                if job.running:
+                    job.skipped += 1
+                    LOGGER.warning('%s is still polling, skipping this poll',
+                                   job.name)
+                else:
+                    self._dispatch(job, now)
+                job.due += job.interval
+                if job.due <= now:
+                    LOGGER.debug('%s fell behind, skipping missed polls',
+                                 job.name)
+                    job.due += ((now - job.due) // job.interval + 1) * \
+                        job.interval
+                self._push(job)
+            if not self._heap:
+                return None
+            return max(self._heap[0][0] - now, 0)
+
+    def start(self):
+        """Start dispatching jobs from a background thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name='Scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop dispatching jobs, waiting for the scheduler thread to exit."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _dispatch(self, job, now):
+        """Submit the job to the executor and track its deadline.
+
+        :param Job job: The job to run
+        :param float now: The current time
+
+        """
+        LOGGER.debug('Dispatching %s', job.name)
+        job.deadline = now + job.timeout
+        job.future = self.executor.submit(job.target, deadline=job.deadline,
+                                          **job.kwargs)
+        job.future.add_done_callback(self._log_failure(job.name))
+        heapq.heappush(self._heap, (job.deadline, next(self._counter), job,
+                                    job.future))
+
+    def _next_due(self, job, now):
+        """Return the first time at or after now that is the job's offset
+        into one of its intervals, counted from the scheduler's epoch.
+
+        :param Job job: The job
+        :param float now: The current time
+        :rtype: float
+
+        """
+        return now + (self.epoch + job.offset - now) % job.interval
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.due, next(self._counter), job, None))
+
+    def _run(self):
+        """Wait for the next job to come due and dispatch it, until stopped"""
+        with self._condition:
+            while self._running:
+                delay = self.run_pending()
+                self._condition.wait(delay)
+
+    @staticmethod
+    def _log_failure(name):
+        """Return a done callback that logs an exception raised by the poll
+
+        :param str name: The unique instance name
+        :rtype: callable
+
+        """
+        def callback(future):
+            if future.exception() is not None:
+                LOGGER.error('Poll for %s failed: %r', name,
+                             future.exception())
+        return callback
@@ -0,0 +1,284 @@
+"""
+Disk-backed spool for payloads that could not be uploaded
+
+Payloads are stored exactly as they would have been posted, already gzipped,
+in append-only segment files. Each record is a small header holding the time
+it was spooled, the number of metrics and the payload length, followed by the
+payload itself. A Replayer sends the oldest records back to NewRelic at a
+limited rate once the platform is reachable again, deleting each segment once
+every record in it has been sent.
+
+The spool is bounded by total size, discarding the oldest segments first, and
+by age, skipping records that have been waiting too long. Segments are left
+on disk when the agent stops and are replayed after a restart. A segment that
+was partly replayed when the agent stopped is replayed from the start, so a
+payload may be delivered more than once.
+
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!dII')
+SUFFIX = '.spool'
+
+
+class Spool(object):
+    """Append-only store of gzipped payloads, split into segment files.
+
+    :param str path: The directory to keep segment files in
+    :param int max_bytes: The most bytes to keep on disk
+    :param int max_age: The number of seconds a payload is kept for
+    :param int segment_bytes: The size at which a new segment is started
+    :param bool use_mmap: Memory-map segments when replaying them
+    :param callable clock: Returns the current time in seconds
+
+    """
+    MAX_AGE = 3600
+    MAX_BYTES = 67108864
+    SEGMENT_BYTES = 1048576
+
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE,
+                 segment_bytes=SEGMENT_BYTES, use_mmap=False, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.use_mmap = use_mmap
+        self.clock = clock
+        self.spooled = 0
+        self.replayed = 0
+        self.expired = 0
+        self.discarded = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._reader = None
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.segments = sorted(name for name in os.listdir(path)
+                               if name.endswith(SUFFIX))
+        self.size = sum(self._segment_size(name) for name in self.segments)
+        self._sequence = (int(self.segments[-1][:-len(SUFFIX)]) + 1
+                          if self.segments else 0)
+        if self.segments:
+            LOGGER.info('Found %i spooled segments (%i bytes) in %s',
+                        len(self.segments), self.size, path)
+
+    def append(self, request_body, metrics):
+        """Add a gzipped payload to the newest segment, starting a new segment
+        when it is full and discarding the oldest segments when the spool is
+        over its size limit.
+
+        :param bytes request_body: The gzipped payload
+        :param int metrics: The number of metrics in the payload
+
+        """
+        record = HEADER.pack(self.clock(), metrics, len(request_body))
+        with self._lock:
+            if self._writer is None or \
+                    self._writer.tell() >= self.segment_bytes:
+                self._rotate()
+            self._writer.write(record)
+            self._writer.write(request_body)
+            self._writer.flush()
+            self.size += len(record) + len(request_body)
+            self.spooled += 1
+            while self.size > self.max_bytes and len(self.segments) > 1:
+                self._discard(self.segments[0])
+
+    def peek(self):
+        """Return the oldest payload that has not expired without removing it
+        from the spool.
+
+        :return: The gzipped payload and its number of metrics, or None
+        :rtype: tuple(bytes, int)
+
+        """
+        with self._lock:
+            while self._reader or self.segments:
+                if self._reader is None:
+                    self._open(self.segments[0])
+                name, data, offset = self._reader
+                if offset + HEADER.size <= len(data):
+                    spooled, metrics, length = HEADER.unpack(
+                        data[offset:offset + HEADER.size])
+                    start = offset + HEADER.size
+                    if start + length <= len(data):
+                        if self.clock() - spooled <= self.max_age:
+                            return data[start:start + length], metrics
+                        self.expired += 1
+                        self._reader = name, data, start + length
+                        continue
+                if offset < len(data):
+                    LOGGER.warning('Spool segment %s is truncated', name)
+                self._remove(name)
+            return None
+
+    def commit(self):
+        """Remove the payload last returned by peek from the spool"""
+        with self._lock:
+            if self._reader is None:
+                return
+            name, data, offset = self._reader
+            _spooled, _metrics, length = HEADER.unpack(
+                data[offset:offset + HEADER.size])
+            self._reader = name, data, offset + HEADER.size + length
+            self.replayed += 1
+            if self._reader[2] >= len(data):
+                self._remove(name)
+
+    def close(self):
+        """Close the open segment files, leaving them on disk"""
+        with self._lock:
+            self._close_writer()
+            self._close_reader()
+
+    @property
+    def stats(self):
+        """Return the spool counters and its current size
+
+        :rtype: dict
+
+        """
+        return {'segments': len(self.segments),
+                'bytes': self.size,
+                'spooled': self.spooled,
+                'replayed': self.replayed,
+                'expired': self.expired,
+                'discarded': self.discarded}
+
+    def _close_reader(self):
+        if self._reader is not None:
+            data = self._reader[1]
+            if isinstance(data, mmap.mmap):
+                data.close()
+            self._reader = None
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _discard(self, name):
+        """Delete a segment that has not been replayed because the spool is
+        over its size limit.
+
+        :param str name: The segment file name
+
+        """
+        LOGGER.warning('Spool is over %i bytes, discarding segment %s',
+                       self.max_bytes, name)
+        self.discarded += 1
+        self._remove(name)
+
+    def _open(self, name):
+        """Open a segment for replay, closing it for writes first if it is
+        the newest one.
+
+        :param str name: The segment file name
+
+        """
+        if self._writer is not None and \
+                self._writer.name == os.path.join(self.path, name):
+            self._close_writer()
+        with open(os.path.join(self.path, name), 'rb') as handle:
+            if self.use_mmap and self._segment_size(name):
+                data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = handle.read()
+        self._reader = name, data, 0
+
+    def _remove(self, name):
+        """Delete a segment file
+
+        :param str name: The segment file name
+
+        """
+        if self._reader is not None and self._reader[0] == name:
+            self._close_reader()
+        if self._writer is not None and \
+                self._writer.name == os.path.join(self.path, name):
+            self._close_writer()
+        self.size -= self._segment_size(name)
+        self.segments.remove(name)
+        try:
+            os.unlink(os.path.join(self.path, name))
+        except OSError as error:
+            LOGGER.error('Could not remove spool segment %s: %s', name, error)
+
+    def _rotate(self):
+        """Close the segment being written and start a new one"""
+        self._close_writer()
+        name = '%016i%s' % (self._sequence, SUFFIX)
+        self._sequence += 1
+        self._writer = open(os.path.join(self.path, name), 'ab')
+        self.segments.append(name)
+
+    def _segment_size(self, name):
+        try:
+            return os.path.getsize(os.path.join(self.path, name))
+        except OSError:
+            return 0
+
+
+class Replayer(object):
+    """Send spooled payloads from a background thread, at most rate payloads
+    per second. When a payload can not be sent, replay pauses for
+    retry_interval seconds before the platform is tried again.
+
+    :param Spool spool: The spool to replay
+    :param callable send: Invoked as send(request_body, metrics) for each
+        payload. Returns False if the upload failed.
+    :param float rate: The most payloads to send per second
+    :param float retry_interval: The number of seconds to wait after a failure
+
+    """
+    RATE = 2
+
+    def __init__(self, spool, send, rate=RATE, retry_interval=60):
+        self.spool = spool
+        self.send = send
+        self.rate = float(rate)
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start replaying payloads from a background thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='Replayer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop replaying, waiting for a payload being sent to finish."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Send the oldest payload in the spool, until stopped"""
+        while not self._stopped.is_set():
+            payload = self.spool.peek()
+            if payload is None:
+                self._stopped.wait(self.retry_interval)
+                continue
+            try:
+                result = self.send(*payload)
+            except Exception as error:
+                result = False
+                LOGGER.exception('Error replaying payload: %s', error)
+            if result is False:
+                LOGGER.debug('Pausing replay of %i spooled segments for %i '
+                             'seconds', len(self.spool.segments),
+                             self.retry_interval)
+                self._stopped.wait(self.retry_interval)
+                continue
+            self.spool.commit()
+            self._stopped.wait(1 / self.rate)
@@ -0,0 +1,353 @@
+"""
+Compact storage for the per-series state kept between polls
+
+Each store maps interned series names to a slot in column arrays, instead of
+holding a list or tuple per series, and stamps every slot with the cycle it
+was last written in. Series that have not been written for a number of
+cycles, such as metrics for a queue or database that no longer exists, can
+be evicted and their slots are reused.
+
+The derive history and config plugin results can be saved to a snapshot
+file, written atomically, and loaded when the agent starts so counters do
+not restart from zero after a restart.
+
+"""
+import array
+import json
+import logging
+import os
+import tempfile
+import time
+
+import six
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+STALE_CYCLES = 10
+
+
+class SeriesStore(object):
+    """Map series names to slots, tracking the cycle each slot was last
+    written in. Subclasses keep the values for each slot in their own
+    columns.
+
+    """
+    def __init__(self):
+        self.cycle = 0
+        self.index = dict()
+        self.seen = array.array('L')
+        self.free = list()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        """Return the names of the series in the store
+
+        :rtype: list
+
+        """
+        return list(self.index)
+
+    def advance(self):
+        """Start a new cycle. Series not written again are aged by one."""
+        self.cycle += 1
+
+    def evict(self, cycles=STALE_CYCLES):
+        """Remove every series that has not been written in the last cycles
+        cycles.
+
+        :param int cycles: The number of cycles a series is kept unwritten
+        :return: The number of series removed
+        :rtype: int
+
+        """
+        oldest = self.cycle - cycles
+        stale = [name for name, slot in six.iteritems(self.index)
+                 if self.seen[slot] < oldest]
+        for name in stale:
+            slot = self.index.pop(name)
+            self._clear(slot)
+            self.free.append(slot)
+        return len(stale)
+
+    def _slot(self, name):
+        """Return the slot for the named series, allocating one for a new
+        series, and mark it as written in the current cycle.
+
+        :param str name: The series name
+        :rtype: int
+
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            if isinstance(name, str):
+                name = six.moves.intern(name)
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = len(self.seen)
+                self.seen.append(0)
+                self._extend()
+            self.index[name] = slot
+        self.seen[slot] = self.cycle
+        return slot
+
+    def _clear(self, slot):
+        """Release the values held in a slot that is being freed"""
+        raise NotImplementedError
+
+    def _extend(self):
+        """Add a slot to the end of every column"""
+        raise NotImplementedError
+
+
+class DeriveStore(SeriesStore):
+    """The last value and timestamp of each derived metric of a plugin
+    instance, indexed like the ``[value, timestamp]`` dict it replaces.
+
+    Plugins may also keep other values in the store by name. Those are held
+    in a plain dict and are never evicted.
+
+    """
+    def __init__(self):
+        super(DeriveStore, self).__init__()
+        self.values = list()
+        self.timestamps = array.array('d')
+        self.extra = dict()
+
+    def __contains__(self, name):
+        return name in self.index or name in self.extra
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.index) + len(self.extra)
+
+    def __getitem__(self, name):
+        slot = self.index.get(name)
+        if slot is None:
+            return self.extra[name]
+        return self.values[slot], self.timestamps[slot]
+
+    def __setitem__(self, name, value):
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            self.record(name, value[0], value[1])
+        else:
+            self.extra[name] = value
+
+    def get(self, name, default=None):
+        """Return the ``(value, timestamp)`` for the named metric, or default
+
+        :param str name: The metric name
+        :param mixed default: Returned if the metric is not in the store
+
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            return self.extra.get(name, default)
+        return self.values[slot], self.timestamps[slot]
+
+    def keys(self):
+        """Return the names of the metrics and values in the store
+
+        :rtype: list
+
+        """
+        return list(self.index) + list(self.extra)
+
+    @classmethod
+    def restore(cls, series, oldest=0):
+        """Return a store holding the series from a snapshot that were read
+        at or after oldest.
+
+        :param dict series: ``[value, timestamp]`` by metric name
+        :param float oldest: The earliest timestamp to accept
+        :rtype: DeriveStore
+
+        """
+        store = cls()
+        for name, (value, timestamp) in six.iteritems(series):
+            if timestamp >= oldest:
+                store.record(name, value, timestamp)
+        return store
+
+    def snapshot(self):
+        """Return the numeric series in the store as ``[value, timestamp]``
+        by metric name. Other values plugins keep in the store are left out.
+
+        :rtype: dict
+
+        """
+        series = dict()
+        for name, slot in six.iteritems(dict(self.index)):
+            value = self.values[slot]
+            if isinstance(value, bool) or \
+                    not isinstance(value, six.integer_types + (float,)):
+                continue
+            series[name] = [value, self.timestamps[slot]]
+        return series
+
+    def record(self, name, value, timestamp):
+        """Store the value of the named metric and when it was read
+
+        :param str name: The metric name
+        :param int value: The value read
+        :param float timestamp: When the value was read
+
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            slot = self._slot(name)
+        else:
+            self.seen[slot] = self.cycle
+        self.values[slot] = value
+        self.timestamps[slot] = timestamp
+
+    def _clear(self, slot):
+        self.values[slot] = None
+
+    def _extend(self):
+        self.values.append(None)
+        self.timestamps.append(0)
+
+
+class MinMaxStore(SeriesStore):
+    """The minimum and maximum reported for each metric of a component.
+
+    :param float expires: When the component is considered gone if it is
+        not reported again
+
+    """
+    def __init__(self, expires=0):
+        super(MinMaxStore, self).__init__()
+        self.expires = expires
+        self.minimums = list()
+        self.maximums = list()
+
+    def get(self, name):
+        """Return the ``(min, max)`` for the named metric
+
+        :param str name: The metric name
+        :rtype: tuple
+
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            return None, None
+        return self.minimums[slot], self.maximums[slot]
+
+    def set(self, name, min_val, max_val):
+        """Store the minimum and maximum for the named metric
+
+        :param str name: The metric name
+        :param int min_val: The minimum value
+        :param int max_val: The maximum value
+
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            slot = self._slot(name)
+        else:
+            self.seen[slot] = self.cycle
+        self.minimums[slot] = min_val
+        self.maximums[slot] = max_val
+
+    @property
+    def expired(self):
+        """Return True if the component has not been reported in time
+
+        :rtype: bool
+
+        """
+        return self.expires < time.time()
+
+    def _clear(self, slot):
+        self.minimums[slot] = None
+        self.maximums[slot] = None
+
+    def _extend(self):
+        self.minimums.append(None)
+        self.maximums.append(None)
+
+
+def load_snapshot(path, max_age):
+    """Return the derive history and config plugin results saved in the
+    snapshot at path. A snapshot or series older than max_age seconds is
+    ignored.
+
+    :param str path: The snapshot file
+    :param int max_age: The oldest snapshot or series to accept, in seconds
+    :return: The DeriveStore and config plugin result by instance name
+    :rtype: tuple(dict, dict)
+
+    """
+    if not os.path.exists(path):
+        LOGGER.info('No state snapshot found at %s', path)
+        return dict(), dict()
+    try:
+        with open(path) as handle:
+            snapshot = json.load(handle)
+    except (IOError, OSError, ValueError) as error:
+        LOGGER.warning('Could not load state snapshot %s: %s', path, error)
+        return dict(), dict()
+    if not isinstance(snapshot, dict) or \
+            snapshot.get('version') != SNAPSHOT_VERSION:
+        LOGGER.warning('Ignoring state snapshot %s of unknown version', path)
+        return dict(), dict()
+    oldest = time.time() - max_age
+    if snapshot.get('timestamp', 0) < oldest:
+        LOGGER.warning('Ignoring state snapshot %s taken %i seconds ago', path,
+                       time.time() - snapshot.get('timestamp', 0))
+        return dict(), dict()
+    try:
+        derive_last_interval = dict(
+            (name, DeriveStore.restore(series, oldest)) for name, series in
+            six.iteritems(snapshot.get('derive') or dict()))
+    except (AttributeError, TypeError, ValueError) as error:
+        LOGGER.warning('Ignoring malformed state snapshot %s: %s', path, error)
+        return dict(), dict()
+    LOGGER.info('Loaded state snapshot %s for %i instances', path,
+                len(derive_last_interval))
+    return derive_last_interval, snapshot.get('config') or dict()
+
+
+def save_snapshot(path, derive_last_interval, config_last_result):
+    """Write the derive history and config plugin results to path. The
+    snapshot is written to a temporary file that is renamed over path, so a
+    reader never sees a partial snapshot.
+
+    :param str path: The snapshot file
+    :param dict derive_last_interval: The DeriveStore by instance name
+    :param dict config_last_result: The config plugin result by instance name
+
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'timestamp': time.time(),
+        'derive': dict((name, store.snapshot()) for name, store in
+                       six.iteritems(dict(derive_last_interval))),
+        'config': dict(config_last_result)}
+    directory = os.path.dirname(os.path.abspath(path))
+    handle = tempfile.NamedTemporaryFile('w', dir=directory, delete=False,
+                                         prefix='.%s.' % os.path.basename(path))
+    try:
+        with handle:
+            json.dump(snapshot, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.rename(handle.name, path)
+    except Exception:
+        if os.path.exists(handle.name):
+            os.unlink(handle.name)
+        raise
+    LOGGER.debug('Saved state snapshot %s for %i instances', path,
+                 len(snapshot['derive']))
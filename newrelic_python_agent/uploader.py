@@ -0,0 +1,126 @@
+"""
+Background upload of payloads to the NewRelic platform
+
+Payloads are handed to the Uploader on a bounded queue and sent from
+dedicated threads, so a slow platform endpoint does not delay the agent's
+wake interval. With more than one thread, the payloads of a cycle are sent
+in parallel. When the queue is full the oldest payload is dropped to make
+room for the newest one.
+
+"""
+import logging
+import sys
+import threading
+
+is_py2 = sys.version[0] == '2'
+if is_py2:
+    import Queue as queue
+else:
+    import queue as queue
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Uploader(object):
+    """Send payloads from background threads.
+
+    :param callable send: Invoked as send(components, metrics) for each
+        payload, from an uploader thread. Returns True if the payload was
+        sent, False if the upload failed and None if it was not attempted.
+    :param int max_size: The maximum number of payloads waiting to be sent
+    :param int concurrency: The number of payloads sent at the same time
+
+    """
+    CONCURRENCY = 4
+    QUEUE_SIZE = 100
+
+    def __init__(self, send, max_size=QUEUE_SIZE, concurrency=CONCURRENCY):
+        self.send = send
+        self.concurrency = max(concurrency, 1)
+        self.queue = queue.Queue(max_size)
+        self.queued = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._threads = list()
+
+    def put(self, components, metrics):
+        """Queue a payload for upload without blocking, dropping the oldest
+        payload waiting to be sent if the queue is full.
+
+        :param list components: The components to send
+        :param int metrics: The number of metrics in the components
+
+        """
+        with self._lock:
+            while True:
+                try:
+                    self.queue.put_nowait((components, metrics))
+                    break
+                except queue.Full:
+                    try:
+                        _components, dropped = self.queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    self.queue.task_done()
+                    self.dropped += 1
+                    LOGGER.warning('Upload queue is full, dropped the oldest '
+                                   'payload of %i metrics', dropped)
+            self.queued += 1
+
+    def start(self):
+        """Start sending payloads from background threads."""
+        for offset in range(self.concurrency):
+            thread = threading.Thread(target=self._run,
+                                      name='Uploader-%i' % offset)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Send every payload that is still queued and stop the threads."""
+        if not self._threads:
+            return
+        LOGGER.info('Draining %i queued payloads', self.queue.qsize())
+        for _thread in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = list()
+
+    @property
+    def stats(self):
+        """Return the upload counters and the current queue depth
+
+        :rtype: dict
+
+        """
+        return {'depth': self.queue.qsize(),
+                'queued': self.queued,
+                'sent': self.sent,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'dropped': self.dropped}
+
+    def _run(self):
+        """Send payloads as they are queued until the stop marker is seen"""
+        while True:
+            payload = self.queue.get()
+            try:
+                if payload is None:
+                    return
+                result = self.send(*payload)
+            except Exception as error:
+                result = False
+                LOGGER.exception('Error sending payload: %s', error)
+            finally:
+                self.queue.task_done()
+            with self._lock:
+                if result is False:
+                    self.failed += 1
+                elif result is None:
+                    self.skipped += 1
+                else:
+                    self.sent += 1
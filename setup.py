@@ -15,12 +15,16 @@ console_scripts = ['newrelic-python-agent=newrelic_python_agent.agent:main']
 install_requires = ['helper>=2.2.2', 'requests>=2.0.0', 'six>=1.5']
 tests_require = []
 extras_require = {'mongodb': ['pymongo'],
+                  'numpy': ['numpy'],
                   'pgbouncer': ['psycopg2'],
                   'postgresql': ['psycopg2']}
 
 if sys.version_info < (2, 7, 0):
     install_requires.append('importlib')
 
+if sys.version_info < (3, 0, 0):
+    install_requires.append('futures')
+
 setup(name='newrelic_python_agent',
       version='1.3.0',
       description='Python based agent for collecting metrics for NewRelic',